@@ -0,0 +1,229 @@
+/*********************************************
+ * OPL 22.1.1.0 Model
+ * Author: frankp
+ * Variant of new_hcp.mod where movements exist only on the arcs that
+ * respect the time constraints, generated by processing.arc_tuple_sets.
+ * Visit times are fixed, so every big-M time constraint is decided by
+ * the data: the tight big-M of a kept arc is 0 and the constraint is
+ * dropped, the arc of a violated one is never generated.
+ *********************************************/
+
+/****************************************************************
+	CONSTANTS
+****************************************************************/
+
+int bigM = ...;
+float Cm = ...;
+float Cw = ...;
+float Cx = ...;
+float Co = ...;
+
+float sigma0 = ...;
+float sigma1 = ...;
+float omega = ...;
+
+/****************************************************************
+	END CONSTANTS
+****************************************************************/
+
+
+/****************************************************************
+	SETS AND PROPERTIES
+****************************************************************/
+
+// time slots
+int numDays = ...;											// W
+range Days = 1..numDays;
+
+// districts
+int numMunicipalities = ...;
+range Municipalities = 1..numMunicipalities;
+int municipalityLatitude[Municipalities] = ...;
+int municipalityLongitude[Municipalities] = ...;
+int commutingTime[Municipalities][Municipalities] = ...;	// a_{m_{1}m_{2}}
+
+// patients
+int numPatients = ...;										// P
+range Patients = 1..numPatients;
+int patientMunicipality[Patients] = ...;					// m_{p}
+
+// operators
+int numOperators = ...;										// O
+range Operators = 1..numOperators;
+int operatorMunicipality[Operators] = ...;					// m_{o}
+int operatorSkill[Operators] = ...;							// s_{o}
+int operatorTime[Operators] = ...;							// h_{o}
+int operatorMaxTime[Operators] = ...;						// \bar{h}_{o}
+int operatorAvailability[Operators][Days] = ...;			// r_{od}
+int operatorStartTime[Operators][Days] = ...;				// t_{od}^{1}
+int operatorEndTime[Operators][Days] = ...;					// t_{od}^{2}
+
+int previousAssignment[Patients][Operators] = ...;			// b_{po}
+
+// visits - indexed by patient and day
+int visitRequest[Patients][Days] = ...;						// r_{pd}
+int visitSkill[Patients][Days] = ...;						// s_{pd}
+int visitStartTime[Patients][Days] = ...;					// t_{pd}^{1}		
+int visitEndTime[Patients][Days] = ...;						// t_{pd}^{2}
+
+int feasiblePatients[Operators][Patients] = ...;			// F_{o}
+
+int numNodes = numPatients + numOperators;
+range Nodes = 1..numNodes;
+
+// time-compatible movements of operator o in day d, the home of o is node numPatients + o
+tuple Arc {
+	int o;
+	int d;
+	int i;
+	int j;
+}
+
+{Arc} arcs = ...;
+
+/****************************************************************
+	END SETS AND PROPERTIES
+****************************************************************/
+
+/****************************************************************
+	DECISION VARIABLES AND EXPRESSIONS
+****************************************************************/
+
+// decision variables
+dvar boolean assignment[Patients][Operators];				// x_{po}
+dvar boolean movement[arcs];								// y_{ij}^{od}
+dvar boolean visitExecution[Operators][Patients][Days];		// z_{opd}
+
+dvar int+ operatorWorkload[Operators];						// w_{o}
+dvar int+ operatorOvertime[Operators];						// q_{o}
+
+// objective function
+dexpr float objective =
+	Cm * (
+		sum(a in arcs : a.i <= numPatients && a.j <= numPatients && patientMunicipality[a.i] != patientMunicipality[a.j])(
+			commutingTime[patientMunicipality[a.i]][patientMunicipality[a.j]] * movement[a]
+		)
+	) +
+	Cw * (
+		sum(o in Operators)(
+			(sigma0 + operatorSkill[o] * sigma1) * (operatorWorkload[o] + omega * operatorOvertime[o])
+		)
+	) +
+	Cx * (
+		sum(p in Patients, d in Days)(
+			visitRequest[p][d] - sum(o in Operators) visitExecution[o][p][d]
+		)
+	) +
+	Co * (
+		sum(o in Operators, p in Patients, d in Days : visitSkill[p][d] < operatorSkill[o]) visitExecution[o][p][d]
+	);
+
+/****************************************************************
+	END DECISION VARIABLES AND EXPRESSIONS
+****************************************************************/
+
+
+/****************************************************************
+	COMPUTATION
+****************************************************************/
+
+// same settings as new_hcp.ops, which is not used when running the model alone
+execute SETTINGS {
+	cplex.tilim = 7200;
+	cplex.workmem = 15000;
+}
+
+minimize objective;
+
+subject to {
+	// each patient must be assigned to exactly one operator
+	forall (p in Patients) assignmentConstraint :
+		sum(o in Operators : feasiblePatients[o][p] == 1) assignment[p][o] == 1;
+		
+	forall (p in Patients) assignmentConsistency :
+		sum(o in Operators : feasiblePatients[o][p] == 0) assignment[p][o] == 0;
+
+	
+	// if a patient was previously assigned to an operator, the assignment must stay
+	forall (o in Operators, p in Patients : feasiblePatients[o][p] == 1) previousAssignmentConstraint :
+		assignment[p][o] >= previousAssignment[p][o];
+		
+		
+	// operators must execute requested visits
+	forall (o in Operators, p in Patients, d in Days) visitExecutionConstraint :
+		visitExecution[o][p][d] <= assignment[p][o] * visitRequest[p][d];
+	
+	
+	// no operator works more than the maximum allowed
+	forall (o in Operators) workloadComputation :
+		operatorWorkload[o] == sum(p in Patients : feasiblePatients[o][p] == 1, d in Days)
+			(visitExecution[o][p][d] * (visitEndTime[p][d] - visitStartTime[p][d]));
+	
+	forall (o in Operators) maxWorkloadConstraint :
+		operatorWorkload[o] <= operatorMaxTime[o];
+	
+	
+	// the overtime is computed in order to minimize it in the objective function	
+	forall (o in Operators) overtimeComputation :
+		operatorOvertime[o] >= operatorWorkload[o] - operatorTime[o];
+		
+	/*
+		OPERATOR MOVEMENT
+	*/
+	
+	// operators start their day from their homes and return there
+	forall(o in Operators, d in Days : operatorAvailability[o][d] == 1) homeStartConstraint :
+		sum(a in arcs : a.o == o && a.d == d && a.i == numPatients + o) movement[a] <= 1;
+		
+	forall(o in Operators, d in Days) homeEndConstraint :
+		sum(a in arcs : a.o == o && a.d == d && a.j == numPatients + o) movement[a] <= 1;
+	
+	
+	// operators that visit patients must arrive and left exactly once
+	forall (o in Operators, d in Days, p in Patients : feasiblePatients[o][p] == 1) patientArrivalConstraint :
+		sum(a in arcs : a.o == o && a.d == d && a.j == p) movement[a] == visitExecution[o][p][d];
+		
+	forall (o in Operators, d in Days, p in Patients : feasiblePatients[o][p] == 1) patientDepartureConstraint :
+		sum(a in arcs : a.o == o && a.d == d && a.i == p) movement[a] == visitExecution[o][p][d];
+	
+};
+
+/****************************************************************
+	END COMPUTATION
+****************************************************************/
+
+
+/****************************************************************
+	POSTPROCESSING
+****************************************************************/
+
+execute PRINT_VARS {
+	var gap = cplex.getMIPRelativeGap();
+	writeln("optimalityGap = ", gap);
+	writeln();
+	writeln("assignment = [");
+	for(var p in Patients){
+		writeln(assignment[p], ",")
+	}
+	writeln("]");
+	
+	writeln("operatorWorkload = ", operatorWorkload);
+	writeln();
+	
+	writeln("operatorOvertime = ", operatorOvertime);
+	writeln();
+	
+	writeln("visitExecution = [");
+	for(var o in Operators){
+		writeln("[");
+		for(var p in Patients){
+			writeln(visitExecution[o][p], ",")
+		}
+		writeln("],");
+	}
+	writeln("]");
+}
+
+/****************************************************************
+	END POSTPROCESSING
+****************************************************************/
@@ -0,0 +1,270 @@
+/*********************************************
+ * OPL 22.1.1.0 Model
+ * Author: frankp
+ * Compact variant of new_hcp.mod: visits have fixed times, so the route
+ * of an operator in a day is the chain of its executed visits ordered by
+ * start time and no movement variables are needed.
+ * The sets below are generated by processing.compact_tuple_sets.
+ *********************************************/
+
+/****************************************************************
+	CONSTANTS
+****************************************************************/
+
+int bigM = ...;
+float Cm = ...;
+float Cw = ...;
+float Cx = ...;
+float Co = ...;
+
+float sigma0 = ...;
+float sigma1 = ...;
+float omega = ...;
+
+/****************************************************************
+	END CONSTANTS
+****************************************************************/
+
+
+/****************************************************************
+	SETS AND PROPERTIES
+****************************************************************/
+
+// time slots
+int numDays = ...;											// W
+range Days = 1..numDays;
+
+// districts
+int numMunicipalities = ...;
+range Municipalities = 1..numMunicipalities;
+int municipalityLatitude[Municipalities] = ...;
+int municipalityLongitude[Municipalities] = ...;
+int commutingTime[Municipalities][Municipalities] = ...;	// a_{m_{1}m_{2}}
+
+// patients
+int numPatients = ...;										// P
+range Patients = 1..numPatients;
+int patientMunicipality[Patients] = ...;					// m_{p}
+
+// operators
+int numOperators = ...;										// O
+range Operators = 1..numOperators;
+int operatorMunicipality[Operators] = ...;					// m_{o}
+int operatorSkill[Operators] = ...;							// s_{o}
+int operatorTime[Operators] = ...;							// h_{o}
+int operatorMaxTime[Operators] = ...;						// \bar{h}_{o}
+int operatorAvailability[Operators][Days] = ...;			// r_{od}
+int operatorStartTime[Operators][Days] = ...;				// t_{od}^{1}
+int operatorEndTime[Operators][Days] = ...;					// t_{od}^{2}
+
+int previousAssignment[Patients][Operators] = ...;			// b_{po}
+
+// visits - indexed by patient and day
+int visitRequest[Patients][Days] = ...;						// r_{pd}
+int visitSkill[Patients][Days] = ...;						// s_{pd}
+int visitStartTime[Patients][Days] = ...;					// t_{pd}^{1}		
+int visitEndTime[Patients][Days] = ...;						// t_{pd}^{2}
+
+int feasiblePatients[Operators][Patients] = ...;			// F_{o}
+
+// candidate visits: feasible operator, requested visit
+tuple Visit {
+	int o;
+	int p;
+	int d;
+}
+
+{Visit} candidateVisits = ...;
+{Visit} firstVisits = ...;									// reachable from home on time
+{Visit} lastVisits = ...;									// home reachable on time after the visit
+
+// ordered pairs of candidate visits of the same operator-day
+tuple Arc {
+	int o;
+	int d;
+	int p1;
+	int p2;
+}
+
+{Arc} arcs = ...;											// p2 reachable on time after p1
+
+tuple NumberedArc {
+	int id;
+	int o;
+	int d;
+	int p1;
+	int p2;
+}
+
+{NumberedArc} conflicts = ...;								// p1 before p2, not reachable although not overlapping
+{NumberedArc} travelArcs = ...;								// arcs between different municipalities
+
+// members of the rows of a set: visits busy at the same time, and visits that may lie between p1 and p2
+// in a route (reachable from p1 and reaching p2, or only ending before p2 when the commuting times
+// break the triangle inequality)
+tuple Member {
+	int id;
+	int o;
+	int d;
+	int p;
+}
+
+{Member} cliqueMembers = ...;
+{int} cliques = {m.id | m in cliqueMembers};
+{Member} conflictBetween = ...;
+{Member} travelBetween = ...;
+
+/****************************************************************
+	END SETS AND PROPERTIES
+****************************************************************/
+
+/****************************************************************
+	DECISION VARIABLES AND EXPRESSIONS
+****************************************************************/
+
+// decision variables
+dvar boolean assignment[Patients][Operators];				// x_{po}
+dvar boolean visitExecution[Operators][Patients][Days];		// z_{opd}
+dvar float+ travel[travelArcs];								// consecutive visits of a travel arc
+
+dvar int+ operatorWorkload[Operators];						// w_{o}
+dvar int+ operatorOvertime[Operators];						// q_{o}
+
+// objective function
+dexpr float objective =
+	Cm * (
+		sum(a in travelArcs)(
+			commutingTime[patientMunicipality[a.p1]][patientMunicipality[a.p2]] * travel[a]
+		)
+	) +
+	Cw * (
+		sum(o in Operators)(
+			(sigma0 + operatorSkill[o] * sigma1) * (operatorWorkload[o] + omega * operatorOvertime[o])
+		)
+	) +
+	Cx * (
+		sum(p in Patients, d in Days)(
+			visitRequest[p][d] - sum(o in Operators) visitExecution[o][p][d]
+		)
+	) +
+	Co * (
+		sum(o in Operators, p in Patients, d in Days : visitSkill[p][d] < operatorSkill[o]) visitExecution[o][p][d]
+	);
+
+/****************************************************************
+	END DECISION VARIABLES AND EXPRESSIONS
+****************************************************************/
+
+
+/****************************************************************
+	COMPUTATION
+****************************************************************/
+
+// same settings as new_hcp.ops, which is not used when running the model alone
+execute SETTINGS {
+	cplex.tilim = 7200;
+	cplex.workmem = 15000;
+}
+
+minimize objective;
+
+subject to {
+	// each patient must be assigned to exactly one operator
+	forall (p in Patients) assignmentConstraint :
+		sum(o in Operators : feasiblePatients[o][p] == 1) assignment[p][o] == 1;
+		
+	forall (p in Patients) assignmentConsistency :
+		sum(o in Operators : feasiblePatients[o][p] == 0) assignment[p][o] == 0;
+
+	
+	// if a patient was previously assigned to an operator, the assignment must stay
+	forall (o in Operators, p in Patients : feasiblePatients[o][p] == 1) previousAssignmentConstraint :
+		assignment[p][o] >= previousAssignment[p][o];
+		
+		
+	// operators must execute requested visits
+	forall (o in Operators, p in Patients, d in Days) visitExecutionConstraint :
+		visitExecution[o][p][d] <= assignment[p][o] * visitRequest[p][d];
+	
+	
+	// no operator works more than the maximum allowed
+	forall (o in Operators) workloadComputation :
+		operatorWorkload[o] == sum(p in Patients : feasiblePatients[o][p] == 1, d in Days)
+			(visitExecution[o][p][d] * (visitEndTime[p][d] - visitStartTime[p][d]));
+	
+	forall (o in Operators) maxWorkloadConstraint :
+		operatorWorkload[o] <= operatorMaxTime[o];
+	
+	
+	// the overtime is computed in order to minimize it in the objective function	
+	forall (o in Operators) overtimeComputation :
+		operatorOvertime[o] >= operatorWorkload[o] - operatorTime[o];
+		
+	/*
+		OPERATOR ROUTES
+	*/
+	
+	// visits busy at the same time are not executed together, nor two visits that cannot follow each other
+	// without one in between
+	forall (k in cliques) cliqueConstraint :
+		sum(m in cliqueMembers : m.id == k) visitExecution[m.o][m.p][m.d] <= 1;
+	
+	forall (a in conflicts) conflictConstraint :
+		visitExecution[a.o][a.p1][a.d] + visitExecution[a.o][a.p2][a.d] -
+			sum(m in conflictBetween : m.id == a.id) visitExecution[m.o][m.p][m.d] <= 1;
+	
+	
+	// the first visit of the day must be reachable from home, the last one must allow to go back
+	forall (v in candidateVisits diff firstVisits) visitStartConstraint :
+		visitExecution[v.o][v.p][v.d] <= sum(a in arcs : a.o == v.o && a.d == v.d && a.p2 == v.p) visitExecution[v.o][a.p1][v.d];
+	
+	forall (v in candidateVisits diff lastVisits) visitEndConstraint :
+		visitExecution[v.o][v.p][v.d] <= sum(a in arcs : a.o == v.o && a.d == v.d && a.p1 == v.p) visitExecution[v.o][a.p2][v.d];
+	
+	
+	// the travel is paid when both visits are executed and none in between
+	forall (a in travelArcs) travelComputation :
+		travel[a] >= visitExecution[a.o][a.p1][a.d] + visitExecution[a.o][a.p2][a.d] - 1 -
+			sum(m in travelBetween : m.id == a.id) visitExecution[m.o][m.p][m.d];
+	
+};
+
+/****************************************************************
+	END COMPUTATION
+****************************************************************/
+
+
+/****************************************************************
+	POSTPROCESSING
+****************************************************************/
+
+execute PRINT_VARS {
+	var gap = cplex.getMIPRelativeGap();
+	writeln("optimalityGap = ", gap);
+	writeln();
+	writeln("assignment = [");
+	for(var p in Patients){
+		writeln(assignment[p], ",")
+	}
+	writeln("]");
+	
+	writeln("operatorWorkload = ", operatorWorkload);
+	writeln();
+	
+	writeln("operatorOvertime = ", operatorOvertime);
+	writeln();
+	
+	writeln("visitExecution = [");
+	for(var o in Operators){
+		writeln("[");
+		for(var p in Patients){
+			writeln(visitExecution[o][p], ",")
+		}
+		writeln("],");
+	}
+	writeln("]");
+}
+
+/****************************************************************
+	END POSTPROCESSING
+****************************************************************/
@@ -0,0 +1,87 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import maximum_bipartite_matching
+
+import src.constants as c
+import src.solver as so
+
+
+# valid lower bounds on the objective of new_hcp.mod, cheap to compute before (or while) a solver runs
+
+# visits operator o can execute: feasible assignment, requested visit, reachable from home and ending in time
+def executable(inst):
+    ct = inst['commuting_time']
+    O, P = inst['O'], inst['P']
+
+    # visitStartConstraint indexes the commuting time with patientMunicipality[o], as in the .mod
+    home_mun_in_mod = inst['pat_mun'][np.minimum(np.arange(O), P - 1)]
+    ready = inst['op_start'] + ct[inst['op_mun'], home_mun_in_mod][:, None]
+
+    return ((inst['feasible'] == 1)[:, :, None] & (inst['request'] == 1)[None, :, :]
+            & (ready[:, None, :] <= inst['start'][None, :, :]) & (inst['end'][None, :, :] <= inst['op_end'][:, None, :]))
+
+
+# every visit costs at least its cheapest execution (wage and overskill) or its non-execution (always, with no
+# operator able to execute it), and visits running at the same time need different operators: at the start of
+# every visit the visits in progress are matched with the operators able to execute them, the others are not executed
+def matching_bound(inst):
+    able = executable(inst)
+    request = inst['request'] == 1
+    start, end = inst['start'], inst['end']
+
+    wage = inst[c.C_WAGE] * (inst[c.SIGMA0] + inst['op_skill'] * inst[c.SIGMA1])
+    overskill = inst[c.C_OVERSKILL] * (inst['skill'][None, :, :] < inst['op_skill'][:, None, None])
+    execution = np.where(able, wage[:, None, None] * (end - start)[None, :, :] + overskill, np.inf).min(axis=0)
+    cost = np.minimum(inst[c.C_EXECUTION], execution)
+
+    bound = cost[request].sum()
+    for d in range(inst['D']):
+        visits = np.flatnonzero(request[:, d] & able[:, :, d].any(axis=0))
+
+        # a single instant counts for the day: the one forcing the largest cost
+        extra = 0
+        for t in np.unique(start[visits, d]):
+            active = visits[(start[visits, d] <= t) & (t < end[visits, d])]
+            if len(active) <= 1:
+                continue
+
+            matched = (maximum_bipartite_matching(csr_matrix(able[:, active, d].T), perm_type='column') >= 0).sum()
+            left_out = len(active) - matched
+            if left_out > 0:
+                extra = max(extra, np.sort(inst[c.C_EXECUTION] - cost[active, d])[:left_out].sum())
+
+        bound += extra
+
+    return float(bound)
+
+
+# LP relaxation of the assignment part with the chain rows of solver.compact_sets and no travel (it adds little
+# to the bound and most of the solve time), None if not solved in time
+def lp_bound(inst, time_limit=c.BOUND_TIME_LIMIT):
+    sets = so.compact_sets(inst)
+    model = so.SparseModel()
+    variables = so.add_assignment_variables(model, inst, sets['o_idx'], sets['p_idx'], sets['d_idx'])
+    so.add_chain_rows(model, variables['z'], sets)
+
+    res = model.solve(time_limit=time_limit, relax=True)
+    if res.status != 0:
+        return None
+
+    return float(res.fun) + model.constant
+
+
+def lower_bound(scenario=None, lp=True, time_limit=c.BOUND_TIME_LIMIT, verbose=False):
+    inst = so.load_instance(scenario)
+
+    bound = matching_bound(inst)
+    if verbose:
+        print(f"Matching bound: {round(bound, 2)}")
+
+    if lp:
+        relaxation = lp_bound(inst, time_limit)
+        if verbose:
+            print(f"LP bound: {round(relaxation, 2) if relaxation is not None else None}")
+        if relaxation is not None:
+            bound = max(bound, relaxation)
+
+    return bound
@@ -0,0 +1,223 @@
+import os
+import json
+import fcntl
+import shutil
+import hashlib
+import contextlib
+
+import src.constants as c
+import src.utilities as u
+import src.scenario as sc
+import src.solution as sl
+
+
+# solved instances, keyed by a hash of everything the solution depends on:
+# every entry is a folder with the solution, the solver log and the result (objective, gap, execution time)
+# the cache is shared by parallel processes (see src/workspace.py): entries are written aside and renamed into
+# place, so an entry folder is always complete, and they are evicted holding a lock
+RESULT_FILE = 'result.json'
+SETUP_FILE = 'setup.output'
+SOLUTION_FILE = 'output_data.npz'
+LOCK_FILE = '.lock'
+TMP_PREFIX = '.tmp-'
+
+
+def model_files(solver, formulation):
+    if solver == c.HIGHS:
+        # the HiGHS models are built in solver.py
+        return [f'{c.SRC_FOLDER}solver.py']
+    elif solver == c.HEURISTIC:
+        return [f'{c.SRC_FOLDER}heuristic.py']
+    elif solver == c.DECOMPOSITION:
+        # master rows from solver.py, routes and objective from heuristic.py
+        return [f'{c.SRC_FOLDER}decomposition.py', f'{c.SRC_FOLDER}solver.py', f'{c.SRC_FOLDER}heuristic.py']
+    elif solver == c.COLUMN_GENERATION:
+        return [f'{c.SRC_FOLDER}column_generation.py', f'{c.SRC_FOLDER}solver.py', f'{c.SRC_FOLDER}heuristic.py']
+
+    if formulation == c.COMPACT_FORMULATION:
+        return [c.COMPACT_MOD_FILE]
+    elif formulation == c.ARCS_FORMULATION:
+        return [c.ARCS_MOD_FILE]
+
+    return [c.MOD_FILE, c.OPS_FILE, c.OPL_PROJECT_FILE]
+
+
+def solver_settings(solver, deadline=None, gap_target=None):
+    if solver == c.HEURISTIC:
+        return {'time_limit': deadline if deadline is not None else c.HEURISTIC_TIME_LIMIT, 'lp_bound': c.HEURISTIC_LP_BOUND}
+    elif solver in [c.HIGHS, c.DECOMPOSITION, c.COLUMN_GENERATION]:
+        return {'time_limit': deadline if deadline is not None else c.SOLVER_TIME_LIMIT,
+                'mip_gap': gap_target if gap_target is not None else c.SOLVER_MIP_GAP}
+
+    return {'deadline': deadline, 'gap_target': gap_target}
+
+
+# hash of the merged input data (canonicalized), of the model files and of the solver settings
+def input_key(input_data, solver=c.DEF_SOLVER, formulation=c.DEF_FORMULATION, settings=None):
+    digest = hashlib.sha256()
+
+    digest.update(json.dumps(input_data, sort_keys=True, separators=(',', ':')).encode())
+    digest.update(json.dumps([solver, formulation, settings], sort_keys=True).encode())
+
+    for model_file in model_files(solver, formulation):
+        digest.update(model_file.encode())
+        if os.path.exists(model_file):
+            with open(model_file, 'rb') as file:
+                digest.update(file.read())
+
+    return digest.hexdigest()
+
+
+def current_key(solver=c.DEF_SOLVER, formulation=c.DEF_FORMULATION, settings=None):
+    input_data = sc.load_scenario(c.INPUT_JSON_PATHS).data()
+    return input_key(input_data, solver, formulation, settings)
+
+
+def entry_folder(key, cache_folder=c.CACHE_FOLDER):
+    return os.path.join(cache_folder, key)
+
+
+# stored result of key, with its solution restored in npz_path (and its log in setup_file), or None
+def lookup(key, npz_path=c.OUTPUT_NPZ, setup_file=c.SETUP_FILE, cache_folder=c.CACHE_FOLDER):
+    folder = entry_folder(key, cache_folder)
+    result_path = os.path.join(folder, RESULT_FILE)
+    if not os.path.exists(result_path) or not os.path.exists(os.path.join(folder, SOLUTION_FILE)):
+        return None
+
+    # another process may evict the entry meanwhile: then it is a miss
+    try:
+        with open(result_path, 'r') as file:
+            result = json.load(file)
+
+        sl.copy_solution(os.path.join(folder, SOLUTION_FILE), npz_path)
+        if setup_file is not None:
+            # as after a run, there is no log from an earlier one
+            if os.path.exists(os.path.join(folder, SETUP_FILE)):
+                shutil.copyfile(os.path.join(folder, SETUP_FILE), setup_file)
+            elif os.path.exists(setup_file):
+                os.remove(setup_file)
+
+        # entries are evicted from the least recently used
+        os.utime(result_path)
+    except FileNotFoundError:
+        return None
+
+    return result[c.OBJECTIVE], result[c.OPTIMALITY_GAP], result[c.EXECUTION_TIME]
+
+
+def store(key, objective, optimality_gap, exec_time, npz_path=c.OUTPUT_NPZ, setup_file=c.SETUP_FILE,
+          cache_folder=c.CACHE_FOLDER, max_bytes=c.CACHE_MAX_BYTES):
+    folder = entry_folder(key, cache_folder)
+    tmp_folder = entry_folder(f'{TMP_PREFIX}{key}-{os.getpid()}', cache_folder)
+    if os.path.exists(tmp_folder):
+        shutil.rmtree(tmp_folder)
+    os.makedirs(tmp_folder)
+
+    shutil.copyfile(npz_path, os.path.join(tmp_folder, SOLUTION_FILE))
+    if setup_file is not None and os.path.exists(setup_file):
+        shutil.copyfile(setup_file, os.path.join(tmp_folder, SETUP_FILE))
+
+    result = {c.OBJECTIVE: objective, c.OPTIMALITY_GAP: optimality_gap, c.EXECUTION_TIME: exec_time}
+    u.save_JSON(result, os.path.join(tmp_folder, RESULT_FILE))
+
+    # the complete entry replaces the old one, if any (another process may store the same key meanwhile)
+    with locked(cache_folder):
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+        os.replace(tmp_folder, folder)
+
+    evict(max_bytes, cache_folder)
+
+
+def folder_size(folder):
+    return sum(os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder))
+
+
+# exclusive lock on the cache, across processes
+@contextlib.contextmanager
+def locked(cache_folder=c.CACHE_FOLDER):
+    if not os.path.exists(cache_folder):
+        os.makedirs(cache_folder, exist_ok=True)
+
+    with open(os.path.join(cache_folder, LOCK_FILE), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+# removes the least recently used entries until the cache fits in max_bytes (entries being written are skipped)
+def evict(max_bytes=c.CACHE_MAX_BYTES, cache_folder=c.CACHE_FOLDER):
+    if not os.path.exists(cache_folder):
+        return
+
+    with locked(cache_folder):
+        entries = []
+        for key in os.listdir(cache_folder):
+            folder = entry_folder(key, cache_folder)
+            if key.startswith(TMP_PREFIX) or not os.path.isdir(folder):
+                continue
+
+            result_path = os.path.join(folder, RESULT_FILE)
+            last_use = os.path.getmtime(result_path) if os.path.exists(result_path) else 0
+            entries.append((last_use, folder, folder_size(folder)))
+
+        total = sum(size for _, _, size in entries)
+        for _, folder, size in sorted(entries):
+            if total <= max_bytes:
+                break
+
+            shutil.rmtree(folder)
+            total -= size
+
+
+# drops the entry of key, or the whole cache
+def invalidate(key=None, cache_folder=c.CACHE_FOLDER):
+    folder = entry_folder(key, cache_folder) if key is not None else cache_folder
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+
+
+# adds the solved instances archived in archive_path (e.g. sim-data/60-8-4-0-0/), as solved by the current model
+def import_archive(archive_path, solver=c.CPLEX, formulation=c.DEF_FORMULATION, settings=None, verbose=False,
+                   cache_folder=c.CACHE_FOLDER, max_bytes=c.CACHE_MAX_BYTES):
+    if settings is None:
+        settings = solver_settings(solver)
+
+    imported = 0
+    for folder, _, _ in sorted(os.walk(archive_path)):
+        input_files = [os.path.join(folder, os.path.basename(path)) for path in c.INPUT_JSON_PATHS]
+        if not all(os.path.exists(path) for path in input_files):
+            continue
+
+        npz_path = os.path.join(folder, os.path.basename(c.OUTPUT_NPZ))
+        json_path = os.path.join(folder, os.path.basename(c.OUTPUT_JSON))
+        if not os.path.exists(npz_path):
+            if not os.path.exists(json_path):
+                continue
+
+            # legacy solutions are converted aside, the archive is left as it is
+            if not os.path.exists(cache_folder):
+                os.makedirs(cache_folder)
+            npz_path = os.path.join(cache_folder, SOLUTION_FILE)
+            sl.json_to_npz(json_path, npz_path)
+
+        solution = sl.Solution(npz_path)
+        solution.refresh()
+        if c.OBJECTIVE in solution:
+            key = input_key(u.merge_JSON_files(input_files), solver, formulation, settings)
+            setup_file = os.path.join(folder, os.path.basename(c.SETUP_FILE))
+            exec_time = solution[c.EXECUTION_TIME] if c.EXECUTION_TIME in solution else None
+
+            store(key, solution[c.OBJECTIVE], solution[c.OPTIMALITY_GAP], exec_time, npz_path=npz_path,
+                  setup_file=setup_file, cache_folder=cache_folder, max_bytes=max_bytes)
+            imported += 1
+
+        if npz_path == os.path.join(cache_folder, SOLUTION_FILE):
+            os.remove(npz_path)
+
+    if verbose:
+        print(f"Imported {imported} solutions from {archive_path}")
+
+    return imported
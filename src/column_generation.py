@@ -0,0 +1,228 @@
+import time
+import math
+import numpy as np
+from bisect import bisect_right
+
+import src.constants as c
+import src.solver as so
+import src.heuristic as hr
+import src.solution as sl
+
+
+# column generation on operator-day plans: a plan is a chain of fixed-time visits, and the master chooses
+# at most one plan per operator-day, linked to the execution variables z of the assignment part
+# (assignment, workload and overtime as in the other formulations); the LP bound is computed by pricing
+# the plans with an interval dynamic program, then the master is solved as a MILP on the plans found
+
+# best chain of the visits of patients on day d for operator o when executing p is worth prize[p]:
+# its value (prizes minus travel cost) and its visits; the best predecessor of a visit is found in the visits
+# of every municipality ordered by end time, with a running maximum of their values (O(n M log n))
+def price_chain(h, o, d, patients, prize):
+    start, end, ct, pat_mun, Cm = h['start'], h['end'], h['ct'], h['pat_mun'], h['Cm']
+    ready, op_end, op_mun = h['ready'][o][d], h['op_end'][o][d], h['op_mun'][o]
+    rank = h['rank']
+
+    visits = sorted(patients, key=lambda p: rank[p][d])
+    position = {p: i for i, p in enumerate(visits)}
+
+    # visits of every municipality by end time, and the best (value, visit) among the first of them
+    ends, order, running = {}, {}, {}
+    for p in sorted(visits, key=lambda p: end[p][d]):
+        ends.setdefault(pat_mun[p], []).append(end[p][d])
+        order.setdefault(pat_mun[p], []).append(position[p])
+        running.setdefault(pat_mun[p], [])
+
+    best = []
+    previous = []
+    for i, p in enumerate(visits):
+        mun, visit_start = pat_mun[p], start[p][d]
+
+        chain_value = prize[p] if ready <= visit_start else -math.inf
+        chain_previous = -1
+        for other in ends:
+            k = bisect_right(ends[other], visit_start - ct[other][mun])
+
+            # visits ending before this one starts come before it in start order: their values are known
+            prefix = running[other]
+            while len(prefix) < k and order[other][len(prefix)] < i:
+                j = order[other][len(prefix)]
+                prefix.append(max(prefix[-1], (best[j], j)) if len(prefix) > 0 else (best[j], j))
+
+            k = min(k, len(prefix))
+            if k == 0 or prefix[k - 1][0] == -math.inf:
+                continue
+
+            candidate = prefix[k - 1][0] + prize[p] - (Cm * ct[other][mun] if other != mun else 0)
+            if candidate > chain_value:
+                chain_value = candidate
+                chain_previous = prefix[k - 1][1]
+
+        best.append(chain_value)
+        previous.append(chain_previous)
+
+    last, last_value = -1, 0
+    for i, p in enumerate(visits):
+        if best[i] > last_value and end[p][d] + ct[pat_mun[p]][op_mun] <= op_end:
+            last, last_value = i, best[i]
+
+    chain = []
+    while last >= 0:
+        chain.append(visits[last])
+        last = previous[last]
+
+    return last_value, chain[::-1]
+
+
+def chain_travel(h, chain):
+    ct, pat_mun = h['ct'], h['pat_mun']
+    return sum(ct[pat_mun[a]][pat_mun[b]] for a, b in zip(chain, chain[1:]) if pat_mun[a] != pat_mun[b])
+
+
+# master problem: assignment part, one row per operator-day (at most one plan) and one per visit (executed
+# if and only if in the chosen plan); plans are added as columns
+class Master:
+    def __init__(self, inst, h):
+        self.inst, self.h = inst, h
+        self.D = inst['D']
+
+        self.model = so.SparseModel()
+        o_idx, p_idx, d_idx = so.visit_candidates(inst)
+        self.variables = so.add_assignment_variables(self.model, inst, o_idx, p_idx, d_idx)
+
+        self.candidate_of = np.full((inst['O'], inst['P'], inst['D']), -1)
+        self.candidate_of[o_idx, p_idx, d_idx] = np.arange(len(o_idx))
+        self.candidates = [[p_idx[(o_idx == o) & (d_idx == d)].tolist() for d in range(inst['D'])] for o in range(inst['O'])]
+
+        self.plan_rows = self.model.add_rows(inst['O'] * inst['D'], [], [], 0, upper=1)
+        n = len(o_idx)
+        self.visit_rows = self.model.add_rows(n, np.arange(n), self.variables['z'], 1, lower=0, upper=0)
+
+        self.plans = []
+        self.plan_vars = np.zeros(0, dtype=int)
+        self.known = set()
+
+
+    # adds the plans not already in the master: list of (o, d, chain)
+    def add_plans(self, plans):
+        plans = [(o, d, tuple(chain)) for o, d, chain in plans if len(chain) > 0 and (o, d, tuple(chain)) not in self.known]
+        if len(plans) == 0:
+            return 0
+
+        rows, cols, coefs, costs = [], [], [], []
+        for k, (o, d, chain) in enumerate(plans):
+            self.known.add((o, d, chain))
+            rows.append(np.concatenate(([self.plan_rows[o * self.D + d]], self.visit_rows[self.candidate_of[o, list(chain), d]])))
+            cols.append(np.full(len(chain) + 1, k))
+            coefs.append(np.concatenate(([1], -np.ones(len(chain)))))
+            costs.append(self.h['Cm'] * chain_travel(self.h, chain))
+
+        indexes = self.model.add_columns(len(plans), np.concatenate(rows), np.concatenate(cols), np.concatenate(coefs), cost=np.array(costs))
+        self.plans.extend(plans)
+        self.plan_vars = np.concatenate((self.plan_vars, indexes))
+
+        return len(plans)
+
+
+    # best plan of every operator-day for the duals: plans with a negative reduced cost and the sum of the
+    # negative reduced costs, which gives the lagrangian bound (as every operator-day has at most one plan)
+    def price(self, duals):
+        plans = []
+        reduced_total = 0
+        for o, days in enumerate(self.candidates):
+            for d, patients in enumerate(days):
+                if len(patients) == 0:
+                    continue
+
+                # a plan has -1 in the rows of its visits
+                prize = dict(zip(patients, (-duals[self.visit_rows[self.candidate_of[o, patients, d]]]).tolist()))
+                value, chain = price_chain(self.h, o, d, patients, prize)
+                reduced = -duals[self.plan_rows[o * self.D + d]] - value
+                if reduced < -c.COLUMN_GENERATION_TOLERANCE:
+                    plans.append((o, d, chain))
+                    reduced_total += reduced
+
+        return plans, reduced_total
+
+
+    # assignment and plans of a master solution
+    def routes(self, x):
+        operator = np.zeros(self.inst['P'], dtype=int)
+        assigned = np.round(x[self.variables['x']]) == 1
+        operator[self.variables['ass_p'][assigned]] = self.variables['ass_o'][assigned]
+
+        routes = [[[] for _ in range(self.inst['D'])] for _ in range(self.inst['O'])]
+        for k in np.flatnonzero(np.round(x[self.plan_vars]) == 1):
+            o, d, chain = self.plans[k]
+            routes[o][d] = list(chain)
+
+        return operator.tolist(), routes
+
+
+def solve(scenario=None, time_limit=c.SOLVER_TIME_LIMIT, mip_gap=c.SOLVER_MIP_GAP, verbose=False):
+    start_time = time.time()
+    inst = so.load_instance(scenario)
+    h = hr.prepare(inst)
+    master = Master(inst, h)
+
+    # the heuristic solution gives the first plans and an upper bound
+    best = hr.solve(scenario, time_limit=min(c.HEURISTIC_TIME_LIMIT, c.COLUMN_GENERATION_WARM_START * time_limit))
+    visits = np.array(best[c.VISIT_EXEC])
+    master.add_plans([(o, d, sorted(np.flatnonzero(visits[o, :, d]).tolist(), key=lambda p: h['rank'][p][d]))
+                      for o in range(inst['O']) for d in range(inst['D'])])
+
+    # column generation on the LP relaxation, stopped early when the lagrangian bound is close to the LP value
+    # and in time to leave a share of the time limit to the integer master
+    lower_bound = h['lower_bound']
+    pricing_limit = (1 - c.COLUMN_GENERATION_INTEGER_SHARE) * time_limit
+    iteration = 0
+    while time.time() - start_time < pricing_limit:
+        iteration += 1
+        res, duals = master.model.solve_lp(time_limit=max(1, pricing_limit - (time.time() - start_time)))
+        if res.x is None:
+            if verbose:
+                print(f"Master LP not solved: {res.message}")
+            break
+
+        lp_value = float(res.fun) + master.model.constant
+        plans, reduced_total = master.price(duals)
+        lower_bound = max(lower_bound, lp_value + reduced_total)
+
+        if verbose:
+            print(f"Iteration {iteration}: LP {round(lp_value, 2)}, lower bound {round(lower_bound, 2)}, {len(plans)} plans, {round(time.time() - start_time, 2)} s")
+
+        if master.add_plans(plans) == 0 or (lp_value - lower_bound) / (1e-10 + abs(lp_value)) <= mip_gap:
+            break
+
+    # integer master on the plans found (price and branch): its bound holds only for these plans
+    remaining = time_limit - (time.time() - start_time)
+    if remaining > 0 and (best[c.OBJECTIVE] - lower_bound) / (1e-10 + abs(best[c.OBJECTIVE])) > mip_gap:
+        res = master.model.solve(time_limit=remaining, mip_gap=mip_gap)
+        if res.x is not None:
+            operator, routes = master.routes(res.x)
+            output = hr.routes_to_output(inst, h, operator, routes)
+            if output[c.OBJECTIVE] < best[c.OBJECTIVE]:
+                best = output
+
+        if verbose:
+            print(f"Integer master: {res.message}, best {best[c.OBJECTIVE]}, {round(time.time() - start_time, 2)} s")
+
+    best[c.OPTIMALITY_GAP] = max(0.0, (best[c.OBJECTIVE] - lower_bound) / (1e-10 + abs(best[c.OBJECTIVE])))
+    return best
+
+
+# same interface as processing.run
+def run(time_limit=c.SOLVER_TIME_LIMIT, mip_gap=c.SOLVER_MIP_GAP, verbose=False):
+    start_time = time.time()
+    json_data = solve(time_limit=time_limit, mip_gap=mip_gap, verbose=verbose)
+    exec_time = round(time.time() - start_time, 2)
+
+    if verbose:
+        print(f"Execution time: {exec_time} s")
+
+    json_data[c.EXECUTION_TIME] = exec_time
+    sl.save_solution(json_data)
+
+    if verbose:
+        print(f"Objective: {json_data[c.OBJECTIVE]}")
+
+    return json_data[c.OBJECTIVE], json_data[c.OPTIMALITY_GAP], exec_time
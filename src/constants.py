@@ -4,12 +4,11 @@ ARCHIVE_FOLDER = 'sim-data/'
 DATA_FOLDER = 'data/'
 MODEL_FOLDER = 'model/'
 SRC_FOLDER = 'src/'
-SCRIPTS_FOLDER = 'scripts/'
 
 DEF_ARCHIVE_FOLDER = 'prova/'
+WORKSPACE_FOLDER = 'workspaces/'
 
 # data folder
-OUTPUT_DATA = f'{DATA_FOLDER}output_data.py'
 TMP_FILE = 'tmp.output'
 SETUP_FILE = f'{MODEL_FOLDER}setup.output'
 OP_STATS_CSV = 'operator_stats.csv'
@@ -23,6 +22,7 @@ VISIT_JSON = f'{DATA_FOLDER}visits.json'
 COMM_JSON = f'{DATA_FOLDER}commuting.json'
 ASS_JSON = f'{DATA_FOLDER}assignment.json'
 OUTPUT_JSON = f'{DATA_FOLDER}output_data.json'
+OUTPUT_NPZ = f'{DATA_FOLDER}output_data.npz'
 
 INPUT_JSON_PATHS = [
     HYPERPARAMS_JSON,
@@ -34,17 +34,73 @@ INPUT_JSON_PATHS = [
     ASS_JSON
 ]
 
-# scripts folder
-OUT_TO_PY = f'{SCRIPTS_FOLDER}out_to_py.sh'
-
 # model folder
 MOD_FILE = f'{MODEL_FOLDER}new_hcp.mod'
 DAT_FILE = f'{MODEL_FOLDER}new_hcp.dat'
+COMPACT_MOD_FILE = f'{MODEL_FOLDER}compact_hcp.mod'
+COMPACT_DAT_FILE = f'{MODEL_FOLDER}compact_hcp.dat'
+ARCS_MOD_FILE = f'{MODEL_FOLDER}arcs_hcp.mod'
+ARCS_DAT_FILE = f'{MODEL_FOLDER}arcs_hcp.dat'
+OPS_FILE = f'{MODEL_FOLDER}new_hcp.ops'
+OPL_PROJECT_FILE = f'{MODEL_FOLDER}.oplproject'
 
 # OPL command
 OPLRUN = '/home/frankp/ibm/ILOG/CPLEX_Studio2211/opl/bin/x86-64_linux/oplrun'
 RUN_CONFIG = 'version-5'
-EXECUTION_COMMAND = f'{OPLRUN} -p {MODEL_FOLDER} {RUN_CONFIG} >> {TMP_FILE}'
+EXECUTION_ARGS = [OPLRUN, '-p', MODEL_FOLDER, RUN_CONFIG]
+COMPACT_EXECUTION_ARGS = [OPLRUN, COMPACT_MOD_FILE, COMPACT_DAT_FILE]
+ARCS_EXECUTION_ARGS = [OPLRUN, ARCS_MOD_FILE, ARCS_DAT_FILE]
+
+# solvers
+CPLEX = 'cplex'
+HIGHS = 'highs'
+HEURISTIC = 'heuristic'
+DECOMPOSITION = 'decomposition'
+COLUMN_GENERATION = 'column-generation'
+DEF_SOLVER = CPLEX
+
+SOLVER_TIME_LIMIT = 7200    # as tilim in new_hcp.ops
+SOLVER_MIP_GAP = 1e-4
+SOLVER_STOP_GRACE = 30       # seconds given to the solver to exit after each stop signal
+SOLVER_LINE_LIMIT = 2**24    # longest line of solver output
+
+# heuristic solver
+HEURISTIC_TIME_LIMIT = 10           # seconds
+HEURISTIC_MAX_REMOVED = 40          # patients removed by an LNS move, at most
+HEURISTIC_WORST_SAMPLE = 30         # patients evaluated by the worst removal
+HEURISTIC_TEMPERATURE = 0.02        # initial annealing temperature, as a fraction of the initial cost
+HEURISTIC_REACTION = 0.2            # speed of the adaptive weights of the LNS operators
+HEURISTIC_SCORES = [3, 2, 1]        # scores of new best, improving and accepted moves
+HEURISTIC_RESTART = 1000            # moves without a new best before going back to it
+HEURISTIC_RATE_STEPS = 8            # bisection steps on the wage rate to respect the maximum time
+HEURISTIC_CACHE_SIZE = 200000       # operator costs remembered
+HEURISTIC_LP_BOUND = False          # gap against the LP relaxation too, not only the matching bound
+HEURISTIC_BOUND_SHARE = 0.5         # fraction of the time limit given to the LP relaxation, at most
+
+# decomposition solver
+DECOMPOSITION_WORKERS = None        # processes routing the operator-days, one per thread of the workspace (or per CPU) if None
+DECOMPOSITION_WARM_START = 0.1      # fraction of the time limit given to the heuristic for the first solution
+DECOMPOSITION_MASTER_GAP = 0.25     # gap of the master problem, as a fraction of the current gap
+
+# column generation solver
+COLUMN_GENERATION_WARM_START = 0.1  # fraction of the time limit given to the heuristic for the first plans
+COLUMN_GENERATION_TOLERANCE = 1e-6  # reduced cost of the plans added to the master
+COLUMN_GENERATION_INTEGER_SHARE = 0.3   # fraction of the time limit left to the integer master
+
+# lower bounds
+BOUND_TIME_LIMIT = 60       # seconds for the LP relaxation
+USE_LOWER_BOUND = False     # compute the bound while CPLEX runs, to stop it once the incumbent is within the gap target
+
+# solver result cache
+CACHE_FOLDER = 'solver-cache/'
+CACHE_MAX_BYTES = 2**30
+CACHED_SOLVERS = [CPLEX, HIGHS]     # the deterministic ones: the others may find a better solution when run again
+
+# formulations
+FULL_FORMULATION = 'full'          # new_hcp.mod, with the movement tensor
+COMPACT_FORMULATION = 'compact'    # compact_hcp.mod, chains of fixed-time visits
+ARCS_FORMULATION = 'arcs'          # arcs_hcp.mod, new_hcp.mod on the time-compatible arcs only
+DEF_FORMULATION = FULL_FORMULATION
 
 # indexes in daily schedule
 SCH_PATIENT = 0
@@ -67,8 +123,6 @@ DEF_PAT_START_TIME = 30
 DEF_PAT_END_TIME = 810
 DEF_PAT_DAY_DURATION = DEF_PAT_END_TIME - DEF_PAT_START_TIME
 
-MAX_TRIES = 10
-
 # --------------- PARAMETER NAMES --------------- #
 
 # INPUT
@@ -135,6 +189,8 @@ VISIT_EXEC = 'visitExecution'
 OP_WORKLOAD = 'operatorWorkload'
 OP_OVERTIME = 'operatorOvertime'
 
+BINARY_OUTPUTS = [ASSIGNMENT, MOVEMENT, VISIT_EXEC]
+
 EXECUTION_TIME = 'executionTime'
 OPTIMALITY_GAP = 'optimalityGap'
 
@@ -176,8 +232,17 @@ DEF_ASS_PERC = 0
 
 # VISITS
 DEF_CARE_PLAN_DISTR = [0.2, 0.2, 0.2, 0.2, 0.2]
+# ways to split the care plan hours into visits (durations in minutes), drawn uniformly
+CARE_PLAN_VISIT_DURATIONS = {
+    1: [[60]],
+    2: [[60, 60]],
+    3: [[60, 60, 60], [90, 90]],
+    4: [[60, 60, 60, 60], [90, 90, 60], [120, 120]],
+    5: [[60, 60, 60, 60, 60], [90, 90, 60, 60], [120, 90, 90], [150, 150]]
+}
 DEF_PREMIUM_PERC = 0.15
 DEF_N_INCREASES = 0
+DEF_MAX_UNEXECUTABLE = None     # visits that no solution can execute allowed in a generated instance (no check if None)
 
 
 # --------------- END DATA GENERATION --------------- #
@@ -284,4 +349,16 @@ RANDOM = 1
 OPTIMIZER = 2
 ROBUST = 3
 
+# exogenous events (event-driven simulation)
+NEW_VISIT_EVENT = 0
+SINGLE_CANCELLATION_EVENT = 1
+ALL_CANCELLATIONS_EVENT = 2
+NEW_PATIENT_EVENT = 3
+QUIT_DAY_EVENT = 4
+LATE_ENTRY_EVENT = 5
+EARLY_EXIT_EVENT = 6
+
+PATIENT_EVENTS = [NEW_VISIT_EVENT, SINGLE_CANCELLATION_EVENT, ALL_CANCELLATIONS_EVENT]
+OPERATOR_EVENTS = [QUIT_DAY_EVENT, LATE_ENTRY_EVENT, EARLY_EXIT_EVENT]
+
 # --------------- END MESA --------------- #
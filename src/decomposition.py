@@ -0,0 +1,279 @@
+import os
+import time
+import contextlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+import src.constants as c
+import src.solver as so
+import src.heuristic as hr
+import src.solution as sl
+import src.workspace as ws
+
+
+# logic-based Benders decomposition on the chains of fixed-time visits (solver.compact_sets):
+# the master problem assigns patients, chooses the executed visits and computes workload and overtime,
+# with a lower estimate of the travel of each operator-day; the operator-day subproblems route the chosen visits
+# (in start time order, as the visit times are fixed) and return their travel as optimality cuts; the chains are
+# checked all the same (see solver.compact_sets): the visits that do not fit are dropped from the routes, and
+# no-good cuts exclude the infeasible steps from the master
+
+# data of the subproblems, set once in every worker process
+_h = None
+_candidates = None
+_triangle = None
+
+
+def init_worker(h, candidates, triangle):
+    global _h, _candidates, _triangle
+    _h, _candidates, _triangle = h, candidates, triangle
+
+
+# cut of the chain of visits on day d for operator o: theta >= sum travel * (z_a + z_b - 1 - sum z_between)
+# over its consecutive pairs in different municipalities, as terms on the candidates of the operator-day and
+# right hand side; a pair is paid when both visits are executed and none of the visits that could lie in between is
+# (reached in time from a and reaching b in time, or only the former when the commuting times break the triangle
+# inequality, as the visit following a in a route may reach b only through the others)
+def travel_cut(o, d, chain):
+    start, end, ct, pat_mun = _h['start'], _h['end'], _h['ct'], _h['pat_mun']
+
+    terms = {}
+    rhs = 0
+    for a, b in zip(chain, chain[1:]):
+        if pat_mun[a] == pat_mun[b]:
+            continue
+
+        cost = ct[pat_mun[a]][pat_mun[b]]
+        rhs -= cost
+        terms[a] = terms.get(a, 0) + cost
+        terms[b] = terms.get(b, 0) + cost
+        for k in _candidates[o][d]:
+            to_b = ct[pat_mun[k]][pat_mun[b]] if _triangle else 0
+            if end[a][d] + ct[pat_mun[a]][pat_mun[k]] <= start[k][d] and end[k][d] + to_b <= start[b][d]:
+                terms[k] = terms.get(k, 0) - cost
+
+    return terms, rhs
+
+
+# no-good cuts of the infeasible steps of the chain of operator o on day d (home to the first visit, between two
+# consecutive visits, last visit to home), as (visits, between): the visits can all be executed only together with
+# one of the candidates in between, sum z_visits - sum z_between <= len(visits) - 1
+def chain_conflicts(o, d, chain):
+    start, end, ct, pat_mun = _h['start'], _h['end'], _h['ct'], _h['pat_mun']
+    ready, op_end, op_mun = _h['ready'][o][d], _h['op_end'][o][d], _h['op_mun'][o]
+    candidates = _candidates[o][d]
+
+    conflicts = []
+    if len(chain) > 0 and ready > start[chain[0]][d]:
+        first = chain[0]
+        conflicts.append(([first], [k for k in candidates if end[k][d] <= start[first][d]]))
+
+    for a, b in zip(chain, chain[1:]):
+        if end[a][d] + ct[pat_mun[a]][pat_mun[b]] > start[b][d]:
+            conflicts.append(([a, b], [k for k in candidates if end[a][d] <= start[k][d] and end[k][d] <= start[b][d]]))
+
+    if len(chain) > 0 and end[chain[-1]][d] + ct[pat_mun[chain[-1]]][op_mun] > op_end:
+        last = chain[-1]
+        conflicts.append(([last], [k for k in candidates if end[last][d] <= start[k][d]]))
+
+    return conflicts
+
+
+# subproblem of operator o on day d: the visits executed by the master in start time order, the ones that fit
+# in a route with its travel, the cuts of the chain and of the best chain of the patients assigned to o, and the
+# no-good cuts of the chain if it is not feasible
+def route_operator_day(task):
+    o, d, executed, assigned = task
+    chain = sorted(executed, key=lambda p: _h['rank'][p][d])
+    route = hr.fit_chain(_h, o, d, chain)
+    pat_mun = _h['pat_mun']
+    travel = sum(_h['ct'][pat_mun[a]][pat_mun[b]] for a, b in zip(route, route[1:]) if pat_mun[a] != pat_mun[b])
+
+    cuts = [travel_cut(o, d, chain)]
+    best = hr.best_chain(_h, o, d, assigned, _h['wage_rate'][o])
+    if best != chain:
+        cuts.append(travel_cut(o, d, best))
+
+    return o, d, route, travel, cuts, chain_conflicts(o, d, chain) if route != chain else []
+
+
+def map_tasks(pool, tasks, workers):
+    if pool is None:
+        return [route_operator_day(task) for task in tasks]
+
+    return list(pool.map(route_operator_day, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+
+
+# adds the cuts of the subproblem results violated by the master solution x (all of them if x is None)
+def add_cuts(model, theta, z, candidate_of, results, x, D):
+    n_cuts = 0
+    rows, cols, coefs, lower = [], [], [], []
+    for o, d, _, _, cuts, _ in results:
+        for terms, rhs in cuts:
+            patients = list(terms)
+            cut_cols = np.concatenate(([theta[o * D + d]], z[candidate_of[o, patients, d]]))
+            cut_coefs = np.concatenate(([1], -np.array([terms[p] for p in patients], dtype=float)))
+            if rhs < 0 and (x is None or x[cut_cols] @ cut_coefs < rhs - 1e-6):
+                rows.append(np.full(len(cut_cols), n_cuts))
+                cols.append(cut_cols)
+                coefs.append(cut_coefs)
+                lower.append(rhs)
+                n_cuts += 1
+
+    if n_cuts > 0:
+        model.add_rows(n_cuts, np.concatenate(rows), np.concatenate(cols), np.concatenate(coefs), lower=np.array(lower))
+
+    return n_cuts
+
+
+# adds the no-good cuts of the subproblem results violated by the master solution x (all of them if x is None)
+def add_conflicts(model, z, candidate_of, results, x):
+    n_cuts = 0
+    rows, cols, coefs, upper = [], [], [], []
+    for o, d, _, _, _, conflicts in results:
+        for visits, between in conflicts:
+            cut_cols = z[candidate_of[o, visits + between, d]]
+            cut_coefs = np.concatenate((np.ones(len(visits)), -np.ones(len(between))))
+            if x is None or x[cut_cols] @ cut_coefs > len(visits) - 1 + 1e-6:
+                rows.append(np.full(len(cut_cols), n_cuts))
+                cols.append(cut_cols)
+                coefs.append(cut_coefs)
+                upper.append(len(visits) - 1)
+                n_cuts += 1
+
+    if n_cuts > 0:
+        model.add_rows(n_cuts, np.concatenate(rows), np.concatenate(cols), np.concatenate(coefs), upper=np.array(upper))
+
+    return n_cuts
+
+
+# whether the executed visits of output form a feasible route on every operator-day
+def feasible_routes(h, output):
+    execution = np.array(output[c.VISIT_EXEC])
+    for o in range(h['O']):
+        for d in range(h['D']):
+            chain = sorted(np.flatnonzero(execution[o, :, d]).tolist(), key=lambda p: h['rank'][p][d])
+            if hr.fit_chain(h, o, d, chain) != chain:
+                return False
+
+    return True
+
+
+def solve(scenario=None, time_limit=c.SOLVER_TIME_LIMIT, mip_gap=c.SOLVER_MIP_GAP, workers=c.DECOMPOSITION_WORKERS, verbose=False):
+    start_time = time.time()
+    inst = so.load_instance(scenario)
+    h = hr.prepare(inst)
+    O, D = inst['O'], inst['D']
+
+    # master problem: assignment part and chain rows, with a travel variable per operator-day
+    sets = so.compact_sets(inst)
+    model = so.SparseModel()
+    variables = so.add_assignment_variables(model, inst, sets['o_idx'], sets['p_idx'], sets['d_idx'])
+    so.add_chain_rows(model, variables['z'], sets)
+    theta = model.add_variables(O * D, cost=inst[c.C_MOVEMENT], upper=np.inf, integer=False)
+
+    o_idx, p_idx, d_idx = sets['o_idx'], sets['p_idx'], sets['d_idx']
+    candidate_of = np.full((O, inst['P'], D), -1)
+    candidate_of[o_idx, p_idx, d_idx] = np.arange(len(o_idx))
+    candidates = [[p_idx[(o_idx == o) & (d_idx == d)].tolist() for d in range(D)] for o in range(O)]
+
+    # within the thread budget of the workspace, if any (see src/workspace.py)
+    if workers is None:
+        workers = ws.get_threads() or os.cpu_count()
+
+    # the pool is shut down however the loop ends
+    triangle = so.triangle_inequality(np.array(h['ct']))
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(h, candidates, triangle)) if workers > 1 else None
+    with pool if pool is not None else contextlib.nullcontext():
+        if pool is None:
+            init_worker(h, candidates, triangle)
+
+        # the heuristic solution is the first upper bound, and the cuts of its routes the first cuts
+        best = hr.solve(scenario, time_limit=min(c.HEURISTIC_TIME_LIMIT, c.DECOMPOSITION_WARM_START * time_limit))
+        lower_bound = h['lower_bound']
+        operator = np.argmax(np.array(best[c.ASSIGNMENT]), axis=1)
+        visits = np.array(best[c.VISIT_EXEC])
+        tasks = [(o, d, np.flatnonzero(visits[o, :, d]).tolist(), []) for o in range(O) for d in range(D)]
+        add_cuts(model, theta, variables['z'], candidate_of, map_tasks(pool, tasks, workers), None, D)
+
+        iteration = 0
+        tight = False
+        while time.time() - start_time < time_limit:
+            iteration += 1
+            # a looser master while the bounds are far apart, until it has no more cuts
+            gap = (best[c.OBJECTIVE] - lower_bound) / (1e-10 + abs(best[c.OBJECTIVE]))
+            master_gap = mip_gap if tight else max(mip_gap, gap * c.DECOMPOSITION_MASTER_GAP)
+            res = model.solve(time_limit=max(1, time_limit - (time.time() - start_time)), mip_gap=master_gap)
+            if res.x is None:
+                if verbose:
+                    print(f"Master problem not solved: {res.message}")
+                break
+
+            values = np.round(res.x).astype(int)
+            if res.mip_dual_bound is not None:
+                lower_bound = max(lower_bound, float(res.mip_dual_bound) + model.constant)
+
+            assigned = values[variables['x']] == 1
+            operator = np.zeros(inst['P'], dtype=int)
+            operator[variables['ass_p'][assigned]] = variables['ass_o'][assigned]
+
+            executed = values[variables['z']] == 1
+            tasks = []
+            for o in range(O):
+                for d in range(D):
+                    chosen = p_idx[executed & (o_idx == o) & (d_idx == d)].tolist()
+                    tasks.append((o, d, chosen, [p for p in candidates[o][d] if operator[p] == o]))
+
+            results = map_tasks(pool, tasks, workers)
+            n_cuts = add_cuts(model, theta, variables['z'], candidate_of, results, res.x, D)
+            n_cuts += add_conflicts(model, variables['z'], candidate_of, results, res.x)
+
+            routes = [[[] for _ in range(D)] for _ in range(O)]
+            for o, d, route, _, _, _ in results:
+                routes[o][d] = route
+
+            # upper bound: the master solution with its checked routes, or its assignment with the heuristic routes
+            for output in [hr.routes_to_output(inst, h, operator.tolist(), routes), hr.solution_to_output(inst, h, operator.tolist())]:
+                if output[c.OBJECTIVE] < best[c.OBJECTIVE]:
+                    best = output
+
+            gap = (best[c.OBJECTIVE] - lower_bound) / (1e-10 + abs(best[c.OBJECTIVE]))
+            if verbose:
+                print(f"Iteration {iteration}: lower bound {round(lower_bound, 2)}, best {best[c.OBJECTIVE]}, {n_cuts} cuts, {round(time.time() - start_time, 2)} s")
+
+            if gap <= mip_gap or (n_cuts == 0 and master_gap <= mip_gap):
+                break
+            tight = n_cuts == 0
+
+    # the gap is proven only for routes that are all feasible, and an objective below the bound means a wrong one
+    if not feasible_routes(h, best):
+        raise Exception('Decomposition incumbent not valid: infeasible routes')
+
+    gap = (best[c.OBJECTIVE] - lower_bound) / (1e-10 + abs(best[c.OBJECTIVE]))
+    if gap < -1e-6:
+        raise Exception(f'Decomposition lower bound {lower_bound} not valid for the objective {best[c.OBJECTIVE]}')
+
+    best[c.OPTIMALITY_GAP] = max(0.0, gap)
+    return best
+
+
+# same interface as processing.run
+def run(time_limit=c.SOLVER_TIME_LIMIT, mip_gap=c.SOLVER_MIP_GAP, workers=c.DECOMPOSITION_WORKERS, verbose=False):
+    start_time = time.time()
+    json_data = solve(time_limit=time_limit, mip_gap=mip_gap, workers=workers, verbose=verbose)
+    exec_time = round(time.time() - start_time, 2)
+
+    if verbose:
+        print(f"Execution time: {exec_time} s")
+
+    json_data[c.EXECUTION_TIME] = exec_time
+    sl.save_solution(json_data)
+
+    if c.OBJECTIVE in json_data:
+        if verbose:
+            print(f"Objective: {json_data[c.OBJECTIVE]}")
+        return json_data[c.OBJECTIVE], json_data[c.OPTIMALITY_GAP], exec_time
+    else:
+        if verbose:
+            print("No solution found")
+        return False, False, exec_time
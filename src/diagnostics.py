@@ -0,0 +1,132 @@
+import numpy as np
+
+import src.constants as c
+import src.solver as so
+import src.bounds as bd
+
+
+# visits that no solution can execute, found before running a solver: every count is a lower bound on the
+# visits left unexecuted, so an instance with too many of them can be rejected or repaired without solving it
+
+# fewest of durations (minutes) whose sum reaches deficit
+def visits_to_drop(durations, deficit):
+    if deficit <= 0:
+        return 0
+
+    covered = np.cumsum(np.sort(durations)[::-1])
+    return int(min(np.searchsorted(covered, deficit) + 1, len(durations)))
+
+
+# requested visits that no feasible operator can reach from home and end within its working time
+def unreachable_visits(inst, able=None):
+    if able is None:
+        able = bd.executable(inst)
+
+    p, d = np.nonzero((inst['request'] == 1) & ~able.any(axis=0))
+    return list(zip(p.tolist(), d.tolist()))
+
+
+# at every instant of the TIME_UNIT grid, the visits in progress needing skill k or more against the operators
+# with skill k or more working then (and able to execute some visit that day): rows (day, time, skill, visits,
+# operators) of the instants short of operators
+def instant_shortfalls(inst, able=None):
+    if able is None:
+        able = bd.executable(inst)
+
+    reachable = able.any(axis=0)
+    start, end, skill = inst['start'], inst['end'], inst['skill']
+    if not reachable.any():
+        return [], np.zeros(inst['D'], dtype=int)
+
+    times = np.arange(start[reachable].min(), end[reachable].max(), c.TIME_UNIT)
+    skills = np.arange(1, max(skill.max(), inst['op_skill'].max()) + 1)
+
+    # (patients x days x instants) and (operators x days x instants), counted per skill level
+    active = reachable[:, :, None] & (start[:, :, None] <= times) & (times < end[:, :, None])
+    working = able.any(axis=1)[:, :, None] & (inst['op_start'][:, :, None] <= times) & (times < inst['op_end'][:, :, None])
+    visits = np.einsum('pdt,pdk->dtk', active.astype(int), (skill[:, :, None] >= skills).astype(int))
+    operators = np.einsum('odt,ok->dtk', working.astype(int), (inst['op_skill'][:, None] >= skills).astype(int))
+
+    # by Hall's condition on the nested skill levels, the visits short of an operator at the worst level
+    short = np.maximum(visits - operators, 0)
+    d, t, k = np.nonzero(short)
+    rows = list(zip(d.tolist(), times[t].tolist(), skills[k].tolist(), visits[d, t, k].tolist(), operators[d, t, k].tolist()))
+
+    return rows, short.max(axis=(1, 2))
+
+
+# minutes of visits needing skill k or more against the working minutes of the operators with skill k or more,
+# over each day: rows (day, skill, visit minutes, operator minutes) and the fewest visits left out per day
+def daily_shortfalls(inst, able=None):
+    if able is None:
+        able = bd.executable(inst)
+
+    reachable = able.any(axis=0)
+    duration = np.where(reachable, inst['end'] - inst['start'], 0)
+    window = np.where(able.any(axis=1), np.minimum(inst['op_end'] - inst['op_start'], inst['op_max_time'][:, None]), 0)
+
+    rows = []
+    dropped = np.zeros(inst['D'], dtype=int)
+    for k in np.arange(1, max(inst['skill'].max(), inst['op_skill'].max()) + 1):
+        needed = (duration * (inst['skill'] >= k)).sum(axis=0)
+        available = (window * (inst['op_skill'] >= k)[:, None]).sum(axis=0)
+        for d in np.flatnonzero(needed > available):
+            rows.append((int(d), int(k), int(needed[d]), int(available[d])))
+            visits = reachable[:, d] & (inst['skill'][:, d] >= k)
+            dropped[d] = max(dropped[d], visits_to_drop(duration[visits, d], needed[d] - available[d]))
+
+    return rows, dropped
+
+
+# operators whose maximum time cannot cover the patients only they can serve (single feasible operator or
+# previous assignment): rows (operator, visit minutes, maximum time) and the fewest visits left out
+def max_time_shortfalls(inst, able=None):
+    if able is None:
+        able = bd.executable(inst)
+
+    feasible = inst['feasible'] == 1
+    only = ((feasible.sum(axis=0) == 1)[None, :] & feasible) | ((inst['prev_ass'].T == 1) & feasible)
+    duration = np.where(able & only[:, :, None], (inst['end'] - inst['start'])[None, :, :], 0)
+    needed = duration.sum(axis=(1, 2))
+
+    rows = []
+    dropped = 0
+    for o in np.flatnonzero(needed > inst['op_max_time']):
+        rows.append((int(o), int(needed[o]), int(inst['op_max_time'][o])))
+        dropped += visits_to_drop(duration[o][duration[o] > 0], needed[o] - inst['op_max_time'][o])
+
+    return rows, dropped
+
+
+def diagnose(scenario=None, feasible_patients=None, verbose=False):
+    inst = so.load_instance(scenario, feasible_patients)
+    able = bd.executable(inst)
+
+    no_operator = np.flatnonzero((inst['feasible'] == 1).sum(axis=0) == 0).tolist()
+    unreachable = unreachable_visits(inst, able)
+    instants, instant_dropped = instant_shortfalls(inst, able)
+    days, day_dropped = daily_shortfalls(inst, able)
+    max_time, max_time_dropped = max_time_shortfalls(inst, able)
+
+    # the three shortfalls may count the same visits: only the largest is certain
+    unexecutable = len(unreachable) + max(int(np.maximum(instant_dropped, day_dropped).sum()), max_time_dropped)
+
+    if verbose:
+        print(f"Patients with no feasible operator: {no_operator}")
+        print(f"Unreachable visits (patient, day): {unreachable}")
+        for d, t, k, n_visits, n_operators in instants:
+            print(f"Day {d}, time {t}: {n_visits} visits of skill {k} or more, {n_operators} operators")
+        for d, k, needed, available in days:
+            print(f"Day {d}: {needed} minutes of visits of skill {k} or more, {available} minutes of operators")
+        for o, needed, op_max_time in max_time:
+            print(f"Operator {o}: {needed} minutes of visits of its patients, maximum time {op_max_time}")
+        print(f"Visits that cannot be executed: {unexecutable} at least")
+
+    return {
+        'no_operator': no_operator,
+        'unreachable': unreachable,
+        'instant_shortfalls': instants,
+        'daily_shortfalls': days,
+        'max_time_shortfalls': max_time,
+        'unexecutable': unexecutable
+    }
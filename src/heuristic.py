@@ -0,0 +1,438 @@
+import time
+import math
+import numpy as np
+
+import src.constants as c
+import src.solver as so
+import src.bounds as bd
+import src.solution as sl
+
+
+# with fixed visit times the route of an operator-day is the chain of its executed visits in start time order,
+# so the cost of an operator depends only on the patients assigned to it: the best routes for them are found
+# by a dynamic program on every day, and the search moves patients between operators (construction + adaptive LNS)
+
+# data of the instance as python lists, read many times by the dynamic program
+def prepare(inst):
+    P, O, D = inst['P'], inst['O'], inst['D']
+    ct = inst['commuting_time']
+    pat_mun = inst['pat_mun']
+
+    # visitStartConstraint indexes the commuting time with patientMunicipality[o], as in the .mod
+    home_mun_in_mod = pat_mun[np.minimum(np.arange(O), P - 1)]
+    ready = inst['op_start'] + ct[inst['op_mun'], home_mun_in_mod][:, None]
+
+    feasible = inst['feasible'] == 1
+    fixed = (inst['prev_ass'].T == 1) & feasible
+    if (fixed.sum(axis=0) > 1).any() or (feasible.sum(axis=0) == 0).any():
+        raise ValueError('Instance not feasible: patients with no feasible operator or with more than one previous assignment')
+
+    request = inst['request'] == 1
+    duration = np.where(request, inst['end'] - inst['start'], 0)
+    wage_rate = inst[c.C_WAGE] * (inst[c.SIGMA0] + inst['op_skill'] * inst[c.SIGMA1])
+    overskill = inst[c.C_OVERSKILL] * (inst['skill'][None, :, :] < inst['op_skill'][:, None, None])
+
+    return {
+        'P': P, 'O': O, 'D': D,
+        'Cm': inst[c.C_MOVEMENT], 'Cx': inst[c.C_EXECUTION], 'omega': inst[c.OMEGA],
+        'ct': ct.tolist(),
+        'pat_mun': pat_mun.tolist(),
+        'op_mun': inst['op_mun'].tolist(),
+        'ready': ready.tolist(),
+        'op_end': inst['op_end'].tolist(),
+        'op_time': inst['op_time'].tolist(),
+        'op_max_time': inst['op_max_time'].tolist(),
+        'wage_rate': wage_rate.tolist(),
+        'overskill': overskill.tolist(),
+        'start': inst['start'].tolist(),
+        'end': inst['end'].tolist(),
+        'duration': duration.tolist(),
+        # requested days of each patient, patients of each day in start time order
+        'days': [np.flatnonzero(request[p]).tolist() for p in range(P)],
+        'rank': np.argsort(np.argsort(inst['start'], axis=0, kind='stable'), axis=0).tolist(),
+        'feasible_ops': [np.flatnonzero(feasible[:, p]).tolist() for p in range(P)],
+        'fixed': [int(np.flatnonzero(fixed[:, p])[0]) if fixed[:, p].any() else None for p in range(P)],
+        # every requested visit costs at least the cheapest between not executing it and its wage and overskill
+        'lower_bound': float(np.minimum(inst[c.C_EXECUTION], np.where(feasible[:, :, None],
+            wage_rate[:, None, None] * duration[None, :, :] + overskill, np.inf).min(axis=0))[request].sum())
+    }
+
+
+# best chain of the visits of patients on day d for operator o, when a minute of work costs rate:
+# the executed visits and the value of the chain (Cx saved minus wage, overskill and travel)
+def best_chain(h, o, d, patients, rate):
+    start, end, duration = h['start'], h['end'], h['duration']
+    ct, pat_mun, Cm, Cx = h['ct'], h['pat_mun'], h['Cm'], h['Cx']
+    ready, op_end, op_mun = h['ready'][o][d], h['op_end'][o][d], h['op_mun'][o]
+    overskill = h['overskill'][o]
+    rank = h['rank']
+
+    visits = sorted(patients, key=lambda p: rank[p][d])
+    best = []
+    previous = []
+    for i, p in enumerate(visits):
+        mun, visit_start = pat_mun[p], start[p][d]
+        value = Cx - rate * duration[p][d] - overskill[p][d]
+
+        chain_value = value if ready <= visit_start else -math.inf
+        chain_previous = -1
+        for j in range(i):
+            if best[j] == -math.inf:
+                continue
+
+            q = visits[j]
+            travel = ct[pat_mun[q]][mun]
+            if end[q][d] + travel <= visit_start:
+                candidate = best[j] + value - (Cm * travel if pat_mun[q] != mun else 0)
+                if candidate > chain_value:
+                    chain_value = candidate
+                    chain_previous = j
+
+        best.append(chain_value)
+        previous.append(chain_previous)
+
+    last, last_value = -1, 0
+    for i, p in enumerate(visits):
+        if best[i] > last_value and end[p][d] + ct[pat_mun[p]][op_mun] <= op_end:
+            last, last_value = i, best[i]
+
+    chain = []
+    while last >= 0:
+        chain.append(visits[last])
+        last = previous[last]
+
+    return chain[::-1]
+
+
+# visits of chain (in start time order) that operator o can execute on day d: each one reached in time from home
+# or from the previous visit kept, and home reached in time from the last one
+def fit_chain(h, o, d, chain):
+    start, end, ct, pat_mun = h['start'], h['end'], h['ct'], h['pat_mun']
+    ready, op_end, op_mun = h['ready'][o][d], h['op_end'][o][d], h['op_mun'][o]
+
+    kept = []
+    for p in chain:
+        reached = ready if len(kept) == 0 else end[kept[-1]][d] + ct[pat_mun[kept[-1]]][pat_mun[p]]
+        if reached <= start[p][d]:
+            kept.append(p)
+
+    while len(kept) > 0 and end[kept[-1]][d] + ct[pat_mun[kept[-1]]][op_mun] > op_end:
+        kept.pop()
+
+    return kept
+
+
+# routes of operator o for a minute of work costing rate: executed visits per day, workload and cost without wage
+def operator_routes(h, o, patients, rate):
+    by_day = [[] for _ in range(h['D'])]
+    for p in patients:
+        for d in h['days'][p]:
+            by_day[d].append(p)
+
+    ct, pat_mun, Cm, overskill = h['ct'], h['pat_mun'], h['Cm'], h['overskill'][o]
+    routes = []
+    workload = 0
+    cost = 0
+    for d, day_patients in enumerate(by_day):
+        chain = best_chain(h, o, d, day_patients, rate) if len(day_patients) > 0 else []
+        routes.append(chain)
+
+        for i, p in enumerate(chain):
+            workload += h['duration'][p][d]
+            cost += overskill[p][d] - h['Cx']
+            if i > 0 and pat_mun[chain[i - 1]] != pat_mun[p]:
+                cost += Cm * ct[pat_mun[chain[i - 1]]][pat_mun[p]]
+
+    return routes, workload, cost
+
+
+# cost of operator o serving patients (unexecuted visits included), with its routes
+def operator_plan(h, o, patients):
+    base = h['wage_rate'][o]
+    op_time, op_max_time = h['op_time'][o], h['op_max_time'][o]
+    requests = sum(len(h['days'][p]) for p in patients)
+
+    def total(plan):
+        routes, workload, cost = plan
+        return h['Cx'] * requests + cost + base * (workload + h['omega'] * max(0, workload - op_time))
+
+    # the overtime makes the wage convex: the routes are computed at the normal and at the overtime rate,
+    # then the rate is raised until the workload fits the maximum time (with a rate above Cx nothing is executed)
+    plans = [operator_routes(h, o, patients, base)]
+    if plans[0][1] > op_time:
+        plans.append(operator_routes(h, o, patients, base * (1 + h['omega'])))
+
+    if all(plan[1] > op_max_time for plan in plans):
+        low, high = base * (1 + h['omega']), base * (1 + h['omega']) + h['Cx'] + 1
+        for _ in range(c.HEURISTIC_RATE_STEPS):
+            rate = (low + high) / 2
+            plan = operator_routes(h, o, patients, rate)
+            if plan[1] > op_max_time:
+                low = rate
+            else:
+                high = rate
+                plans.append(plan)
+
+        if all(plan[1] > op_max_time for plan in plans):
+            plans.append(operator_routes(h, o, patients, high))
+
+    plans = [plan for plan in plans if plan[1] <= op_max_time]
+    plan = min(plans, key=total)
+
+    return total(plan), plan
+
+
+class Search:
+    def __init__(self, h, rng):
+        self.h = h
+        self.rng = rng
+
+        self.costs = {}
+        self.operator = [None] * h['P']
+        self.patients = [set() for _ in range(h['O'])]
+        self.operator_cost = [0.0] * h['O']
+        self.free = [p for p in range(h['P']) if h['fixed'][p] is None]
+
+
+    # cost of an operator for a set of patients, remembered across moves
+    def cost(self, o, patients):
+        key = (o, frozenset(patients))
+        if key not in self.costs:
+            if len(self.costs) > c.HEURISTIC_CACHE_SIZE:
+                self.costs.clear()
+            self.costs[key] = operator_plan(self.h, o, patients)[0]
+
+        return self.costs[key]
+
+
+    def total(self):
+        return sum(self.operator_cost)
+
+
+    def assign(self, p, o):
+        self.operator[p] = o
+        self.patients[o].add(p)
+        self.operator_cost[o] = self.cost(o, self.patients[o])
+
+
+    def unassign(self, p):
+        o = self.operator[p]
+        self.operator[p] = None
+        self.patients[o].discard(p)
+        self.operator_cost[o] = self.cost(o, self.patients[o])
+
+
+    def insertion_costs(self, p):
+        return [(self.cost(o, self.patients[o] | {p}) - self.operator_cost[o], o) for o in self.h['feasible_ops'][p]]
+
+
+    # patients inserted one by one where they cost less, in the given order
+    def greedy_repair(self, removed):
+        for p in removed:
+            self.assign(p, min(self.insertion_costs(p))[1])
+
+
+    # the patient with the largest difference between its best and second best operator is inserted first
+    def regret_repair(self, removed):
+        removed = list(removed)
+        while len(removed) > 0:
+            choice = None
+            for p in removed:
+                costs = sorted(self.insertion_costs(p))
+                regret = costs[1][0] - costs[0][0] if len(costs) > 1 else math.inf
+                if choice is None or regret > choice[0]:
+                    choice = (regret, p, costs[0][1])
+
+            removed.remove(choice[1])
+            self.assign(choice[1], choice[2])
+
+
+    def random_removal(self, k):
+        return [int(p) for p in self.rng.choice(self.free, size=min(k, len(self.free)), replace=False)]
+
+
+    # the free patients of an operator-day with visits, then random ones up to k
+    def operator_day_removal(self, k):
+        o = int(self.rng.integers(self.h['O']))
+        d = int(self.rng.integers(self.h['D']))
+        removed = [p for p in self.patients[o] if self.h['fixed'][p] is None and d in self.h['days'][p]]
+        removed = [int(p) for p in self.rng.permutation(removed)][:k]
+
+        others = [p for p in self.free if p not in removed]
+        if len(removed) < k and len(others) > 0:
+            removed += [int(p) for p in self.rng.choice(others, size=min(k - len(removed), len(others)), replace=False)]
+
+        return removed
+
+
+    # patients of the same municipality as a random one, first among those who share its operators
+    def related_removal(self, k):
+        seed = self.free[int(self.rng.integers(len(self.free)))]
+        mun = self.h['pat_mun'][seed]
+        seed_ops = set(self.h['feasible_ops'][seed])
+
+        def relatedness(p):
+            return (self.h['pat_mun'][p] == mun) + len(seed_ops.intersection(self.h['feasible_ops'][p])) / len(seed_ops)
+
+        candidates = sorted(self.free, key=lambda p: (-relatedness(p), self.rng.random()))
+        return candidates[:k]
+
+
+    # patients whose removal saves the most
+    def worst_removal(self, k):
+        sample = self.random_removal(min(len(self.free), c.HEURISTIC_WORST_SAMPLE))
+        savings = []
+        for p in sample:
+            o = self.operator[p]
+            savings.append((self.operator_cost[o] - self.cost(o, self.patients[o] - {p}), p))
+
+        return [p for _, p in sorted(savings, reverse=True)[:k]]
+
+
+def solve(scenario=None, time_limit=c.HEURISTIC_TIME_LIMIT, seed=None, verbose=False):
+    start_time = time.time()
+    inst = so.load_instance(scenario)
+    h = prepare(inst)
+    rng = np.random.default_rng(seed)
+
+    search = Search(h, rng)
+
+    # construction: previous assignments, then the patients with fewer feasible operators and more work first
+    for p in range(h['P']):
+        if h['fixed'][p] is not None:
+            search.assign(p, h['fixed'][p])
+
+    order = sorted(search.free, key=lambda p: (len(h['feasible_ops'][p]), -sum(h['duration'][p])))
+    search.greedy_repair(order)
+
+    current = search.total()
+    best, best_operator = current, list(search.operator)
+    if verbose:
+        print(f"Constructed solution: {round(best, 2)} in {round(time.time() - start_time, 2)} s")
+
+    destroys = [search.random_removal, search.operator_day_removal, search.related_removal, search.worst_removal]
+    repairs = [search.greedy_repair, search.regret_repair]
+    destroy_weights = np.ones(len(destroys))
+    repair_weights = np.ones(len(repairs))
+
+    max_removed = max(2, min(c.HEURISTIC_MAX_REMOVED, len(search.free) // 2))
+    initial_temperature = c.HEURISTIC_TEMPERATURE * current
+    iteration = 0
+    best_iteration = 0
+    while len(search.free) > 1 and time.time() - start_time < time_limit:
+        iteration += 1
+
+        # back to the best solution after too many moves without improving it
+        if iteration - best_iteration > c.HEURISTIC_RESTART:
+            for p in search.free:
+                search.unassign(p)
+            for p in search.free:
+                search.assign(p, best_operator[p])
+            current = best
+            best_iteration = iteration
+
+        k = int(rng.integers(2, max_removed + 1))
+        i = rng.choice(len(destroys), p=destroy_weights / destroy_weights.sum())
+        j = rng.choice(len(repairs), p=repair_weights / repair_weights.sum())
+
+        removed = destroys[i](k)
+        previous = {p: search.operator[p] for p in removed}
+        for p in removed:
+            search.unassign(p)
+
+        if repairs[j] == search.greedy_repair:
+            removed = [int(p) for p in rng.permutation(removed)]
+        repairs[j](removed)
+
+        # simulated annealing acceptance, cooling down to the end of the time budget
+        candidate = search.total()
+        temperature = initial_temperature * max(0.0, 1 - (time.time() - start_time) / time_limit)
+        if candidate < best - 1e-6:
+            score = c.HEURISTIC_SCORES[0]
+            best, best_operator = candidate, list(search.operator)
+            current = candidate
+            best_iteration = iteration
+        elif candidate < current - 1e-6:
+            score = c.HEURISTIC_SCORES[1]
+            current = candidate
+        elif temperature > 0 and rng.random() < math.exp(-(candidate - current) / temperature):
+            score = c.HEURISTIC_SCORES[2]
+            current = candidate
+        else:
+            score = 0
+            for p in removed:
+                search.unassign(p)
+            for p, o in previous.items():
+                search.assign(p, o)
+
+        destroy_weights[i] = (1 - c.HEURISTIC_REACTION) * destroy_weights[i] + c.HEURISTIC_REACTION * max(score, 0.1)
+        repair_weights[j] = (1 - c.HEURISTIC_REACTION) * repair_weights[j] + c.HEURISTIC_REACTION * max(score, 0.1)
+
+    if verbose:
+        print(f"Best solution: {round(best, 2)} after {iteration} iterations")
+
+    return solution_to_output(inst, h, best_operator)
+
+
+# solution in the same format as the other solvers (no movement, as solver.solution_to_output)
+def solution_to_output(inst, h, operator):
+    routes = [operator_plan(h, o, [p for p in range(h['P']) if operator[p] == o])[1][0] for o in range(h['O'])]
+    return routes_to_output(inst, h, operator, routes)
+
+
+# output of the assignment operator (operator of every patient) with the executed visits of routes[o][d],
+# the objective computed from them as in new_hcp.mod (no gap without a lower bound)
+def routes_to_output(inst, h, operator, routes, lower_bound=None):
+    P, O, D = h['P'], h['O'], h['D']
+    ct, pat_mun = h['ct'], h['pat_mun']
+
+    assignment = np.zeros((P, O), dtype=int)
+    assignment[np.arange(P), operator] = 1
+
+    visit_execution = np.zeros((O, P, D), dtype=int)
+    travel = 0
+    overskill = 0
+    for o in range(O):
+        for d, chain in enumerate(routes[o]):
+            visit_execution[o, chain, d] = 1
+            overskill += sum(h['overskill'][o][p][d] for p in chain)
+            travel += sum(ct[pat_mun[a]][pat_mun[b]] for a, b in zip(chain, chain[1:]) if pat_mun[a] != pat_mun[b])
+
+    workload = (visit_execution * np.array(h['duration'])[None, :, :]).sum(axis=(1, 2))
+    overtime = np.maximum(0, workload - inst['op_time'])
+    wage = np.array(h['wage_rate']) * (workload + h['omega'] * overtime)
+    unexecuted = inst['request'].sum() - visit_execution.sum()
+
+    objective = round(float(h['Cm'] * travel + wage.sum() + h['Cx'] * unexecuted + overskill), 2)
+    gap = max(0.0, (objective - lower_bound) / (1e-10 + abs(objective))) if lower_bound is not None else None
+
+    return {
+        c.OPTIMALITY_GAP: gap,
+        c.ASSIGNMENT: assignment.tolist(),
+        c.OP_WORKLOAD: workload.tolist(),
+        c.OP_OVERTIME: overtime.tolist(),
+        c.VISIT_EXEC: visit_execution.tolist(),
+        c.OBJECTIVE: objective
+    }
+
+
+# same interface as processing.run, without a MILP solver: the gap is measured against bounds.lower_bound (the
+# LP relaxation only if lp_bound), computed first within the time limit, so the search gets the time left
+def run(time_limit=c.HEURISTIC_TIME_LIMIT, seed=None, lp_bound=c.HEURISTIC_LP_BOUND, verbose=False):
+    start_time = time.time()
+    lower_bound = bd.lower_bound(lp=lp_bound, time_limit=min(c.BOUND_TIME_LIMIT, c.HEURISTIC_BOUND_SHARE * time_limit), verbose=verbose)
+    json_data = solve(time_limit=max(0, time_limit - (time.time() - start_time)), seed=seed, verbose=verbose)
+    exec_time = round(time.time() - start_time, 2)
+
+    if verbose:
+        print(f"Execution time: {exec_time} s")
+
+    json_data[c.OPTIMALITY_GAP] = max(0.0, (json_data[c.OBJECTIVE] - lower_bound) / (1e-10 + abs(json_data[c.OBJECTIVE])))
+
+    json_data[c.EXECUTION_TIME] = exec_time
+    sl.save_solution(json_data)
+
+    if verbose:
+        print(f"Objective: {json_data[c.OBJECTIVE]}")
+
+    return json_data[c.OBJECTIVE], json_data[c.OPTIMALITY_GAP], exec_time
@@ -1,95 +1,226 @@
+from contextlib import contextmanager
+
 import src.constants as c
 import src.utilities as u
+import src.scenario as sc
+import src.solution as sl
+
+
+# --------------- BATCH EDITS --------------- #
+
+# staged edits: None when no batch is open
+_batch = None
+
+
+def begin_batch():
+    global _batch
+
+    # nested batches are merged into the outer one
+    if _batch is not None:
+        _batch['depth'] += 1
+        return
+
+    _batch = {
+        'depth': 1,
+        'files': {},
+        'modified': set(),
+        'update_commuting': False,
+        'aborted': False
+    }
+
+
+def commit_batch():
+    global _batch
+
+    if _batch is None:
+        raise Exception('No batch to commit')
+
+    _batch['depth'] -= 1
+    if _batch['depth'] > 0:
+        return
+
+    staged = _batch
+    _batch = None
+
+    # a nested batch was rolled back: the edits of the whole batch are discarded
+    if staged['aborted']:
+        raise Exception('Batch with a rolled back nested batch not valid for commit, no edit written')
+
+    # every modified file is written once
+    for json_path in staged['modified']:
+        sc.write(staged['files'][json_path], json_path)
+
+    if staged['update_commuting']:
+        update_commuting_matrix()
+
+
+# a nested batch only marks the outer one as aborted: its edits stay staged (and are never written) until the
+# outermost batch ends
+def rollback_batch():
+    global _batch
+
+    if _batch is None:
+        return
+
+    _batch['aborted'] = True
+    _batch['depth'] -= 1
+    if _batch['depth'] == 0:
+        _batch = None
+
+
+# usage: with m.batch(): ... - all edits in the block are written at the end, none if an exception is raised
+# (also by a nested block, even if caught in the outer one)
+@contextmanager
+def batch():
+    begin_batch()
+    try:
+        yield
+    except BaseException:
+        rollback_batch()
+        raise
+    commit_batch()
+
+
+# data to be modified: staged copy in a batch, fresh copy otherwise (of the in-memory scenario in use, if any)
+def _load(json_path):
+    if _batch is None:
+        return sc.read(json_path)
+
+    if json_path not in _batch['files']:
+        _batch['files'][json_path] = sc.read(json_path)
+
+    return _batch['files'][json_path]
+
+
+def _save(data, json_path):
+    if _batch is None:
+        sc.write(data, json_path)
+    else:
+        _batch['modified'].add(json_path)
+
+
+# data to be read: staged edits are visible inside a batch
+def _view(json_path):
+    if _batch is not None and json_path in _batch['files']:
+        return _batch['files'][json_path]
+
+    return sc.load_scenario().data(json_path)
+
+
+# the commuting matrix only depends on the municipalities: rewrite it only if they changed
+def update_commuting_matrix():
+    if _batch is not None:
+        _batch['update_commuting'] = True
+        return False
+
+    mun_data = _view(c.MUNICIPALITY_JSON)
+    commuting_times = u.compute_commuting_matrix(mun_data[c.MUN_LATITUDE], mun_data[c.MUN_LONGITUDE])
+
+    if _view(c.COMM_JSON).get(c.COMM_TIME) == commuting_times:
+        return False
+
+    sc.write({c.COMM_TIME: commuting_times}, c.COMM_JSON)
+    return True
+
+# --------------- END BATCH EDITS --------------- #
 
 
 # --------------- GETS --------------- #
 
+# getters are views over the cached scenario (see src/scenario.py): files are parsed again only when they change
+# inside a batch they also see the staged edits
+
 # INPUT
 def get_numeric_param(parameter):
-    input_data = u.merge_JSON_files(c.INPUT_JSON_PATHS)
     if parameter in c.NUMERIC_PARAMS:
-        return input_data[parameter]
+        # same precedence as merging the input files
+        for json_path in reversed(c.INPUT_JSON_PATHS):
+            input_data = _view(json_path)
+            if parameter in input_data:
+                return input_data[parameter]
+
+        raise KeyError(parameter)
 
 
 def get_num_days():
-    hp = u.retrieve_JSON(c.HYPERPARAMS_JSON)
+    hp = _view(c.HYPERPARAMS_JSON)
     return hp[c.N_DAYS]
 
 
 def get_num_patients():
-    patient_data = u.retrieve_JSON(c.PATIENT_JSON)
+    patient_data = _view(c.PATIENT_JSON)
     return patient_data[c.N_PATIENTS]
 
 
 def get_num_operators():
-    operator_data = u.retrieve_JSON(c.OPERATOR_JSON)
+    operator_data = _view(c.OPERATOR_JSON)
     return operator_data[c.N_OPERATORS]
 
 
 def get_num_municipalities():
-    hp_data = u.retrieve_JSON(c.HYPERPARAMS_JSON)
+    hp_data = _view(c.HYPERPARAMS_JSON)
     return hp_data[c.N_MUNICIPALITIES]
 
 
 def get_patient_param(parameter, patient=None):
-    patient_data = u.retrieve_JSON(c.PATIENT_JSON)
+    patient_data = _view(c.PATIENT_JSON)
     
     if parameter in c.PAT_PARAMS:
         if patient is None:
-            return patient_data[parameter]
+            return sc.copy_value(patient_data[parameter])
         else:
-            return patient_data[parameter][patient]
+            return sc.copy_value(patient_data[parameter][patient])
 
 
 def get_operator_param(parameter, operator=None):
-    operator_data = u.retrieve_JSON(c.OPERATOR_JSON)
+    operator_data = _view(c.OPERATOR_JSON)
     
     if parameter in c.OP_PARAMS:
         if operator is None:
-            return operator_data[parameter]
+            return sc.copy_value(operator_data[parameter])
         else:
-            return operator_data[parameter][operator]
+            return sc.copy_value(operator_data[parameter][operator])
 
 
 def get_operator_daily_param(parameter, operator=None, day=None):
-    operator_data = u.retrieve_JSON(c.OPERATOR_JSON)
+    operator_data = _view(c.OPERATOR_JSON)
     
     if parameter in c.OP_DAILY_PARAMS:
         if operator is None:
-            return operator_data[parameter]
+            return sc.copy_value(operator_data[parameter])
         else:
             if day is None:
-                return operator_data[parameter][operator]
+                return sc.copy_value(operator_data[parameter][operator])
             else:
                 return operator_data[parameter][operator][day]
     
 
 def get_visit_param(parameter, patient=None, day=None):
-    visit_data = u.retrieve_JSON(c.VISIT_JSON)
+    visit_data = _view(c.VISIT_JSON)
     
     if parameter in c.VISIT_PARAMS:
         if patient is None and day is None:
-            return visit_data[parameter]
+            return sc.copy_value(visit_data[parameter])
         elif patient is None and day is not None:
             res = []
             for patient in range(get_num_patients()):
                 res.append(visit_data[parameter][patient][day])
             return res
         elif patient is not None and day is None:
-            return visit_data[parameter][patient]
+            return sc.copy_value(visit_data[parameter][patient])
         else:
             return visit_data[parameter][patient][day]
 
 
 def get_feasibility(operator=None, patient=None):
-    ass_data = u.retrieve_JSON(c.ASS_JSON)
+    ass_data = _view(c.ASS_JSON)
     feasibility = ass_data[c.FEASIBLE_PATIENTS]
 
     if operator == None and patient == None:
-        return feasibility
+        return sc.copy_value(feasibility)
     
     elif operator != None and patient == None:
-        return feasibility[operator]
+        return sc.copy_value(feasibility[operator])
     
     elif operator == None and patient != None:
         return [op_feasibility[patient] for op_feasibility in feasibility]
@@ -99,14 +230,14 @@ def get_feasibility(operator=None, patient=None):
 
 
 def get_previous_assignment(patient=None, operator=None):
-    ass_data = u.retrieve_JSON(c.ASS_JSON)
+    ass_data = _view(c.ASS_JSON)
     prev_ass = ass_data[c.PREV_ASS]
 
     if patient == None and operator == None:
-        return prev_ass
+        return sc.copy_value(prev_ass)
     
     elif patient != None and operator == None:
-        return prev_ass[patient]
+        return sc.copy_value(prev_ass[patient])
 
     elif patient == None and operator != None:
         return [pat_prev_ass[operator] for pat_prev_ass in prev_ass]
@@ -116,35 +247,35 @@ def get_previous_assignment(patient=None, operator=None):
 
 
 def get_municipality_param(parameter, municipality=None):
-    mun_data = u.retrieve_JSON(c.MUNICIPALITY_JSON)
+    mun_data = _view(c.MUNICIPALITY_JSON)
 
     if parameter in c.MUN_PARAMS:
         if municipality is None:
-            return mun_data[parameter]
+            return sc.copy_value(mun_data[parameter])
         else:
             return mun_data[parameter][municipality]
 
 
 def get_commuting_times(from_mun=None, to_mun=None):
-    comm_data = u.retrieve_JSON(c.COMM_JSON)
+    comm_data = _view(c.COMM_JSON)
     mun_distances = comm_data[c.COMM_TIME]
 
     if from_mun == None and to_mun == None:
-        return mun_distances
+        return sc.copy_value(mun_distances)
     
     elif from_mun == None and to_mun != None:
         return [d[to_mun] for d in mun_distances]
     
     elif from_mun != None and to_mun == None:
-        return mun_distances[from_mun]
-    
+        return sc.copy_value(mun_distances[from_mun])
+
     else:
         return mun_distances[from_mun][to_mun]
 
 
 # OUTPUT
 def get_objective():
-    output_data = u.retrieve_JSON(c.OUTPUT_JSON)
+    output_data = sl.load_solution()
     try:
         objective = output_data[c.OBJECTIVE]
         return objective
@@ -153,7 +284,7 @@ def get_objective():
 
 
 def get_efficiency_metrics():
-    output_data = u.retrieve_JSON(c.OUTPUT_JSON)
+    output_data = sl.load_solution()
     try:
         objective = output_data[c.OBJECTIVE]
         optimality_gap = output_data[c.OPTIMALITY_GAP]
@@ -163,83 +294,83 @@ def get_efficiency_metrics():
     
 
 def get_movement(node_1, node_2, operator=None, day=None):
-    output_data = u.retrieve_JSON(c.OUTPUT_JSON)
+    output_data = sl.load_solution()
 
     if not operator:
-        return output_data[c.MOVEMENT][node_1][node_2]
+        return output_data[c.MOVEMENT][node_1, node_2].tolist()
     elif not day:
-        return output_data[c.MOVEMENT][node_1][node_2][operator]
+        return output_data[c.MOVEMENT][node_1, node_2, operator].tolist()
     else:
-        return output_data[c.MOVEMENT][node_1][node_2][operator][day]
+        return output_data[c.MOVEMENT][node_1, node_2, operator, day].item()
 
 
 def get_assignment(patient=None, operator=None):
-    output_data = u.retrieve_JSON(c.OUTPUT_JSON)
+    output_data = sl.load_solution()
     ass = output_data[c.ASSIGNMENT]
 
     if patient == None and operator == None:
-        return ass
+        return ass.tolist()
     
     elif patient != None and operator == None:
-        return ass[patient]
+        return ass[patient].tolist()
 
     elif patient == None and operator != None:
-        return [pat_ass[operator] for pat_ass in ass]
+        return ass[:, operator].tolist()
 
     else:
-        return ass[patient][operator]
+        return ass[patient, operator].item()
 
 
 def get_visit_execution(operator=None, patient=None, day=None):
-    output_data = u.retrieve_JSON(c.OUTPUT_JSON)
+    output_data = sl.load_solution()
     visit_exec = output_data[c.VISIT_EXEC]
 
     if operator == None and patient == None:
-        return visit_exec
+        return visit_exec.tolist()
     
     elif operator != None:
         if patient == None:
-            return visit_exec[operator]
+            return visit_exec[operator].tolist()
         
         else:
             if day != None:
-                return visit_exec[operator][patient][day]
+                return visit_exec[operator, patient, day].item()
 
     else:
         if day != None:
-            return [op_visit_exec[patient][day] for op_visit_exec in visit_exec]
+            return visit_exec[:, patient, day].tolist()
         
         else:
-            return [op_visit_exec[patient] for op_visit_exec in visit_exec]
+            return visit_exec[:, patient].tolist()
 
 
 def get_operator_workload(operator=None):
-    output_data = u.retrieve_JSON(c.OUTPUT_JSON)
+    output_data = sl.load_solution()
     op_workload = output_data[c.OP_WORKLOAD]
 
     if operator == None:
-        return op_workload
+        return op_workload.tolist()
     
     else:
-        return op_workload[operator]
+        return op_workload[operator].item()
     
 
 def get_operator_overtime(operator=None):
-    output_data = u.retrieve_JSON(c.OUTPUT_JSON)
+    output_data = sl.load_solution()
     op_overtime = output_data[c.OP_OVERTIME]
 
     if operator == None:
-        return op_overtime
+        return op_overtime.tolist()
     
     else:
-        return op_overtime[operator]
+        return op_overtime[operator].item()
 
 # --------------- END GETS --------------- #
 
 # --------------- OPERATORS --------------- #
 
 def add_operator(mun, skill, time, max_time):
-    operator_data = u.retrieve_JSON(c.OPERATOR_JSON)
+    operator_data = _load(c.OPERATOR_JSON)
 
     operator_data[c.OP_MUNICIPALITY].append(mun)
     operator_data[c.OP_SKILL].append(skill)
@@ -256,40 +387,40 @@ def add_operator(mun, skill, time, max_time):
     operator_data[c.OP_START_TIME].append([c.DEF_OP_START_TIME]*n_days)
     operator_data[c.OP_END_TIME].append([c.DEF_OP_END_TIME]*n_days)
 
-    u.save_JSON(operator_data, c.OPERATOR_JSON)
+    _save(operator_data, c.OPERATOR_JSON)
 
     # change commuting matrix
-    u.generate_commuting_matrix()
+    update_commuting_matrix()
 
 
 def remove_operator(operator):
-    operator_data = u.retrieve_JSON(c.OPERATOR_JSON)
+    operator_data = _load(c.OPERATOR_JSON)
     
     for param in c.OP_PARAMS + c.OP_DAILY_PARAMS:
         operator_data[param].pop(operator)
     
     operator_data[c.N_OPERATORS] -= 1
 
-    u.save_JSON(operator_data, c.OPERATOR_JSON)
+    _save(operator_data, c.OPERATOR_JSON)
 
     # change commuting matrix
-    u.generate_commuting_matrix()
+    update_commuting_matrix()
 
 
 def set_operator_param(parameter, new_value, operator=None):
     if parameter in c.OP_PARAMS:
-        operator_data = u.retrieve_JSON(c.OPERATOR_JSON)
+        operator_data = _load(c.OPERATOR_JSON)
         
         if operator is None:
             operator_data[parameter] = new_value
         else:
             operator_data[parameter][operator] = new_value
         
-        u.save_JSON(operator_data, c.OPERATOR_JSON)
+        _save(operator_data, c.OPERATOR_JSON)
 
         # change commuting matrix
         if parameter == c.OP_MUNICIPALITY:
-            u.generate_commuting_matrix()
+            update_commuting_matrix()
     
     else:
         raise Exception(f'Parameter {parameter} not valid')
@@ -297,9 +428,9 @@ def set_operator_param(parameter, new_value, operator=None):
 
 def set_operator_daily_param(operator, parameter, day, new_value):
     if parameter in c.OP_DAILY_PARAMS:
-        operator_data = u.retrieve_JSON(c.OPERATOR_JSON)
+        operator_data = _load(c.OPERATOR_JSON)
         operator_data[parameter][operator][day] = new_value
-        u.save_JSON(operator_data, c.OPERATOR_JSON)
+        _save(operator_data, c.OPERATOR_JSON)
 
     else:
         raise Exception(f'Parameter {parameter} not valid')
@@ -309,18 +440,18 @@ def set_operator_daily_param(operator, parameter, day, new_value):
 # --------------- PATIENTS --------------- #
 
 def add_patient(mun):
-    patient_data = u.retrieve_JSON(c.PATIENT_JSON)
+    patient_data = _load(c.PATIENT_JSON)
     
     patient_data[c.PAT_MUNICIPALITY].append(mun)
     patient_data[c.N_PATIENTS] += 1
 
-    u.save_JSON(patient_data, c.PATIENT_JSON)
+    _save(patient_data, c.PATIENT_JSON)
 
     # change commuting matrix
-    u.generate_commuting_matrix()
+    update_commuting_matrix()
 
     # change visits data
-    visit_data = u.retrieve_JSON(c.VISIT_JSON)
+    visit_data = _load(c.VISIT_JSON)
     
     n_days = len(visit_data[c.VISIT_REQUEST][0])
 
@@ -328,48 +459,48 @@ def add_patient(mun):
         # default: no visits
         visit_data[param].append([0]*n_days)
     
-    u.save_JSON(visit_data, c.VISIT_JSON)
+    _save(visit_data, c.VISIT_JSON)
 
 
 def remove_patient(patient):
-    patient_data = u.retrieve_JSON(c.PATIENT_JSON)
+    patient_data = _load(c.PATIENT_JSON)
     
     for field in c.PAT_PARAMS:
         patient_data[field].pop(patient)
 
     patient_data[c.N_PATIENTS] -= 1
     
-    u.save_JSON(patient_data, c.PATIENT_JSON)
+    _save(patient_data, c.PATIENT_JSON)
 
     # change commuting matrix
-    u.generate_commuting_matrix()
+    update_commuting_matrix()
 
     # change visits data
-    visit_data = u.retrieve_JSON(c.VISIT_JSON)
+    visit_data = _load(c.VISIT_JSON)
     for field in visit_data:
         visit_data[field].pop(patient)
-    u.save_JSON(visit_data, c.VISIT_JSON)
+    _save(visit_data, c.VISIT_JSON)
 
 
 def set_patient_param(parameter, new_value, patient=None):
     if parameter in c.PAT_PARAMS:
-        patient_data = u.retrieve_JSON(c.PATIENT_JSON)
+        patient_data = _load(c.PATIENT_JSON)
         if patient is None:
             patient_data[parameter] = new_value
         else:
             patient_data[parameter][patient] = new_value
         
-        u.save_JSON(patient_data, c.PATIENT_JSON)
+        _save(patient_data, c.PATIENT_JSON)
 
         # change commuting matrix
-        u.generate_commuting_matrix()
+        update_commuting_matrix()
 
 # --------------- END PATIENTS --------------- #
 
 # --------------- VISITS --------------- #
 
 def add_visit_request(patient, day, skill, start_time, end_time):
-    visit_data = u.retrieve_JSON(c.VISIT_JSON)
+    visit_data = _load(c.VISIT_JSON)
     
     visit_data[c.VISIT_REQUEST][patient][day] = 1
 
@@ -377,11 +508,11 @@ def add_visit_request(patient, day, skill, start_time, end_time):
     visit_data[c.VISIT_START_TIME][patient][day] = start_time
     visit_data[c.VISIT_END_TIME][patient][day] = end_time
 
-    u.save_JSON(visit_data, c.VISIT_JSON)
+    _save(visit_data, c.VISIT_JSON)
 
 
 def remove_visit_request(patient, day):
-    visit_data = u.retrieve_JSON(c.VISIT_JSON)
+    visit_data = _load(c.VISIT_JSON)
     
     visit_data[c.VISIT_REQUEST][patient][day] = 0
 
@@ -389,14 +520,14 @@ def remove_visit_request(patient, day):
     for param in c.VISIT_PARAMS:
         visit_data[param][patient][day] = 0
 
-    u.save_JSON(visit_data, c.VISIT_JSON)
+    _save(visit_data, c.VISIT_JSON)
 
 
 def set_visit_param(patient, day, parameter, new_value):
     if parameter in c.VISIT_PARAMS:
-        visit_data = u.retrieve_JSON(c.VISIT_JSON)
+        visit_data = _load(c.VISIT_JSON)
         visit_data[parameter][patient][day] = new_value
-        u.save_JSON(visit_data, c.VISIT_JSON)
+        _save(visit_data, c.VISIT_JSON)
     
     else:
         raise Exception(f'Parameter {parameter} not valid')
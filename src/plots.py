@@ -1,5 +1,4 @@
 import src.constants as c
-import src.utilities as u
 
 import src.manipulation as m
 import src.stats as s
@@ -10,9 +9,8 @@ import matplotlib.pyplot as plt
 # --------------- PLOTS --------------- #
 
 def pat_op_space():
-    mun_data = u.retrieve_JSON(c.MUNICIPALITY_JSON)
-    mun_lat = mun_data[c.MUN_LATITUDE]
-    mun_lon = mun_data[c.MUN_LONGITUDE]
+    mun_lat = m.get_municipality_param(c.MUN_LATITUDE)
+    mun_lon = m.get_municipality_param(c.MUN_LONGITUDE)
 
     # get number of operators and patients living in each municipality
     mun_operators = s.municipality_operators(verbose=False)
@@ -44,9 +42,8 @@ def pat_op_space():
 
 
 def mun_space():
-    mun_data = u.retrieve_JSON(c.MUNICIPALITY_JSON)
-    mun_lat = mun_data[c.MUN_LATITUDE]
-    mun_lon = mun_data[c.MUN_LONGITUDE]
+    mun_lat = m.get_municipality_param(c.MUN_LATITUDE)
+    mun_lon = m.get_municipality_param(c.MUN_LONGITUDE)
 
     # plot each municipality as a green dot
     plt.figure(figsize=(5, 5))
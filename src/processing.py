@@ -1,13 +1,39 @@
 import os
+import re
 import json
-import time
+import numpy as np
+from itertools import repeat
 
 import src.constants as c
-import src.utilities as u
 import src.manipulation as m
+import src.solver as so
+import src.heuristic as hr
+import src.decomposition as dc
+import src.column_generation as cg
+import src.bounds as bd
+import src.solution as sl
+import src.scenario as sc
+import src.runner as rn
+import src.cache as ca
 
 
-def JSON_to_dat(dat_file, json_file=None, json_data=None):    
+# .dat sections written by the last JSON_to_dat on each file: key -> (start, end) in the file
+_dat_sections = {}
+# (source JSON, its stamp) of every parameter in the .dat files written by preprocess
+_dat_sources = {}
+
+
+def dat_stamp(dat_file):
+    stat = os.stat(dat_file)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def is_row(value):
+    return len(value) > 0 and not any(map(isinstance, value, repeat((list, np.ndarray))))
+
+
+# text of any value, as the recursive writer always did (used for what the streaming writer does not handle)
+def dat_value(value):
     def write_value(val, tabs=0, comma=False):
         write_str = ''
         if isinstance(val, list):
@@ -24,32 +50,152 @@ def JSON_to_dat(dat_file, json_file=None, json_data=None):
 
         return write_str
 
+    write_str = write_value(value.tolist() if isinstance(value, np.ndarray) else value)
+    # delete one char before the semicolon
+    if write_str[-2] == ',':
+        write_str = write_str[:-2]
+    else:
+        write_str = write_str[:-1]
+
+    # convert every "],\n\n]" to "]\n]"
+    write_str = write_str.replace('],\n\n]', ']\n]')
+    # convert every "[\n\t\t[" to "[\n\t["
+    write_str = write_str.replace('[\n\t\t[', '[\n\t[')
+
+    return write_str
+
+
+# scalars, vectors and matrices (numpy arrays too) are streamed row by row, in the same format as dat_value
+def write_dat_value(file, value):
+    if isinstance(value, np.ndarray) and value.ndim <= 2:
+        value = value.tolist()
+
+    if not isinstance(value, (list, np.ndarray)):
+        file.write(f'{value}')
+    elif is_row(value):
+        file.write('[\n\t' + ','.join(map(str, value)) + ' \n]')
+    elif len(value) > 0 and all(isinstance(row, list) and is_row(row) for row in value):
+        file.write('[\n')
+        for i, row in enumerate(value):
+            file.write('\t[\n\t\t' + ','.join(map(str, row)) + (' \n\t],\n' if i != len(value) - 1 else ' \n\t]\n'))
+        file.write(']')
+    else:
+        file.write(dat_value(value))
+
+
+# the sections in unchanged are copied from the file, if it is still the one written by the last call on it,
+# instead of being serialized again
+def JSON_to_dat(dat_file, json_file=None, json_data=None, unchanged=()):
     if json_file:
         with open(json_file, 'r') as file:
             data = json.load(file)
     else:
         data = json_data
 
-    with open(dat_file, 'w') as file:
+    path = os.path.abspath(dat_file)
+    previous = _dat_sections.pop(path, None)
+    if previous is None or not os.path.exists(dat_file) or dat_stamp(dat_file) != previous['stamp']:
+        previous = {'sections': {}}
+
+    reused = {key: previous['sections'][key] for key in unchanged if key in previous['sections']}
+
+    sections = {}
+    tmp_file = dat_file + '.tmp'
+    with open(tmp_file, 'w') as file, open(dat_file if reused else os.devnull, 'rb') as old_file:
         for key, value in data.items():
-            file.write(f'{key} = ')
-            write_str = write_value(value)
-            # delete one char before the semicolon
-            if write_str[-2] == ',':
-                write_str = write_str[:-2]
+            start = file.tell()
+
+            if key in reused:
+                old_start, old_end = reused[key]
+                old_file.seek(old_start)
+                file.write(old_file.read(old_end - old_start).decode())
             else:
-                write_str = write_str[:-1]
+                file.write(f'{key} = ')
+                write_dat_value(file, value)
+                file.write(";\n\n")
+
+            sections[key] = (start, file.tell())
+
+    os.replace(tmp_file, dat_file)
+    _dat_sections[path] = {'stamp': dat_stamp(dat_file), 'sections': sections}
+
+
+# parameters whose source JSON did not change since the last preprocess that wrote dat_file
+def unchanged_parameters(dat_file, scenario):
+    sources = {}
+    for path in scenario.json_paths:
+        for key in scenario.data(path):
+            sources[key] = (path, scenario.stamps[path])
+
+    previous = _dat_sources.get(os.path.abspath(dat_file), {})
+    _dat_sources[os.path.abspath(dat_file)] = sources
+
+    return [key for key, source in sources.items() if previous.get(key) == source]
+
+
+# tuple sets of compact_hcp.mod (1-based, as the rest of the .dat)
+def compact_tuple_sets(sets):
+    o = sets['o_idx'] + 1
+    p = sets['p_idx'] + 1
+    d = sets['d_idx'] + 1
+
+    def visits(indexes):
+        return list(zip(o[indexes], p[indexes], d[indexes]))
+
+    def arcs(from_indexes, to_indexes):
+        return list(zip(o[from_indexes], d[from_indexes], p[from_indexes], p[to_indexes]))
+
+    def numbered_arcs(from_indexes, to_indexes):
+        return [(k + 1, *arc) for k, arc in enumerate(arcs(from_indexes, to_indexes))]
+
+    def members(rows, indexes):
+        return list(zip(rows + 1, o[indexes], d[indexes], p[indexes]))
+
+    return {
+        'candidateVisits': visits(slice(None)),
+        'firstVisits': visits(sets['first_ok']),
+        'lastVisits': visits(sets['last_ok']),
+        'arcs': arcs(sets['arc_from'], sets['arc_to']),
+        'conflicts': numbered_arcs(sets['conflict_a'], sets['conflict_b']),
+        'conflictBetween': members(sets['conflict_between'], sets['conflict_visit']),
+        'travelArcs': numbered_arcs(sets['travel_from'], sets['travel_to']),
+        'travelBetween': members(sets['between_travel'], sets['between_visit']),
+        'cliqueMembers': members(sets['clique_row'], sets['clique_visit'])
+    }
+
+
+# movements of arcs_hcp.mod: the arcs that satisfy the time constraints of new_hcp.mod
+def arc_tuple_sets(inst):
+    o_idx, p_idx, d_idx = so.visit_candidates(inst)
+    first_ok, last_ok, arc_from, arc_to = so.compatible_arcs(inst, o_idx, p_idx, d_idx)
+
+    o = o_idx + 1
+    p = p_idx + 1
+    d = d_idx + 1
+    home = inst['P'] + o
+
+    home_starts = zip(o[first_ok], d[first_ok], home[first_ok], p[first_ok])
+    home_ends = zip(o[last_ok], d[last_ok], p[last_ok], home[last_ok])
+    visits = zip(o[arc_from], d[arc_from], p[arc_from], p[arc_to])
+
+    return {'arcs': [*home_starts, *home_ends, *visits]}
+
 
-            # convert every "],\n\n]" to "]\n]"
-            write_str = write_str.replace('],\n\n]', ']\n]')
-            # convert every "[\n\t\t[" to "[\n\t["
-            write_str = write_str.replace('[\n\t\t[', '[\n\t[')
+def tuples_to_dat(dat_file, tuple_sets):
+    # appended to a .dat file written by JSON_to_dat
+    with open(dat_file, 'a') as file:
+        for key, tuples in tuple_sets.items():
+            file.write(f'{key} = {{\n')
+            file.write(',\n'.join('\t<' + ','.join(str(v) for v in t) + '>' for t in tuples))
+            file.write('\n};\n\n')
 
-            file.write(write_str)
-            file.write(";\n\n")
+    # the sections written by JSON_to_dat are still in place
+    path = os.path.abspath(dat_file)
+    if path in _dat_sections:
+        _dat_sections[path]['stamp'] = dat_stamp(dat_file)
 
 
-def preprocess(verbose=False):
+def preprocess(verbose=False, formulation=c.DEF_FORMULATION):
     if verbose:
         print("Start preprocessing...")
     
@@ -59,59 +205,154 @@ def preprocess(verbose=False):
     if verbose:
         print("Generated commuting matrix")
 
-    # save all data in a .dat file
-    input_data = u.merge_JSON_files(c.INPUT_JSON_PATHS)
-    JSON_to_dat(c.DAT_FILE, json_data=input_data)
+    # save all data in a .dat file, rewriting only the parameters whose input changed
+    scenario = sc.load_scenario(c.INPUT_JSON_PATHS)
+    input_data = scenario.data()
+
+    if formulation == c.FULL_FORMULATION:
+        JSON_to_dat(c.DAT_FILE, json_data=input_data, unchanged=unchanged_parameters(c.DAT_FILE, scenario))
+    elif formulation == c.COMPACT_FORMULATION:
+        JSON_to_dat(c.COMPACT_DAT_FILE, json_data=input_data, unchanged=unchanged_parameters(c.COMPACT_DAT_FILE, scenario))
+        tuples_to_dat(c.COMPACT_DAT_FILE, compact_tuple_sets(so.compact_sets(so.load_instance())))
+    elif formulation == c.ARCS_FORMULATION:
+        JSON_to_dat(c.ARCS_DAT_FILE, json_data=input_data, unchanged=unchanged_parameters(c.ARCS_DAT_FILE, scenario))
+        tuples_to_dat(c.ARCS_DAT_FILE, arc_tuple_sets(so.load_instance()))
+    else:
+        raise Exception(f'Formulation {formulation} not valid')
 
     if verbose:
         print("Generated .dat file")
     
 
-def run_solver(verbose=False):
+def run_solver(verbose=False, formulation=c.DEF_FORMULATION, deadline=None, gap_target=None, on_update=None, lower_bound=None):
     if verbose:
         print("Start running solver...")
     
-    # run the IBM solver
-    os.system(c.EXECUTION_COMMAND)
+    # run the IBM solver, following its log
+    if formulation == c.COMPACT_FORMULATION:
+        args = c.COMPACT_EXECUTION_ARGS
+    elif formulation == c.ARCS_FORMULATION:
+        args = c.ARCS_EXECUTION_ARGS
+    else:
+        args = c.EXECUTION_ARGS
+
+    result = rn.run(args, c.TMP_FILE, deadline=deadline, gap_target=gap_target, on_update=on_update, verbose=verbose,
+                    lower_bound=lower_bound)
 
     if verbose:
         print("Run ended")
 
+    return result
+
+
+OUTPUT_TOKEN = re.compile(r'\[|\]|[^\s\[\],]+')
+
+
+def parse_number(token):
+    try:
+        return int(token)
+    except ValueError:
+        return float(token)
+
+
+# single pass over the oplrun output: the solver log between "<<< generate" and "<<< solve" is copied to setup_file,
+# "name = value" lines are parsed into numbers and (possibly wrapped, nested) arrays
+def parse_output(output_file, setup_file=None):
+    output_data = {}
+    setup = open(setup_file, 'w') if setup_file is not None else None
+
+    in_setup = False
+    name = None
+    stack = []
+    with open(output_file, 'r') as file:
+        for line in file:
+            if line.startswith('<<< '):
+                in_setup = line.startswith('<<< generate')
+                continue
+
+            if in_setup:
+                if setup is not None:
+                    setup.write(line)
+                continue
+
+            if name is None:
+                if line.startswith('OBJECTIVE:'):
+                    # the objective may be printed with a decimal comma
+                    output_data[c.OBJECTIVE] = parse_number(line.split(':', 1)[1].strip().replace(',', '.'))
+                    continue
+
+                if '=' not in line:
+                    continue
+
+                name, line = line.split('=', 1)
+                name = name.strip()
+
+            for token in OUTPUT_TOKEN.findall(line):
+                if token == '[':
+                    stack.append([])
+                elif token == ']':
+                    values = stack.pop()
+                    if len(stack) > 0:
+                        stack[-1].append(values)
+                    else:
+                        output_data[name] = np.array(values)
+                elif len(stack) > 0:
+                    stack[-1].append(parse_number(token))
+                else:
+                    output_data[name] = parse_number(token)
+
+            # the value is complete once all brackets are closed
+            if len(stack) == 0:
+                name = None
 
-def postprocess(exec_time=None, verbose=False):
+    if setup is not None:
+        setup.close()
+
+    return output_data
+
+
+def postprocess(exec_time=None, lower_bound=None, verbose=False):
     if verbose:
         print("Start postprocessing...")
     
-    # retrieve output data and create a file in the data folder
-    os.system(f'{c.OUT_TO_PY} {c.TMP_FILE} {c.SETUP_FILE} {c.OUTPUT_DATA}')
-
-    # save the output data in a .json file
-    with open(c.OUTPUT_DATA, 'r') as f:
-        python_data = f.read()
-    
-    data = {}
-    exec(python_data, data)
-    json_data = {var_name: var_value for var_name, var_value in data.items() if not var_name.startswith('__')}
+    # retrieve output data and solver log
+    output_data = parse_output(c.TMP_FILE, c.SETUP_FILE)
 
     if exec_time is not None:
-        json_data[c.EXECUTION_TIME] = exec_time
+        output_data[c.EXECUTION_TIME] = exec_time
+
+    # the gap to a better bound than the one of the solver
+    if lower_bound is not None and c.OBJECTIVE in output_data:
+        objective = output_data[c.OBJECTIVE]
+        output_data[c.OPTIMALITY_GAP] = min(output_data[c.OPTIMALITY_GAP], max(0.0, objective - lower_bound) / (1e-10 + abs(objective)))
 
-    u.save_JSON(json_data, c.OUTPUT_JSON)
+    sl.save_solution(output_data)
 
     if verbose:
         print("Output data saved")
 
-    # remove the src file
+    # remove the solver output
     os.remove(c.TMP_FILE)
-    os.remove(c.OUTPUT_DATA)
-    os.system(f"touch {c.OUTPUT_DATA}")
 
     if verbose:
         print("Cleaning completed")
         print("Postprocessing completed")
 
 
-def run(verbose=False):
+def solve(verbose=False, solver=c.DEF_SOLVER, formulation=c.DEF_FORMULATION, deadline=None, gap_target=None, on_update=None):
+    # the HiGHS, heuristic, decomposition and column generation solvers work on the in-memory scenario: no .dat file and no text output to parse
+    if solver == c.HIGHS:
+        return so.run(time_limit=deadline if deadline is not None else c.SOLVER_TIME_LIMIT,
+                      mip_gap=gap_target if gap_target is not None else c.SOLVER_MIP_GAP, formulation=formulation, verbose=verbose)
+    elif solver == c.HEURISTIC:
+        return hr.run(time_limit=deadline if deadline is not None else c.HEURISTIC_TIME_LIMIT, verbose=verbose)
+    elif solver == c.DECOMPOSITION:
+        return dc.run(time_limit=deadline if deadline is not None else c.SOLVER_TIME_LIMIT,
+                      mip_gap=gap_target if gap_target is not None else c.SOLVER_MIP_GAP, verbose=verbose)
+    elif solver == c.COLUMN_GENERATION:
+        return cg.run(time_limit=deadline if deadline is not None else c.SOLVER_TIME_LIMIT,
+                      mip_gap=gap_target if gap_target is not None else c.SOLVER_MIP_GAP, verbose=verbose)
+
     # clean eventual tmp files from previous runs
     if os.path.exists(c.TMP_FILE):
         os.remove(c.TMP_FILE)
@@ -119,24 +360,23 @@ def run(verbose=False):
     if os.path.exists(c.SETUP_FILE):
         os.remove(c.SETUP_FILE)
 
-    if os.path.exists(c.OUTPUT_DATA):
-        os.remove(c.OUTPUT_DATA)
-        os.system(f"touch {c.OUTPUT_DATA}")
-
-    preprocess(verbose)
+    preprocess(verbose, formulation=formulation)
 
-    start_time = time.time()
-    run_solver(verbose)
-    end_time = time.time()
+    # a lower bound computed while the solver runs, to stop it once the incumbent is within gap_target of it
+    lower_bound = None
+    if c.USE_LOWER_BOUND:
+        scenario = sc.load_scenario(c.INPUT_JSON_PATHS)
+        lower_bound = lambda: bd.lower_bound(scenario)
 
-    exec_time = end_time - start_time
-    # round to two decimals
-    exec_time = round(exec_time, 2)
+    # wall time of the solver process alone
+    result = run_solver(verbose, formulation=formulation, deadline=deadline, gap_target=gap_target, on_update=on_update,
+                        lower_bound=lower_bound)
+    exec_time = result['exec_time']
 
     if verbose:
         print(f"Execution time: {exec_time} s")
 
-    postprocess(exec_time=exec_time, verbose=verbose)
+    postprocess(exec_time=exec_time, lower_bound=result['lower_bound'], verbose=verbose)
 
     objective, optimality_gap = m.get_efficiency_metrics()
 
@@ -148,3 +388,31 @@ def run(verbose=False):
         if verbose:
             print("No solution found")
         return False, False, exec_time
+
+
+# an instance already solved with the same model and settings is not solved again
+# (by default only with the solvers in CACHED_SOLVERS)
+def run(verbose=False, solver=c.DEF_SOLVER, formulation=c.DEF_FORMULATION, deadline=None, gap_target=None, on_update=None,
+        use_cache=None):
+    if solver not in [c.CPLEX, c.HIGHS, c.HEURISTIC, c.DECOMPOSITION, c.COLUMN_GENERATION]:
+        raise Exception(f'Solver {solver} not valid')
+
+    if use_cache is None:
+        use_cache = solver in c.CACHED_SOLVERS
+
+    key = None
+    if use_cache:
+        key = ca.current_key(solver, formulation, ca.solver_settings(solver, deadline, gap_target))
+        result = ca.lookup(key)
+        if result is not None:
+            if verbose:
+                print(f"Cached solution found, objective: {result[0]}")
+            return result
+
+    result = solve(verbose, solver, formulation, deadline=deadline, gap_target=gap_target, on_update=on_update)
+
+    if key is not None and result[0] is not False:
+        # only CPLEX writes a solver log
+        ca.store(key, *result, setup_file=c.SETUP_FILE if solver == c.CPLEX else None)
+
+    return result
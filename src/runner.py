@@ -0,0 +1,200 @@
+import re
+import time
+import signal
+import asyncio
+import multiprocessing
+
+import src.constants as c
+
+
+# numbers in the CPLEX log, printed with a decimal point or comma (e.g. 9696,8135 or -1,00000e+75)
+LOG_FLOAT = re.compile(r'^-?\d+[.,]\d+(e[+-]\d+)?$')
+LOG_INCUMBENT = re.compile(r'Found incumbent of value (\S+)')
+
+
+def log_number(token):
+    return float(token.replace(',', '.'))
+
+
+# progress of the MIP search in a line of the CPLEX log: the rows of the "Node Left Objective ... Gap" table
+# and the incumbents found before it; state keeps the last values seen across lines
+def parse_progress(line, state):
+    match = LOG_INCUMBENT.search(line)
+    if match is not None:
+        state['incumbent'] = log_number(match.group(1))
+        return dict(state)
+
+    if 'Node  Left' in line:
+        state['in_table'] = True
+        return None
+
+    tokens = line.split()
+    if not state.get('in_table') or len(tokens) < 3 or not tokens[-1].endswith('%'):
+        return None
+
+    # the two last floats are the best integer and the best bound, except on the rows where cuts
+    # are printed in place of the bound
+    floats = [log_number(token) for token in tokens[:-1] if LOG_FLOAT.match(token)]
+    if len(floats) == 0:
+        return None
+
+    if ':' in line:
+        state['incumbent'] = floats[-1]
+    elif len(floats) >= 2:
+        state['incumbent'], state['bound'] = floats[-2], floats[-1]
+
+    state['gap'] = log_number(tokens[-1][:-1]) / 100
+    return dict(state)
+
+
+# SIGINT makes CPLEX stop the search and go on with the incumbent, the others are sent if it does not exit in time
+async def stop_process(process, grace=c.SOLVER_STOP_GRACE):
+    for stop in [lambda: process.send_signal(signal.SIGINT), process.terminate, process.kill]:
+        if process.returncode is not None:
+            return
+
+        try:
+            stop()
+        except ProcessLookupError:
+            return
+
+        try:
+            await asyncio.wait_for(process.wait(), grace)
+        except asyncio.TimeoutError:
+            pass
+
+
+# gap of the incumbent to the best of the solver bound and of an external lower bound, as CPLEX computes it
+def bounded_gap(point, lower_bound):
+    if lower_bound is None or point['incumbent'] is None or (point['bound'] is not None and point['bound'] >= lower_bound):
+        return point['bound'], point['gap']
+
+    return lower_bound, max(0.0, point['incumbent'] - lower_bound) / (1e-10 + abs(point['incumbent']))
+
+
+# computes lower_bound in a process of its own (forked, as the function is usually a closure on the scenario),
+# so that a bound still running when the solver ends can be killed
+def compute_bound(lower_bound, connection):
+    try:
+        connection.send(lower_bound())
+    except Exception:
+        connection.send(None)
+    finally:
+        connection.close()
+
+
+# runs args appending its output to output_file, as the shell redirection did, while following the solver log:
+# every progress point (wall time, incumbent, bound, gap) is passed to on_update and collected in the result,
+# the run is stopped after deadline seconds or once the gap is within gap_target; lower_bound (a value, or a
+# function computed in a process while the solver runs) tightens the bound and the gap of the solver
+async def run_command(args, output_file, deadline=None, gap_target=None, on_update=None, cwd=None, verbose=False,
+                      lower_bound=None):
+    start_time = time.time()
+    process = await asyncio.create_subprocess_exec(*args, cwd=cwd, stdout=asyncio.subprocess.PIPE,
+                                                   stderr=asyncio.subprocess.STDOUT, limit=c.SOLVER_LINE_LIMIT)
+
+    result = {'returncode': None, 'exec_time': None, 'stopped': None, 'progress': [], 'lower_bound': None}
+    stopping = []
+
+    def stop(reason):
+        if result['stopped'] is None:
+            result['stopped'] = reason
+            stopping.append(asyncio.ensure_future(stop_process(process)))
+            if verbose:
+                print(f"Stopping solver ({reason})")
+
+    def check(point):
+        if gap_target is not None and point['gap'] is not None and point['gap'] <= gap_target:
+            stop('gap')
+
+    loop = asyncio.get_running_loop()
+    timer = loop.call_later(deadline, stop, 'deadline') if deadline is not None else None
+
+    state = {'incumbent': None, 'bound': None, 'gap': None}
+    last = {'incumbent': None, 'bound': None, 'gap': None}
+
+    # the bound may arrive after the incumbent it proves
+    def bound_found():
+        loop.remove_reader(receiver.fileno())
+        try:
+            bound = receiver.recv()
+        except EOFError:
+            return
+        if bound is None:
+            return
+
+        result['lower_bound'] = bound
+        if verbose:
+            print(f"Lower bound: {result['lower_bound']}")
+
+        bound, gap = bounded_gap(last, result['lower_bound'])
+        check({'incumbent': last['incumbent'], 'bound': bound, 'gap': gap})
+
+    bound_process, receiver = None, None
+    if callable(lower_bound):
+        context = multiprocessing.get_context('fork')
+        receiver, sender = context.Pipe(duplex=False)
+        bound_process = context.Process(target=compute_bound, args=(lower_bound, sender), daemon=True)
+        bound_process.start()
+        sender.close()
+        loop.add_reader(receiver.fileno(), bound_found)
+    elif lower_bound is not None:
+        result['lower_bound'] = lower_bound
+
+    with open(output_file, 'a') as output:
+        async for line in process.stdout:
+            line = line.decode(errors='replace')
+            output.write(line)
+
+            point = parse_progress(line, state)
+            if point is None:
+                continue
+
+            last.update(point)
+            bound, gap = bounded_gap(point, result['lower_bound'])
+            point = {'time': round(time.time() - start_time, 2), 'incumbent': point['incumbent'],
+                     'bound': bound, 'gap': gap}
+            result['progress'].append(point)
+
+            if on_update is not None:
+                on_update(point)
+
+            check(point)
+
+    result['returncode'] = await process.wait()
+    result['exec_time'] = round(time.time() - start_time, 2)
+
+    if timer is not None:
+        timer.cancel()
+    for task in stopping:
+        await task
+
+    # a bound still running is not waited for
+    if bound_process is not None:
+        loop.remove_reader(receiver.fileno())
+        if bound_process.is_alive():
+            bound_process.terminate()
+        bound_process.join()
+        receiver.close()
+
+    return result
+
+
+# runs several commands at once, at most max_concurrent at a time (all of them if None)
+# every job is a dict of run_command arguments; they must not share their output file
+async def run_commands(jobs, max_concurrent=None):
+    semaphore = asyncio.Semaphore(max_concurrent if max_concurrent is not None else max(len(jobs), 1))
+
+    async def run_job(job):
+        async with semaphore:
+            return await run_command(**job)
+
+    return await asyncio.gather(*[run_job(job) for job in jobs])
+
+
+def run(args, output_file, deadline=None, gap_target=None, on_update=None, cwd=None, verbose=False, lower_bound=None):
+    return asyncio.run(run_command(args, output_file, deadline, gap_target, on_update, cwd, verbose, lower_bound))
+
+
+def run_many(jobs, max_concurrent=None):
+    return asyncio.run(run_commands(jobs, max_concurrent))
@@ -0,0 +1,214 @@
+import os
+import copy
+import gzip
+import json
+import itertools
+import contextlib
+import numpy as np
+
+import src.constants as c
+import src.utilities as u
+
+
+# versions of the in-memory scenarios, standing for the file stamps
+_memory_versions = itertools.count()
+
+
+# in-memory view of a set of JSON files, reloaded only when one of them changes
+# the data returned is shared: callers must not modify it (use copy_value when needed)
+# with files (JSON path -> data) the scenario lives in memory only: it is never reloaded, and it is written
+# with store (and to disk only with save)
+class Scenario:
+    def __init__(self, json_paths, files=None):
+        self.json_paths = list(json_paths)
+
+        self.files = {}
+        self.stamps = {}
+        self.arrays = {}
+        self.merged = None
+
+        self.in_memory = files is not None
+        self.modified = set()
+        if self.in_memory:
+            for path in self.json_paths:
+                self.files[path] = files.get(path, {})
+                self.stamps[path] = ('memory', next(_memory_versions))
+
+
+    def __getitem__(self, parameter):
+        return self.data()[parameter]
+
+
+    def __contains__(self, parameter):
+        return parameter in self.data()
+
+
+    def file_stamp(self, json_path):
+        # writes done through u.save_JSON are counted, so same-size rewrites within the mtime resolution are not missed
+        if not os.path.exists(json_path):
+            return None
+
+        stat = os.stat(json_path)
+        return (stat.st_mtime_ns, stat.st_size, u.json_writes(json_path))
+
+
+    def refresh(self, json_path=None):
+        if self.in_memory:
+            return
+
+        json_paths = self.json_paths if json_path is None else [json_path]
+
+        for path in json_paths:
+            stamp = self.file_stamp(path)
+            if path in self.files and stamp is not None and stamp == self.stamps[path]:
+                continue
+
+            self.files[path] = u.retrieve_JSON(path)
+            self.stamps[path] = self.file_stamp(path)
+
+            # drop everything derived from the old content
+            self.arrays = {key: value for key, value in self.arrays.items() if key[0] != path}
+            self.merged = None
+
+
+    def data(self, json_path=None):
+        if json_path is not None:
+            self.refresh(json_path)
+            return self.files[json_path]
+
+        self.refresh()
+        if self.merged is None:
+            # same precedence as u.merge_JSON_files
+            self.merged = {}
+            for path in self.json_paths:
+                self.merged = {**self.merged, **self.files[path]}
+
+        return self.merged
+
+
+    def source(self, parameter):
+        for path in reversed(self.json_paths):
+            if parameter in self.data(path):
+                return path
+
+        raise KeyError(parameter)
+
+
+    def array(self, parameter, dtype=None) -> np.ndarray:
+        path = self.source(parameter)
+        key = (path, parameter, dtype)
+
+        if key not in self.arrays:
+            array = np.array(self.files[path][parameter], dtype=dtype)
+            array.setflags(write=False)
+            self.arrays[key] = array
+
+        return self.arrays[key]
+
+
+    # replaces the data of one file of an in-memory scenario
+    def store(self, json_path, data):
+        if not self.in_memory:
+            raise Exception(f'Scenario on disk not valid for store, use u.save_JSON')
+
+        self.files[json_path] = data
+        self.stamps[json_path] = ('memory', next(_memory_versions))
+        self.modified.add(json_path)
+
+        self.arrays = {key: value for key, value in self.arrays.items() if key[0] != json_path}
+        self.merged = None
+
+
+    # writes the JSON files: to their own paths the ones stored since the scenario was created, to folder all of them
+    def save(self, folder=None):
+        for path in self.json_paths:
+            if folder is not None:
+                u.save_JSON(self.data(path), os.path.join(folder, os.path.basename(path)))
+            elif path in self.modified:
+                u.save_JSON(self.data(path), path)
+
+        self.modified = set()
+
+
+    # writes all the files in a single gzip-compressed JSON, by file name
+    def save_compact(self, file_name):
+        with gzip.open(file_name, 'wt') as f:
+            json.dump({os.path.basename(path): self.data(path) for path in self.json_paths}, f, separators=(',', ':'))
+
+
+_scenarios = {}
+
+# in-memory scenario the getters read instead of the files (see using)
+_active = None
+
+
+def load_scenario(json_paths=c.INPUT_JSON_PATHS) -> Scenario:
+    if _active is not None and list(json_paths) == _active.json_paths:
+        return _active
+
+    key = tuple(json_paths)
+    if key not in _scenarios:
+        _scenarios[key] = Scenario(json_paths)
+
+    return _scenarios[key]
+
+
+# in-memory scenario with the data of files (JSON path -> data), or a copy of the files on disk
+def memory_scenario(files=None, from_disk=False, json_paths=c.INPUT_JSON_PATHS) -> Scenario:
+    if from_disk:
+        files = {path: u.retrieve_JSON(path) for path in json_paths if os.path.exists(path)}
+
+    return Scenario(json_paths, files if files is not None else {})
+
+
+# in-memory scenario written by save_compact
+def load_compact(file_name, json_paths=c.INPUT_JSON_PATHS) -> Scenario:
+    with gzip.open(file_name, 'rt') as f:
+        files = json.load(f)
+
+    return Scenario(json_paths, {path: files[os.path.basename(path)] for path in json_paths if os.path.basename(path) in files})
+
+
+# usage: with sc.using(scenario): ... - the getters (and the generators, the solvers and the simulator built on
+# them) read the in-memory scenario, and the generators write to it
+@contextlib.contextmanager
+def using(scenario):
+    global _active
+
+    if not scenario.in_memory:
+        raise Exception(f'Scenario on disk not valid for using, use load_scenario')
+
+    previous = _active
+    _active = scenario
+    try:
+        yield scenario
+    finally:
+        _active = previous
+
+
+# fresh copy of the input data of a file, from the scenario in use if any
+def read(json_path):
+    if _active is not None and json_path in _active.json_paths:
+        return copy.deepcopy(_active.data(json_path))
+
+    return u.retrieve_JSON(json_path)
+
+
+# input data written by the generators: to the scenario in use if any, to disk otherwise
+def write(data, json_path):
+    if _active is not None and json_path in _active.json_paths:
+        _active.store(json_path, data)
+    else:
+        u.save_JSON(data, json_path)
+
+
+def clear_cache():
+    _scenarios.clear()
+
+
+# lists handed out by the getters are copies, as when they were read from disk at every call
+def copy_value(value):
+    if isinstance(value, list):
+        return [copy_value(v) for v in value]
+
+    return value
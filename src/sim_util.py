@@ -80,6 +80,30 @@ def compute_robustness_factor(op_skill, visit_duration_distr, prev_possible_visi
     return robustness
 
 
+def adjusted_probability(probability, day):
+    # per-minute probability of an event tested as rand() * day_adjustment(day) < probability
+    adjustment = day_adjustment(day)
+    if adjustment <= 0:
+        return 1
+    return min(1, probability / adjustment)
+
+
+def sample_event_time(current_time, probability, from_time=None, to_time=None):
+    # first minute after current_time (and after from_time) in which a per-minute Bernoulli event occurs
+    if probability <= 0:
+        return None
+
+    if from_time is not None and current_time < from_time:
+        current_time = from_time
+
+    event_time = current_time + int(np.random.geometric(probability))
+
+    if to_time is not None and event_time >= to_time:
+        return None
+
+    return event_time
+
+
 def day_adjustment(day):
     return (5 - day) / 3
     # return day != 4
\ No newline at end of file
@@ -1,4 +1,7 @@
 # from typing import Any
+import bisect
+import heapq
+import itertools
 from mesa import Agent, Model
 from mesa.time import RandomActivation
 from itertools import groupby
@@ -54,7 +57,7 @@ class Patient(Agent):
 
     
     def own_visits(self) -> list['Visit']:
-        return [visit for visit in self.model.visits if visit.patient_id == self.unique_id]
+        return list(self.model.patient_visits.get(self.unique_id, []))
 
 
     def preferred_operators(self) -> list[int]:
@@ -99,7 +102,7 @@ class Patient(Agent):
 
 
     def has_visit(self, day) -> bool:
-        return len([v for v in self.own_visits() if v.real_day == day and v.state != c.NOT_SCHEDULED]) > 0
+        return len(self.model.patient_schedules.get(self.unique_id, {}).get(day, [])) > 0
 
     # ------------ VISIT GENERATION ------------
     
@@ -215,27 +218,44 @@ class Patient(Agent):
 
     # ------------ END VISIT GENERATION ------------
 
-    
+
+    def event_probabilities(self) -> dict[int, float]:
+        return {
+            c.NEW_VISIT_EVENT: self.model.p_new_visit,
+            c.SINGLE_CANCELLATION_EVENT: self.model.p_single_canc,
+            c.ALL_CANCELLATIONS_EVENT: self.model.p_all_canc
+        }
+
+
+    def perform_event(self, event):
+        if self.is_removed:
+            return
+
+        # new visit
+        if event == c.NEW_VISIT_EVENT:
+            if self.model.verbose:
+                print(f"Patient {self.unique_id} is generating a new visit")
+
+            self.newly_generated_visits += self.generate_new_visit()
+
+        # cancellation
+        elif event == c.SINGLE_CANCELLATION_EVENT:
+            self.cancel_visit()
+
+        # all cancellations
+        elif event == c.ALL_CANCELLATIONS_EVENT:
+            if self.model.verbose:
+                print(f"Patient {self.unique_id} is cancelling all visits")
+
+            self.cancel_all_visits()
+
+
     def step(self):
         if not self.is_removed:
             if self.model.current_time > c.DEF_PAT_START_TIME and self.model.current_time < c.DEF_PAT_END_TIME:
-                # new visit
-                if np.random.rand() * su.day_adjustment(self.model.current_day) < self.model.p_new_visit:
-                    if self.model.verbose:
-                        print(f"Patient {self.unique_id} is generating a new visit")
-                    
-                    self.newly_generated_visits += self.generate_new_visit()
-
-                # cancellation
-                if np.random.rand() * su.day_adjustment(self.model.current_day) < self.model.p_single_canc:
-                    self.cancel_visit()
-
-                # all cancellations
-                if np.random.rand() * su.day_adjustment(self.model.current_day) < self.model.p_all_canc:
-                    if self.model.verbose:
-                        print(f"Patient {self.unique_id} is cancelling all visits")
-                    
-                    self.cancel_all_visits()
+                for event, probability in self.event_probabilities().items():
+                    if np.random.rand() * su.day_adjustment(self.model.current_day) < probability:
+                        self.perform_event(event)
 
 
 
@@ -270,7 +290,7 @@ class Operator(Agent):
         # if idle state
         self.next_visit = None
         self.etd = None
-        # useful for travelling
+        # useful for travelling: (from, to) municipalities
         self.current_edge = None
         self.eta = None
 
@@ -296,16 +316,15 @@ class Operator(Agent):
 
 
     def retrieve_schedule(self, only_scheduled=False, day=None) -> list['Visit']:
-        schedule = []
-        for visit in self.model.visits:
-            if day is not None and visit.real_day != day:
-                continue
+        # daily schedules are kept sorted by start time in the model index
+        op_schedule = self.model.operator_schedules.get(self.unique_id, {})
+        days = [day] if day is not None else sorted(op_schedule.keys())
 
-            if visit.real_operator_id == self.unique_id and (visit.state == c.SCHEDULED or ((visit.state == c.EXECUTED or visit.state == c.EXECUTING) and not only_scheduled)):
+        schedule = []
+        for d in days:
+            for visit in op_schedule.get(d, []):
+                if visit.state == c.SCHEDULED or not only_scheduled:
                     schedule.append(visit)
-
-        # sort by day and start time
-        schedule = sorted(schedule, key=lambda visit: (visit.real_day, visit.real_start_time))    
         
         return schedule
 
@@ -415,7 +434,7 @@ class Operator(Agent):
         if len(schedule) == 0:
             return self.end_time[day]
         
-        return np.max([schedule[-1].real_end_time + self.model.graph[schedule[-1].get_mun()][self.municipality]['weight'], self.end_time[day]])
+        return np.max([schedule[-1].real_end_time + self.model.travel_times[schedule[-1].get_mun(), self.municipality], self.end_time[day]])
 
 
     def cumulable_delay(self, day, start_time=None, end_time=None, schedule=None):
@@ -433,7 +452,7 @@ class Operator(Agent):
         # compute time between start of day and first visit - travel time
         first_visit = schedule[0]
 
-        time_distance = self.model.graph[self.municipality][first_visit.get_mun()]['weight']
+        time_distance = self.model.travel_times[self.municipality, first_visit.get_mun()]
         
         cumul_delay += np.max([0, np.min([to_time, first_visit.real_start_time]) - from_time - time_distance])
 
@@ -452,7 +471,7 @@ class Operator(Agent):
             current_visit = schedule[i]
             next_visit = schedule[i + 1]
 
-            time_distance = self.model.graph[current_visit.get_mun()][next_visit.get_mun()]['weight']
+            time_distance = self.model.travel_times[current_visit.get_mun(), next_visit.get_mun()]
 
             cumul_delay += np.max([0, np.min([next_visit.real_start_time, to_time]) - np.max([from_time, current_visit.real_end_time]) - time_distance])
 
@@ -466,7 +485,7 @@ class Operator(Agent):
         # compute time between last visit and end of day - travel time
         last_visit = schedule[-1]
         
-        time_distance = self.model.graph[last_visit.get_mun()][self.municipality]['weight']
+        time_distance = self.model.travel_times[last_visit.get_mun(), self.municipality]
 
         cumul_delay += np.max([0, to_time - np.max([from_time, last_visit.real_end_time]) - time_distance])
 
@@ -504,7 +523,7 @@ class Operator(Agent):
                     # case 1: if no visits, always available
                     if len(subschedule) == 0:
                         # compute distance between operator municipality and municipality
-                        time_distance = self.model.graph[self.municipality][municipality]['weight']
+                        time_distance = self.model.travel_times[self.municipality, municipality]
 
                         av_window = (self.start_time[d] + time_distance, self.end_time[d] - time_distance)
 
@@ -514,8 +533,8 @@ class Operator(Agent):
                         # compute availability from start of d to first visit
                         first_visit = subschedule[0]
 
-                        start_time_distance = self.model.graph[self.municipality][municipality]['weight']
-                        end_time_distance = self.model.graph[first_visit.get_mun()][municipality]['weight']
+                        start_time_distance = self.model.travel_times[self.municipality, municipality]
+                        end_time_distance = self.model.travel_times[first_visit.get_mun(), municipality]
 
                         first_av_window = (self.start_time[d] + start_time_distance, first_visit.real_start_time - end_time_distance)
                         
@@ -527,8 +546,8 @@ class Operator(Agent):
                             current_visit = subschedule[i]
                             next_visit = subschedule[i + 1]
 
-                            start_time_distance = self.model.graph[current_visit.get_mun()][municipality]['weight']
-                            end_time_distance = self.model.graph[next_visit.get_mun()][municipality]['weight']
+                            start_time_distance = self.model.travel_times[current_visit.get_mun(), municipality]
+                            end_time_distance = self.model.travel_times[next_visit.get_mun(), municipality]
 
                             av_window = (current_visit.real_end_time + start_time_distance, next_visit.real_start_time - end_time_distance)
                             
@@ -538,8 +557,8 @@ class Operator(Agent):
                         # compute availability from last visit to end of d
                         last_visit = subschedule[-1]
                         
-                        start_time_distance = self.model.graph[last_visit.get_mun()][municipality]['weight']
-                        end_time_distance = self.model.graph[self.municipality][municipality]['weight']
+                        start_time_distance = self.model.travel_times[last_visit.get_mun(), municipality]
+                        end_time_distance = self.model.travel_times[self.municipality, municipality]
 
                         last_av_window = (last_visit.real_end_time + start_time_distance, self.end_time[d] - end_time_distance)
                         
@@ -554,18 +573,50 @@ class Operator(Agent):
             return availabilities
     
         else:
-            schedule = self.retrieve_schedule()
+            schedule = self.retrieve_schedule(day=day)
 
             # if no municipality is specified, return availability for all municipalities
-            all_availabilities = []
+            if day is not None:
+                return self.daily_availabilities_by_municipality(day, schedule)
+
+            all_availabilities = [[] for _ in range(self.model.n_municipalities)]
             
-            for municipality in range(self.model.n_municipalities):
-                availabilities = self.available_for_municipality(municipality=municipality, day=day, schedule=schedule)
-                all_availabilities.append(availabilities)
+            for d in range(self.model.n_days):
+                daily_availabilities = self.daily_availabilities_by_municipality(d, schedule)
+                for municipality in range(self.model.n_municipalities):
+                    all_availabilities[municipality].append(daily_availabilities[municipality])
 
             return all_availabilities
 
 
+    def daily_availabilities_by_municipality(self, day, schedule):
+        # same windows as available_for_municipality, computed on whole rows of the travel matrix
+        n_municipalities = self.model.n_municipalities
+
+        if self.availability[day] == 0:
+            return [[] for _ in range(n_municipalities)]
+
+        subschedule = [visit for visit in schedule if visit.real_day == day]
+        travel_times = self.model.travel_times
+
+        # if no visits, always available
+        if len(subschedule) == 0:
+            window_starts = (self.start_time[day] + travel_times[self.municipality]).tolist()
+            window_ends = (self.end_time[day] - travel_times[self.municipality]).tolist()
+
+            return [[(window_starts[mun], window_ends[mun])] for mun in range(n_municipalities)]
+
+        # one row per gap: home -> first visit, between consecutive visits, last visit -> home
+        visit_muns = [visit.get_mun() for visit in subschedule]
+        gap_starts = np.array([self.start_time[day]] + [visit.real_end_time for visit in subschedule])[:, None] + travel_times[[self.municipality] + visit_muns]
+        gap_ends = np.array([visit.real_start_time for visit in subschedule] + [self.end_time[day]])[:, None] - travel_times[visit_muns + [self.municipality]]
+        is_open = (gap_starts < gap_ends).T.tolist()
+        gap_starts = gap_starts.T.tolist()
+        gap_ends = gap_ends.T.tolist()
+
+        return [[(gap_starts[mun][g], gap_ends[mun][g]) for g in range(len(subschedule) + 1) if is_open[mun][g]] for mun in range(n_municipalities)]
+
+
     def available_for_time_period(self, start_time, end_time, municipality=None, day=None, schedule=None):
         if schedule is None:
             schedule = self.retrieve_schedule()
@@ -660,7 +711,7 @@ class Operator(Agent):
             if self.municipality == municipality:
                 return 0
             else:
-                return 2 * self.model.graph[self.municipality][municipality]['weight']
+                return 2 * self.model.travel_times[self.municipality, municipality]
 
         prev_mun = None
         next_mun = None
@@ -686,9 +737,9 @@ class Operator(Agent):
 
         # print(f"Operator {self.unique_id} is travelling from municipality {prev_mun} to municipality {next_mun}")
 
-        first_new = self.model.graph[municipality][prev_mun]['weight'] if municipality != prev_mun else 0
-        second_new = self.model.graph[next_mun][municipality]['weight'] if municipality != next_mun else 0
-        old = self.model.graph[prev_mun][next_mun]['weight'] if prev_mun != next_mun else 0
+        first_new = self.model.travel_times[municipality, prev_mun] if municipality != prev_mun else 0
+        second_new = self.model.travel_times[next_mun, municipality] if municipality != next_mun else 0
+        old = self.model.travel_times[prev_mun, next_mun] if prev_mun != next_mun else 0
         
         return first_new + second_new - old
 
@@ -768,7 +819,7 @@ class Operator(Agent):
                         # delay next visits
                         next_visit = schedule[visit_index + 1]
 
-                        time_distance = self.model.graph[this_visit.get_mun()][next_visit.get_mun()]['weight']
+                        time_distance = self.model.travel_times[this_visit.get_mun(), next_visit.get_mun()]
 
                         postponing_time = np.max([0, this_visit.real_end_time + time_distance + delay - next_visit.real_start_time])
 
@@ -850,7 +901,7 @@ class Operator(Agent):
         last_visit = subseq_visits[-1]
         last_shortened_time = last_visit.shortened_time()
 
-        lag_time = np.max([0, self.end_time[visit.real_day] - last_visit.real_end_time - self.model.graph[last_visit.get_mun()][self.municipality]['weight']])
+        lag_time = np.max([0, self.end_time[visit.real_day] - last_visit.real_end_time - self.model.travel_times[last_visit.get_mun(), self.municipality]])
 
         if self.model.debug:
             print(f"Lag time between last visit {last_visit.unique_id} and return home: {lag_time}")
@@ -936,8 +987,8 @@ class Operator(Agent):
             if self.model.debug:
                 print("No next visit for operator " + str(self.unique_id) + "; etd and eta set to None")
         else:
-            self.etd = np.min([self.next_visit.real_start_time - self.current_edge['weight'], np.max([c.DEF_OP_START_TIME, self.start_time[self.model.current_day], self.model.current_time + 1, self.next_visit.real_start_time - c.MIN_NOTICE_TIME])])
-            self.eta = self.current_edge['weight'] + self.etd
+            self.etd = np.min([self.next_visit.real_start_time - self.model.travel_times[self.current_edge], np.max([c.DEF_OP_START_TIME, self.start_time[self.model.current_day], self.model.current_time + 1, self.next_visit.real_start_time - c.MIN_NOTICE_TIME])])
+            self.eta = self.model.travel_times[self.current_edge] + self.etd
             if self.model.debug:
                 print(f"Operator {self.unique_id} is travelling from municipality {self.current_municipality} to municipality {self.next_mun()} for visit {self.next_visit.unique_id} to patient {self.next_visit.patient_id} from {u.print_time_in_minutes(self.next_visit.real_start_time)} to {u.print_time_in_minutes(self.next_visit.real_end_time)}; etd: {u.print_time_in_minutes(self.etd)}; eta: {u.print_time_in_minutes(self.eta)}")
 
@@ -953,7 +1004,7 @@ class Operator(Agent):
             self.current_edge = None        
         else:
             self.next_visit = schedule[0]
-            self.current_edge = self.model.graph[self.current_municipality][self.next_mun()]
+            self.current_edge = (self.current_municipality, self.next_mun())
 
         self.update_movement()
 
@@ -966,7 +1017,7 @@ class Operator(Agent):
         if self.model.verbose:
             print(f"Operator {self.unique_id} is quitting the day")
 
-        self.end_time[self.model.current_day] = self.model.current_time + self.model.graph[self.current_municipality][self.municipality]['weight'] + 1
+        self.end_time[self.model.current_day] = self.model.current_time + self.model.travel_times[self.current_municipality, self.municipality] + 1
         self.next_visit = None
         self.current_edge = None
         self.etd = None
@@ -985,7 +1036,7 @@ class Operator(Agent):
         self.start_time[day] = time
 
         schedule = self.retrieve_schedule(only_scheduled=True, day=day)
-        visits_to_reschedule = [v for v in schedule if v.real_start_time - self.model.graph[self.municipality][v.get_mun()]['weight'] < time]
+        visits_to_reschedule = [v for v in schedule if v.real_start_time - self.model.travel_times[self.municipality, v.get_mun()] < time]
         for v in visits_to_reschedule:
             v.deschedule()
 
@@ -997,7 +1048,7 @@ class Operator(Agent):
         self.end_time[day] = time
 
         schedule = self.retrieve_schedule(only_scheduled=True, day=day)
-        visits_to_reschedule = [v for v in schedule if v.real_end_time + self.model.graph[v.get_mun()][self.municipality]['weight'] > time]
+        visits_to_reschedule = [v for v in schedule if v.real_end_time + self.model.travel_times[v.get_mun(), self.municipality] > time]
         for v in visits_to_reschedule:
             v.deschedule()
 
@@ -1049,11 +1100,11 @@ class Operator(Agent):
     # if operator is idle, check if it is time to go to the next municipality
     def idle_step(self):
         # if it is time to go home, go home
-        if self.next_visit is None and self.end_time[self.model.current_day] <= np.max([self.model.current_time + self.model.graph[self.current_municipality][self.municipality]['weight'], self.model.current_time + c.MIN_NOTICE_TIME]):
+        if self.next_visit is None and self.end_time[self.model.current_day] <= np.max([self.model.current_time + self.model.travel_times[self.current_municipality, self.municipality], self.model.current_time + c.MIN_NOTICE_TIME]):
             self.state = c.TRAVELLING
-            self.current_edge = self.model.graph[self.current_municipality][self.municipality]
+            self.current_edge = (self.current_municipality, self.municipality)
             self.etd = self.model.current_time
-            self.eta = self.model.graph[self.current_municipality][self.municipality]['weight'] + self.model.current_time
+            self.eta = self.model.travel_times[self.current_municipality, self.municipality] + self.model.current_time
 
             if np.random.rand() * su.rush_hours_coefficient(self.model.current_time) < self.model.p_extended_travel:
                 extend_time = su.sample_extend_time(self.model.extend_min, self.model.extend_mode, self.model.extend_max)
@@ -1091,44 +1142,63 @@ class Operator(Agent):
             
             return
 
-        # random events
-        if self.model.current_time > c.DEF_OP_START_TIME and self.model.current_time < c.DEF_OP_END_TIME and self.model.current_day != 4:
-            # quit day
-            if np.random.rand() * su.day_adjustment(self.model.current_day) < self.model.p_quit_day:
-                self.quit_day()
-                return
+        # random events (drawn by the model in event-driven mode)
+        if not self.model.event_driven and self.model.current_time > c.DEF_OP_START_TIME and self.model.current_time < c.DEF_OP_END_TIME and self.model.current_day != 4:
+            for event, probability in self.event_probabilities().items():
+                if np.random.rand() * su.day_adjustment(self.model.current_day) < probability and self.perform_event(event):
+                    return
 
-            # late entry
-            if np.random.rand() * su.day_adjustment(self.model.current_day) < self.model.p_late_entry and self.model.current_day < self.model.n_days - 1:
-                day = np.random.randint(self.model.current_day + 1, self.model.n_days)
-                time = (np.random.randint(c.DEF_OP_START_TIME, c.DEF_OP_END_TIME / 2) // c.TIME_UNIT) * c.TIME_UNIT
 
-                if time > self.start_time[day]:
-                    self.late_entry(day, time)
-                return
-            
-            # early exit
-            if np.random.rand() * su.day_adjustment(self.model.current_day) < self.model.p_early_exit and self.model.current_day < self.model.n_days - 1:
-                day = np.random.randint(self.model.current_day + 1, self.model.n_days)
-                time = (np.random.randint(c.DEF_OP_START_TIME + c.DEF_OP_END_TIME / 2, c.DEF_OP_END_TIME) // c.TIME_UNIT) * c.TIME_UNIT
-                
-                if time < self.end_time[day]:
-                    self.early_exit(day, time)
-                return
+    def event_probabilities(self) -> dict[int, float]:
+        return {
+            c.QUIT_DAY_EVENT: self.model.p_quit_day,
+            c.LATE_ENTRY_EVENT: self.model.p_late_entry,
+            c.EARLY_EXIT_EVENT: self.model.p_early_exit
+        }
+
+
+    def perform_event(self, event) -> bool:
+        # quit day
+        if event == c.QUIT_DAY_EVENT:
+            self.quit_day()
+            return True
+
+        if self.model.current_day >= self.model.n_days - 1:
+            return False
+
+        # late entry
+        if event == c.LATE_ENTRY_EVENT:
+            day = np.random.randint(self.model.current_day + 1, self.model.n_days)
+            time = (np.random.randint(c.DEF_OP_START_TIME, c.DEF_OP_END_TIME / 2) // c.TIME_UNIT) * c.TIME_UNIT
+
+            if time > self.start_time[day]:
+                self.late_entry(day, time)
+            return True
+
+        # early exit
+        if event == c.EARLY_EXIT_EVENT:
+            day = np.random.randint(self.model.current_day + 1, self.model.n_days)
+            time = (np.random.randint(c.DEF_OP_START_TIME + c.DEF_OP_END_TIME / 2, c.DEF_OP_END_TIME) // c.TIME_UNIT) * c.TIME_UNIT
+
+            if time < self.end_time[day]:
+                self.early_exit(day, time)
+            return True
+
+        return False
 
 
     # if operator is travelling, check if they have arrived
     def travelling_step(self):
         if self.model.current_time == self.eta:
-            self.current_edge['n_travels'] += 1
+            self.model.n_travels[self.current_edge] += 1
             self.real_travel_time += self.eta - self.etd
 
-            if self.current_edge['muns'][0] != self.current_edge['muns'][1]:
+            if self.current_edge[0] != self.current_edge[1]:
                 self.real_inter_travel_time += self.eta - self.etd 
 
             # if next visit, ready to perform it
             if self.next_visit is not None:
-                if self.is_reimbursed and self.current_edge['muns'][0] != self.current_edge['muns'][1]:
+                if self.is_reimbursed and self.current_edge[0] != self.current_edge[1]:
                     self.travel_to_reimburse += self.eta - self.etd
                 
                 self.is_reimbursed = True
@@ -1198,6 +1268,41 @@ class Operator(Agent):
             self.idle_step()
 
 
+    # first time after the current one at which step() would change the operator state
+    def next_event_time(self):
+        current_time = self.model.current_time
+        day = self.model.current_day
+
+        if self.state == c.UNAVAILABLE:
+            if self.availability[day] == 0:
+                return None
+
+            event_time = np.max([current_time + 1, self.start_time[day]])
+            return event_time if event_time <= self.end_time[day] else None
+
+        if self.state == c.IDLE:
+            if self.next_visit is None:
+                home_time = np.max([self.model.travel_times[self.current_municipality, self.municipality], c.MIN_NOTICE_TIME])
+                return np.max([current_time + 1, self.end_time[day] - home_time])
+
+            event_time = self.etd
+
+        elif self.state == c.TRAVELLING:
+            event_time = self.eta
+
+        elif self.state == c.READY:
+            event_time = self.next_visit.real_start_time
+
+        elif self.state == c.WORKING:
+            event_time = self.next_visit.real_end_time
+
+        else:
+            return None
+
+        # states are left only at the exact time, as in the minute-by-minute stepping
+        return event_time if event_time is not None and event_time > current_time else None
+
+
     def step(self):
         if self.state == c.UNAVAILABLE:
             self.unavailable_step()
@@ -1237,6 +1342,8 @@ class Visit:
         self.model = model
         self.patient_id = patient_id
         self.skill = skill
+        # patients never move, so the municipality is cached
+        self.municipality = model.get_patient(patient_id).municipality
 
         # proposed data
         self.proposed_day = proposed_day
@@ -1269,6 +1376,11 @@ class Visit:
         self.newly_generated = newly_generated
         self.scheduled_by_manager = False
 
+        # (operator, day) and patient day under which the visit is stored in the model schedule indexes
+        self.schedule_key = None
+        self.patient_day = None
+        self.is_removed = False
+
         self.original_day = original_day if original_day is not None else proposed_day
 
     
@@ -1307,7 +1419,7 @@ class Visit:
 
 
     def get_mun(self):
-        return self.model.get_patient(self.patient_id).municipality
+        return self.municipality
 
 
     def preferred_operators(self):
@@ -1348,6 +1460,8 @@ class Visit:
         self.state = c.SCHEDULED
         self.scheduled_by_manager = True
 
+        self.model.index_visit(self)
+
     
     def deschedule(self):
         self.scheduled_day = None
@@ -1361,6 +1475,8 @@ class Visit:
 
         self.state = c.NOT_SCHEDULED
 
+        self.model.unindex_visit(self)
+
     
     def start(self, day, start_time, op_id):
         self.real_day = day
@@ -1369,6 +1485,8 @@ class Visit:
 
         self.state = c.EXECUTING
 
+        self.model.index_visit(self)
+
 
     def complete(self, end_time):
         self.real_end_time = end_time
@@ -1379,6 +1497,7 @@ class Visit:
     def stretch(self, stretch_time, start=True):
         if start:
             self.real_start_time -= stretch_time
+            self.model.index_visit(self)
         else:
             self.real_end_time += stretch_time
 
@@ -1386,6 +1505,7 @@ class Visit:
     def shrink(self, shrink_time, start=True):
         if start:
             self.real_start_time += shrink_time
+            self.model.index_visit(self)
         else:
             self.real_end_time -= shrink_time
 
@@ -1394,11 +1514,15 @@ class Visit:
         self.real_start_time += pp_time
         self.real_end_time += pp_time
 
+        self.model.index_visit(self)
+
 
     def anticipate(self, ant_time):
         self.real_start_time -= ant_time
         self.real_end_time -= ant_time
 
+        self.model.index_visit(self)
+
 
 
 class Manager(Agent):
@@ -1882,13 +2006,19 @@ class HCModel(Model):
             is_manager_working=True,
             manager_level=c.ROBUST,
             handle_delay=True,
-            high_skill_prob=c.HIGH_SKILL_PROB
+            high_skill_prob=c.HIGH_SKILL_PROB,
+            event_driven=False
         ):
         self.verbose = verbose
         self.debug = debug
         self.running = True
         self.is_broken = False
 
+        # event-driven mode: jump between event times instead of stepping every minute
+        self.event_driven = event_driven
+        self.event_queue = []
+        self.event_counter = itertools.count()
+
         self.next_patient_id = 0
         self.next_operator_id = 0
         self.next_visit_id = 0
@@ -1904,10 +2034,29 @@ class HCModel(Model):
 
         self.c_wage, self.c_movement, self.c_overskill, self.c_execution, self.sigma0, self.sigma1, self.omega = self._initialize_hyperparameters()
 
+        # id -> agent lookup table, filled as patients and operators are added
+        self.agent_lookup = {}
+
         self.graph = self._initialize_municipalities()
+        # dense commuting times and travel counters, indexed by (from, to) municipality
+        self.travel_times = self._initialize_travel_times()
+        self.n_travels = np.zeros((self.n_municipalities, self.n_municipalities), dtype=int)
         self.patients = self._initialize_patients()
         self.operators = self._initialize_operators()
         self.visits = self._initialize_visits()
+        self.visit_lookup = {visit.unique_id: visit for visit in self.visits}
+
+        # patient id -> visits, in the same order as self.visits
+        self.patient_visits = {}
+        for visit in self.visits:
+            self.patient_visits.setdefault(visit.patient_id, []).append(visit)
+
+        # operator id -> day -> visits sorted by real start time
+        # patient id -> day -> scheduled or executed visits
+        self.operator_schedules = {}
+        self.patient_schedules = {}
+        for visit in self.visits:
+            self.index_visit(visit)
 
         for pat in self.patients:
             pat._initialize_premium()
@@ -1960,11 +2109,11 @@ class HCModel(Model):
 
 
     def _initialize_hyperparameters(self):
-        # retrieve from model parameters
-        hp = u.retrieve_JSON(c.HYPERPARAMS_JSON)
+        # retrieve from model parameters (of the scenario in use)
+        hp = [c.C_WAGE, c.C_MOVEMENT, c.C_OVERSKILL, c.C_EXECUTION, c.SIGMA0, c.SIGMA1, c.OMEGA]
 
         # return C_WAGE, C_MOVEMENT, C_OVERSKILL, C_EXECUTION, SIGMA0, SIGMA1, OMEGA
-        return hp[c.C_WAGE], hp[c.C_MOVEMENT], hp[c.C_OVERSKILL], hp[c.C_EXECUTION], hp[c.SIGMA0], hp[c.SIGMA1], hp[c.OMEGA] 
+        return tuple(m.get_numeric_param(parameter) for parameter in hp)
 
 
     def _initialize_municipalities(self) -> nx.Graph:
@@ -1986,9 +2135,7 @@ class HCModel(Model):
                     graph.add_edge(
                         i,
                         j,
-                        weight=mun_distances[i][j],
-                        n_travels=0,
-                        muns = [i,j]
+                        weight=mun_distances[i][j]
                     )
         
         if self.verbose:
@@ -1997,6 +2144,13 @@ class HCModel(Model):
         return graph
 
 
+    def _initialize_travel_times(self) -> np.ndarray:
+        # symmetric matrix built from the upper triangle, as the edges of the graph
+        mun_distances = np.array(m.get_commuting_times(), dtype=int)
+        
+        return np.triu(mun_distances) + np.triu(mun_distances, 1).T
+
+
     def _initialize_patients(self) -> list[Patient]:
         # PATIENTS
         if self.verbose:
@@ -2012,6 +2166,7 @@ class HCModel(Model):
             patient = Patient(c.PAT_BASE_ID + i, self, municipality=patient_municipalities[i]-1, assigned_operator_id=c.OP_BASE_ID + assignments[i])
             patients.append(patient)
             self.schedule.add(patient)
+            self.agent_lookup[patient.unique_id] = patient
 
         self.next_patient_id = n_patients
 
@@ -2056,6 +2211,7 @@ class HCModel(Model):
 
             self.schedule.add(operator)
             operators.append(operator)
+            self.agent_lookup[operator.unique_id] = operator
 
         self.next_operator_id = n_operators
         
@@ -2164,11 +2320,7 @@ class HCModel(Model):
     # ------------ RETRIEVAL ------------
 
     def get_agent(self, agent_id):
-        for agent in self.schedule.agents:
-            if agent.unique_id == agent_id:
-                return agent
-        
-        return None
+        return self.agent_lookup.get(agent_id)
     
 
     def get_patient(self, patient_id) -> Patient:
@@ -2187,11 +2339,7 @@ class HCModel(Model):
         if visit_id < c.VISIT_BASE_ID:
             visit_id += c.VISIT_BASE_ID
 
-        for visit in self.visits:
-            if visit.unique_id == visit_id:
-                return visit
-        
-        return None
+        return self.visit_lookup.get(visit_id)
 
 
     def get_visit_duration_distribution(self, skill=0):
@@ -2239,6 +2387,39 @@ class HCModel(Model):
     # ------------ END RETRIEVAL ------------
 
 
+    # ------------ SCHEDULE INDEX ------------
+
+    def unindex_visit(self, visit : Visit):
+        if visit.schedule_key is not None:
+            op_id, day = visit.schedule_key
+            self.operator_schedules[op_id][day].remove(visit)
+            visit.schedule_key = None
+
+        if visit.patient_day is not None:
+            self.patient_schedules[visit.patient_id][visit.patient_day].remove(visit)
+            visit.patient_day = None
+
+
+    def index_visit(self, visit : Visit):
+        self.unindex_visit(visit)
+
+        if visit.is_removed or visit.state == c.NOT_SCHEDULED:
+            return
+
+        self.patient_schedules.setdefault(visit.patient_id, {}).setdefault(visit.real_day, []).append(visit)
+        visit.patient_day = visit.real_day
+
+        if visit.real_operator_id is None:
+            return
+
+        # ties on start time keep the insertion order of the visits
+        day_schedule = self.operator_schedules.setdefault(visit.real_operator_id, {}).setdefault(visit.real_day, [])
+        bisect.insort(day_schedule, visit, key=lambda v: (v.real_start_time, v.unique_id))
+        visit.schedule_key = (visit.real_operator_id, visit.real_day)
+
+    # ------------ END SCHEDULE INDEX ------------
+
+
     # ------------ ADD ------------
 
     def add_patient(self, municipality, premium=False, newly_generated=True) -> Patient:
@@ -2248,6 +2429,11 @@ class HCModel(Model):
 
         self.schedule.add(patient)
         self.patients.append(patient)
+        self.agent_lookup[patient.unique_id] = patient
+
+        if self.event_driven:
+            for event in c.PATIENT_EVENTS:
+                self.schedule_event(event, patient)
 
         if self.verbose:
             print("Patient " + str(patient.unique_id) + " added to municipality " + str(municipality))
@@ -2272,6 +2458,7 @@ class HCModel(Model):
 
         self.schedule.add(operator)
         self.operators.append(operator)
+        self.agent_lookup[operator.unique_id] = operator
         
         if self.verbose:
             print("Operator " + str(operator.unique_id) + " added to municipality " + str(municipality) + " with skill " + str(skill) + ", time " + str(time) + ", max time " + str(max_time) + ", availability " + str(availability) + ", start time " + str(start_time) + ", end time " + str(end_time))
@@ -2296,6 +2483,9 @@ class HCModel(Model):
         self.next_visit_id += 1
 
         self.visits.append(visit)
+        self.visit_lookup[visit.unique_id] = visit
+        self.patient_visits.setdefault(patient_id, []).append(visit)
+        self.index_visit(visit)
 
         if self.verbose:
             print_row = "Proposed visit " + str(visit.unique_id) + " added to patient " + str(patient_id) + " on " + u.print_day(day) + ", from " + u.print_time_in_minutes(start_time) + " to " + u.print_time_in_minutes(end_time) + ";"
@@ -2318,6 +2508,10 @@ class HCModel(Model):
         # remove visit from self.visits and move to self.removed_visits
         self.visits.remove(visit)
         self.removed_visits.append(visit)
+        del self.visit_lookup[visit.unique_id]
+        self.patient_visits[visit.patient_id].remove(visit)
+        visit.is_removed = True
+        self.unindex_visit(visit)
 
         # retrieve next visit for operator
         if day == self.current_day and (operator.state == c.IDLE or operator.state == c.UNAVAILABLE):
@@ -2327,6 +2521,10 @@ class HCModel(Model):
     def not_schedulable_visit(self, visit : Visit):
         self.visits.remove(visit)
         self.not_schedulable_visits.append(visit)
+        del self.visit_lookup[visit.unique_id]
+        self.patient_visits[visit.patient_id].remove(visit)
+        visit.is_removed = True
+        self.unindex_visit(visit)
 
     # ------------ END ADD ------------
 
@@ -2352,6 +2550,92 @@ class HCModel(Model):
     # ------------ END UNEXPECTED EVENTS ------------
 
 
+    # ------------ EVENT QUEUE ------------
+
+    # sample the next occurrence of a per-minute random event and push it in the queue
+    def schedule_event(self, event, agent=None):
+        if event == c.NEW_PATIENT_EVENT:
+            probability = self.p_new_patient
+        else:
+            probability = su.adjusted_probability(agent.event_probabilities()[event], self.current_day)
+
+        if event in c.OPERATOR_EVENTS:
+            if self.current_day == 4:
+                return
+            from_time, to_time = c.DEF_OP_START_TIME, c.DEF_OP_END_TIME
+        else:
+            from_time, to_time = c.DEF_PAT_START_TIME, c.DEF_PAT_END_TIME
+
+        event_time = su.sample_event_time(self.current_time, probability, from_time, to_time)
+
+        if event_time is not None:
+            heapq.heappush(self.event_queue, (event_time, next(self.event_counter), event, agent))
+
+
+    def schedule_day_events(self):
+        self.event_queue = []
+
+        self.schedule_event(c.NEW_PATIENT_EVENT)
+
+        for pat in self.patients:
+            if not pat.is_removed:
+                for event in c.PATIENT_EVENTS:
+                    self.schedule_event(event, pat)
+
+        for op in self.operators:
+            for event in c.OPERATOR_EVENTS:
+                self.schedule_event(event, op)
+
+
+    def next_event_time(self):
+        event_times = [op.next_event_time() for op in self.operators]
+
+        if len(self.event_queue) > 0:
+            event_times.append(self.event_queue[0][0])
+
+        # end of the working day and breaking time are checked as in the stepped mode
+        if self.current_time < c.DEF_OP_END_TIME:
+            event_times.append(c.DEF_OP_END_TIME)
+        event_times.append(c.BROKEN_TIME)
+
+        return int(min([t for t in event_times if t is not None and t > self.current_time]))
+
+
+    def process_events(self):
+        # model and patient events happen before operators act, operator events when they are idle
+        operator_events = []
+        while len(self.event_queue) > 0 and self.event_queue[0][0] == self.current_time:
+            _, _, event, agent = heapq.heappop(self.event_queue)
+
+            if event in c.OPERATOR_EVENTS:
+                operator_events.append((event, agent))
+                continue
+
+            if event == c.NEW_PATIENT_EVENT:
+                new_patient = self.generate_new_patient()
+                new_patient.generate_new_visit()
+            else:
+                agent.perform_event(event)
+
+            self.schedule_event(event, agent)
+
+        # operators are activated in random order, as in the scheduler
+        operators = list(self.operators)
+        np.random.shuffle(operators)
+        for op in operators:
+            op.step()
+
+        for event, op in operator_events:
+            if op.state == c.IDLE:
+                op.perform_event(event)
+            self.schedule_event(event, op)
+
+        self.schedule.steps += 1
+        self.schedule.time = self.current_time
+
+    # ------------ END EVENT QUEUE ------------
+
+
     # ------------ BEHAVIOR ------------
 
     def start_day(self):
@@ -2361,6 +2645,9 @@ class HCModel(Model):
         for op in self.operators:
             op.start_day()
 
+        if self.event_driven:
+            self.schedule_day_events()
+
 
     def step(self):
         if self.running:
@@ -2374,13 +2661,19 @@ class HCModel(Model):
             if self.current_time == -1:
                 self.start_day()
 
-            self.current_time += 1
+            if self.event_driven:
+                self.current_time = self.next_event_time()
+            else:
+                self.current_time += 1
             if self.verbose:
                 print(f"{u.print_day(self.current_day)}, {u.print_time_in_minutes(self.current_time)}")
 
-            self.model_unexpected_events()
+            if self.event_driven:
+                self.process_events()
+            else:
+                self.model_unexpected_events()
 
-            self.schedule.step()
+                self.schedule.step()
 
             if self.is_manager_working:
                 self.manager.step()
@@ -2584,8 +2877,8 @@ class HCModel(Model):
         pat2.assigned_operator_id = op1_id
 
         # retrieve all visits of pat1 and pat2
-        pat1_visits = [v for v in self.visits if v.patient_id == pat1_id]
-        pat2_visits = [v for v in self.visits if v.patient_id == pat2_id]
+        pat1_visits = pat1.own_visits()
+        pat2_visits = pat2.own_visits()
 
         # for each visit, remove it and try to reschedule with the other operator
         for v in pat1_visits:
@@ -0,0 +1,178 @@
+import os
+import json
+import shutil
+import zipfile
+import numpy as np
+
+import src.constants as c
+import src.utilities as u
+
+
+# the solution is saved as an uncompressed .npz: 0/1 arrays are bit-packed (with their shape aside),
+# other arrays and scalars are saved as they are
+SHAPE_SUFFIX = '_shape'
+
+_writes = {}
+
+
+def save_solution(output_data, npz_path=c.OUTPUT_NPZ):
+    arrays = {}
+    for name, value in output_data.items():
+        value = np.asarray(value)
+
+        if value.ndim > 0 and name in c.BINARY_OUTPUTS and np.isin(value, [0, 1]).all():
+            arrays[name] = np.packbits(value.astype(np.uint8).reshape(-1))
+            arrays[name + SHAPE_SUFFIX] = np.array(value.shape)
+        else:
+            arrays[name] = value
+
+    # replaced, not rewritten, so that arrays still mapped on the old file stay valid
+    # (np.savez would add its own extension to the temporary name)
+    tmp_path = npz_path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        np.savez(file, **arrays)
+    os.replace(tmp_path, npz_path)
+
+    path = os.path.abspath(npz_path)
+    _writes[path] = _writes.get(path, 0) + 1
+
+
+def copy_solution(from_path, npz_path=c.OUTPUT_NPZ):
+    tmp_path = npz_path + '.tmp'
+    shutil.copyfile(from_path, tmp_path)
+    os.replace(tmp_path, npz_path)
+
+    path = os.path.abspath(npz_path)
+    _writes[path] = _writes.get(path, 0) + 1
+
+
+# read-only view of a saved solution: every array is memory-mapped (or read) and unpacked only when asked for
+# the file is checked for changes only by refresh, so a view held by a caller does not change under it
+class Solution:
+    def __init__(self, npz_path):
+        self.npz_path = npz_path
+        self.abs_path = os.path.abspath(npz_path)
+
+        self.stamp = None
+        self.members = {}
+        self.values = {}
+
+
+    def file_stamp(self):
+        try:
+            stat = os.stat(self.npz_path)
+        except FileNotFoundError:
+            return None
+
+        # writes are counted as in u.save_JSON, for rewrites within the mtime resolution
+        return (stat.st_mtime_ns, stat.st_size, _writes.get(self.abs_path, 0))
+
+
+    def refresh(self):
+        stamp = self.file_stamp()
+        if stamp is not None and stamp == self.stamp:
+            return
+
+        self.stamp = stamp
+        self.values = {}
+        self.members = {}
+
+        if stamp is None:
+            return
+
+        with zipfile.ZipFile(self.npz_path) as archive:
+            for info in archive.infolist():
+                self.members[info.filename[:-len('.npy')]] = info
+
+
+    def member(self, name):
+        info = self.members[name]
+
+        # stored members can be mapped in place, after their local header and the .npy header
+        if info.compress_type == zipfile.ZIP_STORED:
+            with open(self.npz_path, 'rb') as file:
+                file.seek(info.header_offset + 26)
+                name_length, extra_length = np.frombuffer(file.read(4), dtype='<u2')
+                file.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+
+                version = np.lib.format.read_magic(file)
+                if version == (1, 0):
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+                else:
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+
+                # plain ndarray on the mapped memory, indexing a np.memmap is much slower
+                if len(shape) > 0 and np.prod(shape) > 0 and not dtype.hasobject:
+                    order = 'F' if fortran_order else 'C'
+                    return np.asarray(np.memmap(self.npz_path, dtype=dtype, mode='r', offset=file.tell(), shape=shape, order=order))
+
+        with np.load(self.npz_path) as npz:
+            return npz[name]
+
+
+    def __getitem__(self, name):
+        if name not in self.values:
+            if name not in self.members or name.endswith(SHAPE_SUFFIX):
+                raise KeyError(name)
+
+            value = self.member(name)
+            if name + SHAPE_SUFFIX in self.members:
+                shape = tuple(int(dim) for dim in self.member(name + SHAPE_SUFFIX))
+                value = np.unpackbits(value, count=int(np.prod(shape))).reshape(shape).astype(int)
+            elif value.ndim == 0:
+                value = value.item()
+
+            if isinstance(value, np.ndarray):
+                value.setflags(write=False)
+            self.values[name] = value
+
+        return self.values[name]
+
+
+    def __contains__(self, name):
+        return name in self.members and not name.endswith(SHAPE_SUFFIX)
+
+
+    def keys(self):
+        return [name for name in self.members if not name.endswith(SHAPE_SUFFIX)]
+
+
+_solutions = {}
+
+
+def load_solution(npz_path=c.OUTPUT_NPZ, json_path=c.OUTPUT_JSON) -> Solution:
+    if npz_path not in _solutions:
+        # a legacy JSON newer than the .npz (e.g. copied from an archive) is converted at the first load
+        if os.path.exists(json_path) and (not os.path.exists(npz_path) or os.path.getmtime(json_path) > os.path.getmtime(npz_path)):
+            json_to_npz(json_path, npz_path)
+
+        _solutions[npz_path] = Solution(npz_path)
+
+    solution = _solutions[npz_path]
+    solution.refresh()
+
+    return solution
+
+
+def clear_cache():
+    _solutions.clear()
+
+
+# converters from and to the legacy format
+def json_to_npz(json_path=c.OUTPUT_JSON, npz_path=c.OUTPUT_NPZ):
+    with open(json_path, 'r') as file:
+        output_data = json.load(file)
+
+    save_solution(output_data, npz_path)
+
+
+def npz_to_json(npz_path=c.OUTPUT_NPZ, json_path=c.OUTPUT_JSON):
+    solution = Solution(npz_path)
+    solution.refresh()
+
+    output_data = {}
+    for name in solution.keys():
+        value = solution[name]
+        output_data[name] = value.tolist() if isinstance(value, np.ndarray) else value
+
+    u.save_JSON(output_data, json_path)
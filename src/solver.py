@@ -0,0 +1,498 @@
+import time
+import numpy as np
+from scipy.optimize import milp, linprog, LinearConstraint, Bounds
+from scipy.sparse import csr_matrix, vstack
+
+import src.constants as c
+import src.scenario as sc
+import src.solution as sl
+
+
+def concat(blocks, dtype=float):
+    return np.concatenate(blocks) if len(blocks) > 0 else np.zeros(0, dtype=dtype)
+
+
+# sparse MILP under construction: columns and rows are appended in blocks
+class SparseModel:
+    def __init__(self):
+        self.n_vars = 0
+        self.costs = []
+        self.lower = []
+        self.upper = []
+        self.integrality = []
+
+        self.n_rows = 0
+        self.row_idx = []
+        self.col_idx = []
+        self.coefs = []
+        self.row_lower = []
+        self.row_upper = []
+
+        self.constant = 0
+
+
+    def add_variables(self, n, cost=0, lower=0, upper=1, integer=True) -> np.ndarray:
+        self.costs.append(np.broadcast_to(np.asarray(cost, dtype=float), (n,)))
+        self.lower.append(np.broadcast_to(np.asarray(lower, dtype=float), (n,)))
+        self.upper.append(np.broadcast_to(np.asarray(upper, dtype=float), (n,)))
+        self.integrality.append(np.full(n, int(integer)))
+
+        indexes = np.arange(self.n_vars, self.n_vars + n)
+        self.n_vars += n
+
+        return indexes
+
+
+    # rows given in coordinate form: row k of the block has the entries whose rows == k
+    def add_rows(self, n, rows, cols, coefs, lower=-np.inf, upper=np.inf) -> np.ndarray:
+        rows = np.asarray(rows, dtype=int)
+
+        self.row_idx.append(rows + self.n_rows)
+        self.col_idx.append(np.asarray(cols, dtype=int))
+        self.coefs.append(np.broadcast_to(np.asarray(coefs, dtype=float), rows.shape))
+        self.row_lower.append(np.broadcast_to(np.asarray(lower, dtype=float), (n,)))
+        self.row_upper.append(np.broadcast_to(np.asarray(upper, dtype=float), (n,)))
+
+        indexes = np.arange(self.n_rows, self.n_rows + n)
+        self.n_rows += n
+
+        return indexes
+
+
+    # variables with entries in the existing rows: column k of the block has the entries whose cols == k
+    def add_columns(self, n, rows, cols, coefs, cost=0, lower=0, upper=1, integer=True) -> np.ndarray:
+        indexes = self.add_variables(n, cost=cost, lower=lower, upper=upper, integer=integer)
+        cols = np.asarray(cols, dtype=int)
+
+        self.row_idx.append(np.asarray(rows, dtype=int))
+        self.col_idx.append(indexes[cols])
+        self.coefs.append(np.broadcast_to(np.asarray(coefs, dtype=float), cols.shape))
+
+        return indexes
+
+
+    def matrix(self):
+        return csr_matrix((concat(self.coefs), (concat(self.row_idx, int), concat(self.col_idx, int))), shape=(self.n_rows, self.n_vars))
+
+
+    def solve(self, time_limit=c.SOLVER_TIME_LIMIT, mip_gap=c.SOLVER_MIP_GAP, relax=False, verbose=False):
+        integrality = np.zeros(self.n_vars) if relax else concat(self.integrality, int)
+
+        return milp(
+            concat(self.costs),
+            integrality=integrality,
+            bounds=Bounds(concat(self.lower), concat(self.upper)),
+            constraints=[LinearConstraint(self.matrix(), concat(self.row_lower), concat(self.row_upper))] if self.n_rows > 0 else None,
+            options={'time_limit': time_limit, 'mip_rel_gap': mip_gap, 'disp': verbose}
+        )
+
+
+    # LP relaxation with the duals of the rows (objective change per unit of right hand side), which milp does not give
+    def solve_lp(self, time_limit=c.SOLVER_TIME_LIMIT, verbose=False):
+        matrix = self.matrix()
+        row_lower, row_upper = concat(self.row_lower), concat(self.row_upper)
+
+        # linprog takes equalities and upper bounds only: ranged rows are split
+        eq = row_lower == row_upper
+        ub = ~eq & np.isfinite(row_upper)
+        lb = ~eq & np.isfinite(row_lower)
+        res = linprog(
+            concat(self.costs),
+            A_ub=vstack((matrix[ub], -matrix[lb])), b_ub=np.concatenate((row_upper[ub], -row_lower[lb])),
+            A_eq=matrix[eq], b_eq=row_lower[eq],
+            bounds=np.column_stack((concat(self.lower), concat(self.upper))),
+            method='highs', options={'time_limit': time_limit, 'disp': verbose}
+        )
+
+        duals = np.zeros(self.n_rows)
+        if res.x is not None:
+            duals[eq] = res.eqlin.marginals
+            duals[ub] += res.ineqlin.marginals[:ub.sum()]
+            duals[lb] -= res.ineqlin.marginals[ub.sum():]
+
+        return res, duals
+
+
+# all the input data as 0-based arrays
+# feasible_patients replaces the stored ones for instances without assignments yet (then there are no previous ones)
+def load_instance(scenario=None, feasible_patients=None):
+    if scenario is None:
+        scenario = sc.load_scenario()
+
+    inst = {
+        'P': scenario[c.N_PATIENTS],
+        'O': scenario[c.N_OPERATORS],
+        'D': scenario[c.N_DAYS],
+        'commuting_time': scenario.array(c.COMM_TIME, dtype=int),
+        'pat_mun': scenario.array(c.PAT_MUNICIPALITY, dtype=int) - 1,
+        'op_mun': scenario.array(c.OP_MUNICIPALITY, dtype=int) - 1,
+        'op_skill': scenario.array(c.OP_SKILL, dtype=int),
+        'op_time': scenario.array(c.OP_TIME, dtype=int),
+        'op_max_time': scenario.array(c.OP_MAX_TIME, dtype=int),
+        'op_av': scenario.array(c.OP_AVAILABILITY, dtype=int),
+        'op_start': scenario.array(c.OP_START_TIME, dtype=int),
+        'op_end': scenario.array(c.OP_END_TIME, dtype=int),
+        'request': scenario.array(c.VISIT_REQUEST, dtype=int),
+        'skill': scenario.array(c.VISIT_SKILL, dtype=int),
+        'start': scenario.array(c.VISIT_START_TIME, dtype=int),
+        'end': scenario.array(c.VISIT_END_TIME, dtype=int),
+        'feasible': scenario.array(c.FEASIBLE_PATIENTS, dtype=int) if feasible_patients is None else np.array(feasible_patients, dtype=int),
+        'prev_ass': scenario.array(c.PREV_ASS, dtype=int) if feasible_patients is None else np.zeros((scenario[c.N_PATIENTS], scenario[c.N_OPERATORS]), dtype=int),
+        'bigM': scenario[c.BIG_M]
+    }
+
+    for hp in [c.C_WAGE, c.C_MOVEMENT, c.C_OVERSKILL, c.C_EXECUTION, c.SIGMA0, c.SIGMA1, c.OMEGA]:
+        inst[hp] = scenario[hp]
+
+    return inst
+
+
+# candidate visits: feasible operator, requested day
+def visit_candidates(inst):
+    o_idx, p_idx, d_idx = np.nonzero((inst['feasible'][:, :, None] == 1) & (inst['request'][None, :, :] == 1))
+    return o_idx, p_idx, d_idx
+
+
+# arcs allowed by the time constraints of new_hcp.mod, for the candidate visits of each operator-day
+def compatible_arcs(inst, o_idx, p_idx, d_idx):
+    ct = inst['commuting_time']
+    pat_mun = inst['pat_mun']
+    op_mun = inst['op_mun']
+    start = inst['start']
+    end = inst['end']
+
+    # visitStartConstraint indexes the commuting time with patientMunicipality[o], as in the .mod (clipped where OPL would fail)
+    home_mun_in_mod = pat_mun[np.minimum(o_idx, len(pat_mun) - 1)]
+    first_ok = inst['op_start'][o_idx, d_idx] + ct[op_mun[o_idx], home_mun_in_mod] <= start[p_idx, d_idx]
+    last_ok = end[p_idx, d_idx] + ct[pat_mun[p_idx], op_mun[o_idx]] <= inst['op_end'][o_idx, d_idx]
+
+    # pairs of visits in time order, for every day, then restricted to the candidates of the same operator
+    pair_ok = end[:, None, :] + ct[pat_mun[:, None], pat_mun[None, :]][:, :, None] <= start[None, :, :]
+    candidate_of = np.full((inst['O'], inst['P'], inst['D']), -1)
+    candidate_of[o_idx, p_idx, d_idx] = np.arange(len(o_idx))
+    is_candidate = candidate_of >= 0
+    o, p1, p2, d = np.nonzero(is_candidate[:, :, None, :] & is_candidate[:, None, :, :] & pair_ok[None, :, :, :])
+
+    return first_ok, last_ok, candidate_of[o, p1, d], candidate_of[o, p2, d]
+
+
+# candidates of each operator-day, with the matrix of the time-compatible (ordered) pairs among them
+def operator_days(inst, o_idx, p_idx, d_idx):
+    ct = inst['commuting_time']
+    pat_mun = inst['pat_mun']
+
+    # candidates come in (o, p, d) order, so sort them by (o, d)
+    order = np.lexsort((p_idx, d_idx, o_idx))
+    keys = o_idx[order] * inst['D'] + d_idx[order]
+    bounds = np.flatnonzero(np.diff(np.concatenate(([-1], keys, [-1]))))
+
+    for g in range(len(bounds) - 1):
+        group = order[bounds[g]:bounds[g+1]]
+        if len(group) < 2:
+            continue
+
+        d = d_idx[group[0]]
+        pats = p_idx[group]
+        compatible = inst['end'][pats, d][:, None] + ct[pat_mun[pats][:, None], pat_mun[pats][None, :]] <= inst['start'][pats, d][None, :]
+        np.fill_diagonal(compatible, False)
+
+        yield group, compatible
+
+
+def concat_indexes(blocks):
+    return np.concatenate(blocks) if len(blocks) > 0 else np.zeros(0, dtype=int)
+
+
+# whether going straight between two municipalities is never slower than stopping in a third one on the way
+def triangle_inequality(ct):
+    ct = np.asarray(ct)
+    return bool((ct[:, None, :] <= ct[:, :, None] + ct[None, :, :]).all())
+
+
+# with fixed visit times the route of an operator-day is the chain of its executed visits ordered by start time:
+# two consecutive visits must be time-compatible, and the chain must be closed by the home trips
+def compact_sets(inst):
+    pat_mun = inst['pat_mun']
+    o_idx, p_idx, d_idx = visit_candidates(inst)
+    first_ok, last_ok, arc_from, arc_to = compatible_arcs(inst, o_idx, p_idx, d_idx)
+
+    # every trip takes at least this long, so visits are busy until end + min_travel
+    min_travel = inst['commuting_time'].min()
+
+    # the visit following a in a chain that goes on to b is reached from a, and it reaches b directly only if the
+    # commuting times satisfy the triangle inequality (the int-rounded distances may not): otherwise it only ends
+    # before b starts
+    triangle = triangle_inequality(inst['commuting_time'])
+
+    clique_row, clique_visit = [], []
+    conflict_a, conflict_b = [], []
+    conflict_between, conflict_visit = [], []
+    travel_from, travel_to = [], []
+    between_travel, between_visit = [], []
+    n_cliques = 0
+    n_conflicts = 0
+    n_travels = 0
+    for group, compatible in operator_days(inst, o_idx, p_idx, d_idx):
+        d = d_idx[group[0]]
+        start = inst['start'][p_idx[group], d]
+        end = inst['end'][p_idx[group], d]
+        busy_end = end + min_travel
+
+        # visits busy at the start of another visit are pairwise conflicting: one row for each maximal set
+        members = (start[None, :] <= start[:, None]) & (start[:, None] < busy_end[None, :])
+        contained = np.all(members[:, None, :] <= members[None, :, :], axis=2)
+        identical = contained & contained.T
+        dominated = (contained & ~identical).any(axis=1) | np.triu(identical, 1).any(axis=0)
+        k, i = np.nonzero(members[~dominated])
+        clique_row.append(k + n_cliques)
+        clique_visit.append(group[i])
+        n_cliques += (~dominated).sum()
+
+        # visits that may lie between i and j in a chain: between[i, k, j]
+        reaching = compatible if triangle else end[:, None] <= start[None, :]
+        between = compatible[:, :, None] & reaching[None, :, :]
+
+        # remaining conflicts: i before j, j not reachable from i although not overlapping, so both are executed
+        # only with a visit in between (none if the triangle inequality holds)
+        overlapping = (start[:, None] < busy_end[None, :]) & (start[None, :] < busy_end[:, None])
+        i, j = np.nonzero(~(compatible | overlapping) & (start[:, None] < start[None, :]))
+        conflict_a.append(group[i])
+        conflict_b.append(group[j])
+        r, k = np.nonzero(between[i, :, j])
+        conflict_between.append(r + n_conflicts)
+        conflict_visit.append(group[k])
+        n_conflicts += len(i)
+
+        # arcs with a cost, paid when both visits are executed and none of the visits in between is
+        mun = pat_mun[p_idx[group]]
+        i, j = np.nonzero(compatible & (mun[:, None] != mun[None, :]))
+        travel_from.append(group[i])
+        travel_to.append(group[j])
+        t, k = np.nonzero(between[i, :, j])
+        between_travel.append(t + n_travels)
+        between_visit.append(group[k])
+        n_travels += len(i)
+
+    return {
+        'o_idx': o_idx, 'p_idx': p_idx, 'd_idx': d_idx,
+        'first_ok': first_ok, 'last_ok': last_ok,
+        'arc_from': arc_from, 'arc_to': arc_to,
+        'n_cliques': n_cliques, 'clique_row': concat_indexes(clique_row), 'clique_visit': concat_indexes(clique_visit),
+        'conflict_a': concat_indexes(conflict_a), 'conflict_b': concat_indexes(conflict_b),
+        'conflict_between': concat_indexes(conflict_between), 'conflict_visit': concat_indexes(conflict_visit),
+        'travel_from': concat_indexes(travel_from), 'travel_to': concat_indexes(travel_to),
+        'between_travel': concat_indexes(between_travel), 'between_visit': concat_indexes(between_visit)
+    }
+
+
+# assignment, execution, workload and overtime: the part shared by both formulations
+def add_assignment_variables(model, inst, o_idx, p_idx, d_idx):
+    P, O = inst['P'], inst['O']
+    op_skill = inst['op_skill']
+
+    wage = inst[c.C_WAGE] * (inst[c.SIGMA0] + op_skill * inst[c.SIGMA1])
+
+    # assignment
+    ass_o, ass_p = np.nonzero(inst['feasible'] == 1)
+    x = model.add_variables(len(ass_o), lower=inst['prev_ass'][ass_p, ass_o])
+    x_of = np.full((P, O), -1)
+    x_of[ass_p, ass_o] = x
+
+    # visit execution
+    exec_cost = -inst[c.C_EXECUTION] + inst[c.C_OVERSKILL] * (inst['skill'][p_idx, d_idx] < op_skill[o_idx])
+    z = model.add_variables(len(o_idx), cost=exec_cost)
+    model.constant += inst[c.C_EXECUTION] * inst['request'].sum()
+
+    # workload and overtime
+    w = model.add_variables(O, cost=wage, upper=inst['op_max_time'])
+    q = model.add_variables(O, cost=wage * inst[c.OMEGA], upper=np.inf)
+
+    # each patient is assigned to exactly one (feasible) operator
+    model.add_rows(P, ass_p, x, 1, lower=1, upper=1)
+
+    # visits only by the assigned operator
+    n = len(z)
+    model.add_rows(n, np.concatenate((np.arange(n), np.arange(n))), np.concatenate((z, x_of[p_idx, o_idx])), np.concatenate((np.ones(n), -np.ones(n))), upper=0)
+
+    # workload computation
+    duration = inst['end'][p_idx, d_idx] - inst['start'][p_idx, d_idx]
+    model.add_rows(O, np.concatenate((np.arange(O), o_idx)), np.concatenate((w, z)), np.concatenate((np.ones(O), -duration)), lower=0, upper=0)
+
+    # overtime computation
+    model.add_rows(O, np.concatenate((np.arange(O), np.arange(O))), np.concatenate((q, w)), np.concatenate((np.ones(O), -np.ones(O))), lower=-inst['op_time'])
+
+    return {
+        'x': x, 'ass_o': ass_o, 'ass_p': ass_p,
+        'z': z, 'o_idx': o_idx, 'p_idx': p_idx, 'd_idx': d_idx,
+        'w': w, 'q': q
+    }
+
+
+# new_hcp.mod as a sparse MILP: only feasible assignments, requested visits and time-compatible movements get a column
+def build_model(inst):
+    O, D = inst['O'], inst['D']
+    ct = inst['commuting_time']
+    pat_mun = inst['pat_mun']
+    model = SparseModel()
+
+    o_idx, p_idx, d_idx = visit_candidates(inst)
+    variables = add_assignment_variables(model, inst, o_idx, p_idx, d_idx)
+    z = variables['z']
+    n = len(z)
+
+    # movements
+    first_ok, last_ok, arc_from, arc_to = compatible_arcs(inst, o_idx, p_idx, d_idx)
+    first = np.flatnonzero(first_ok)
+    last = np.flatnonzero(last_ok)
+    y_first = model.add_variables(len(first))
+    y_last = model.add_variables(len(last))
+    from_mun = pat_mun[p_idx[arc_from]]
+    to_mun = pat_mun[p_idx[arc_to]]
+    y_arc = model.add_variables(len(arc_from), cost=inst[c.C_MOVEMENT] * ct[from_mun, to_mun] * (from_mun != to_mun))
+
+    # operators leave home at most once (if available) and come back at most once
+    op_day = o_idx * D + d_idx
+    model.add_rows(O * D, op_day[first], y_first, 1, upper=np.where(inst['op_av'].reshape(-1) == 1, 1, np.inf))
+    model.add_rows(O * D, op_day[last], y_last, 1, upper=1)
+
+    # executed visits are reached exactly once and left exactly once
+    model.add_rows(n, np.concatenate((first, arc_to, np.arange(n))), np.concatenate((y_first, y_arc, z)), np.concatenate((np.ones(len(first) + len(arc_to)), -np.ones(n))), lower=0, upper=0)
+    model.add_rows(n, np.concatenate((last, arc_from, np.arange(n))), np.concatenate((y_last, y_arc, z)), np.concatenate((np.ones(len(last) + len(arc_from)), -np.ones(n))), lower=0, upper=0)
+
+    return model, variables
+
+
+# chain conditions of compact_sets on the execution variables z, without the travel
+def add_chain_rows(model, z, sets):
+    # conflicting visits are not both executed
+    model.add_rows(sets['n_cliques'], sets['clique_row'], z[sets['clique_visit']], 1, upper=1)
+
+    conflict_a = sets['conflict_a']
+    n = len(conflict_a)
+    model.add_rows(
+        n,
+        np.concatenate((np.arange(n), np.arange(n), sets['conflict_between'])),
+        np.concatenate((z[conflict_a], z[sets['conflict_b']], z[sets['conflict_visit']])),
+        np.concatenate((np.ones(2 * n), -np.ones(len(sets['conflict_visit'])))),
+        upper=1
+    )
+
+    # a visit that cannot follow the home trip needs an executed visit before it, and the same at the end of the day
+    for ok, arc_in, arc_out in [(sets['first_ok'], sets['arc_to'], sets['arc_from']), (sets['last_ok'], sets['arc_from'], sets['arc_to'])]:
+        row_of = np.full(len(z), -1)
+        not_ok = np.flatnonzero(~ok)
+        row_of[not_ok] = np.arange(len(not_ok))
+        keep = row_of[arc_in] >= 0
+        model.add_rows(
+            len(not_ok),
+            np.concatenate((np.arange(len(not_ok)), row_of[arc_in[keep]])),
+            np.concatenate((z[not_ok], z[arc_out[keep]])),
+            np.concatenate((np.ones(len(not_ok)), -np.ones(keep.sum()))),
+            upper=0
+        )
+
+
+# compact formulation (model/compact_hcp.mod): no movement variables, only the chain conditions of compact_sets
+def build_compact_model(inst, sets=None):
+    ct = inst['commuting_time']
+    pat_mun = inst['pat_mun']
+    model = SparseModel()
+
+    if sets is None:
+        sets = compact_sets(inst)
+
+    variables = add_assignment_variables(model, inst, sets['o_idx'], sets['p_idx'], sets['d_idx'])
+    z = variables['z']
+
+    # travel between consecutive visits, continuous since its cost pushes it to its (integer) lower bound
+    travel_from = sets['travel_from']
+    travel_to = sets['travel_to']
+    from_mun = pat_mun[sets['p_idx'][travel_from]]
+    to_mun = pat_mun[sets['p_idx'][travel_to]]
+    t = model.add_variables(len(travel_from), cost=inst[c.C_MOVEMENT] * ct[from_mun, to_mun], integer=False)
+
+    add_chain_rows(model, z, sets)
+
+    # travel is paid when both visits are executed and none of the visits in between is
+    n = len(t)
+    model.add_rows(
+        n,
+        np.concatenate((np.arange(n), np.arange(n), np.arange(n), sets['between_travel'])),
+        np.concatenate((t, z[travel_from], z[travel_to], z[sets['between_visit']])),
+        np.concatenate((np.ones(n), -np.ones(2 * n), np.ones(len(sets['between_visit'])))),
+        lower=-1
+    )
+
+    return model, variables
+
+
+# solution in the same format as the output of the OPL model
+def solution_to_output(inst, variables, values, objective, gap):
+    P, O, D = inst['P'], inst['O'], inst['D']
+    values = np.round(values).astype(int)
+
+    assignment = np.zeros((P, O), dtype=int)
+    assignment[variables['ass_p'], variables['ass_o']] = values[variables['x']]
+
+    visit_execution = np.zeros((O, P, D), dtype=int)
+    visit_execution[variables['o_idx'], variables['p_idx'], variables['d_idx']] = values[variables['z']]
+
+    return {
+        c.OPTIMALITY_GAP: gap,
+        c.ASSIGNMENT: assignment.tolist(),
+        c.OP_WORKLOAD: values[variables['w']].tolist(),
+        c.OP_OVERTIME: values[variables['q']].tolist(),
+        c.VISIT_EXEC: visit_execution.tolist(),
+        c.OBJECTIVE: objective
+    }
+
+
+def solve(scenario=None, time_limit=c.SOLVER_TIME_LIMIT, mip_gap=c.SOLVER_MIP_GAP, formulation=c.DEF_FORMULATION, verbose=False):
+    inst = load_instance(scenario)
+
+    # build_model already has columns only for the time-compatible arcs
+    if formulation in [c.FULL_FORMULATION, c.ARCS_FORMULATION]:
+        model, variables = build_model(inst)
+    elif formulation == c.COMPACT_FORMULATION:
+        model, variables = build_compact_model(inst)
+    else:
+        raise Exception(f'Formulation {formulation} not valid')
+
+    if verbose:
+        print(f"Model with {model.n_vars} variables and {model.n_rows} constraints")
+
+    res = model.solve(time_limit=time_limit, mip_gap=mip_gap, verbose=verbose)
+
+    if res.x is None:
+        if verbose:
+            print(f"No solution found: {res.message}")
+        return {}
+
+    objective = round(float(res.fun) + model.constant, 2)
+    # relative to the whole objective as in CPLEX, HiGHS leaves out the constant
+    bound = float(res.mip_dual_bound) + model.constant if res.mip_dual_bound is not None else objective
+    gap = abs(objective - bound) / (1e-10 + abs(objective))
+
+    return solution_to_output(inst, variables, res.x, objective, gap)
+
+
+# same interface as processing.run, without CPLEX
+def run(time_limit=c.SOLVER_TIME_LIMIT, mip_gap=c.SOLVER_MIP_GAP, formulation=c.DEF_FORMULATION, verbose=False):
+    start_time = time.time()
+    json_data = solve(time_limit=time_limit, mip_gap=mip_gap, formulation=formulation, verbose=verbose)
+    exec_time = round(time.time() - start_time, 2)
+
+    if verbose:
+        print(f"Execution time: {exec_time} s")
+
+    json_data[c.EXECUTION_TIME] = exec_time
+    sl.save_solution(json_data)
+
+    if c.OBJECTIVE in json_data:
+        if verbose:
+            print(f"Objective: {json_data[c.OBJECTIVE]}")
+        return json_data[c.OBJECTIVE], json_data[c.OPTIMALITY_GAP], exec_time
+    else:
+        if verbose:
+            print("No solution found")
+        return False, False, exec_time
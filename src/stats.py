@@ -2,6 +2,8 @@ import src.constants as c
 import src.utilities as u
 
 import src.manipulation as m
+import src.scenario as sc
+import src.solution as sl
 
 import numpy as np
 
@@ -89,10 +91,10 @@ def operator_unit_wage(operator=None, verbose=False):
 
 def operator_not_executed_schedule(operator=None, input_data=None, output_data=None, verbose=False, condensed=True):
     if input_data is None:
-        input_data = u.merge_JSON_files(c.INPUT_JSON_PATHS)
+        input_data = sc.load_scenario().data()
     
     if output_data is None:
-        output_data = u.retrieve_JSON(c.OUTPUT_JSON)
+        output_data = sl.load_solution()
     
     days = m.get_num_days()
     patients = m.get_num_patients()
@@ -148,8 +150,8 @@ def operator_not_executed_schedule(operator=None, input_data=None, output_data=N
             print("-- All operators schedule --")
 
         operators = m.get_num_operators()
-        input_data = u.merge_JSON_files(c.INPUT_JSON_PATHS)
-        output_data = u.retrieve_JSON(c.OUTPUT_JSON)
+        input_data = sc.load_scenario().data()
+        output_data = sl.load_solution()
         
         schedules = []
         for o in range(operators):
@@ -163,10 +165,10 @@ def operator_not_executed_schedule(operator=None, input_data=None, output_data=N
 
 def operator_schedule(operator=None, input_data=None, output_data=None, verbose=False, condensed=True):
     if input_data is None:
-        input_data = u.merge_JSON_files(c.INPUT_JSON_PATHS)
+        input_data = sc.load_scenario().data()
     
     if output_data is None:
-        output_data = u.retrieve_JSON(c.OUTPUT_JSON)
+        output_data = sl.load_solution()
     
     days = m.get_num_days()
     patients = m.get_num_patients()
@@ -222,8 +224,8 @@ def operator_schedule(operator=None, input_data=None, output_data=None, verbose=
             print("-- All operators schedule --")
 
         operators = m.get_num_operators()
-        input_data = u.merge_JSON_files(c.INPUT_JSON_PATHS)
-        output_data = u.retrieve_JSON(c.OUTPUT_JSON)
+        input_data = sc.load_scenario().data()
+        output_data = sl.load_solution()
         
         schedules = []
         for o in range(operators):
@@ -819,6 +821,43 @@ def operator_not_executed_visits(operator=None, verbose=False):
         return not_executed_visits
 
 
+# feasibility of every (operator, patient) pair at once, broadcast over (operators x patients x days): an operator
+# can serve a patient if, on every requested day, it is available, skilled enough, and it can reach the patient
+# from home before the visit starts and get back home after it ends
+def feasible_patients_array(
+    visit_requests,
+    visit_start_times,
+    visit_end_times,
+    visit_skills,
+    op_municipalities,
+    pat_municipalities,
+    commuting_times,
+    op_availabilities,
+    op_start_times,
+    op_end_times,
+    op_skills
+):
+    requests = np.array(visit_requests) > 0
+    start_times = np.array(visit_start_times)
+    end_times = np.array(visit_end_times)
+    skills = np.array(visit_skills)
+
+    op_start_times = np.array(op_start_times)[:, None, :]
+    op_end_times = np.array(op_end_times)[:, None, :]
+
+    # commuting time from the home of each operator to each patient (municipalities are 1-based)
+    commute = np.array(commuting_times)[np.array(op_municipalities)[:, None] - 1, np.array(pat_municipalities)[None, :] - 1][:, :, None]
+
+    infeasible = requests[None, :, :] & (
+        (np.array(op_availabilities) == 0)[:, None, :]
+        | (skills[None, :, :] > np.array(op_skills)[:, None, None])
+        | (start_times[None, :, :] < op_start_times + commute)
+        | (end_times[None, :, :] > op_end_times - commute)
+    )
+
+    return (~infeasible.any(axis=2)).astype(int)
+
+
 def operator_feasible_patients(
     operator=None,
     visit_requests=None,
@@ -838,8 +877,6 @@ def operator_feasible_patients(
         if verbose:
             print(f"-- Operator {operator} feasible patients --")
 
-        n_patients = m.get_num_patients()
-        n_days = m.get_num_days()
         # feasible patients: patients that could be assigned to operators
 
         # criterion 1: operators must be available for each request of the patient
@@ -874,23 +911,19 @@ def operator_feasible_patients(
         if op_skill is None:
             op_skill = m.get_operator_param(c.OP_SKILL, operator)
 
-        feasible_patients = [1] * n_patients
-
-        for p in range(n_patients):
-            for d in range(n_days):
-                if visit_requests[p][d] > 0:
-                    if not op_availability[d]:
-                        feasible_patients[p] = 0
-                        break
-                    if visit_skills[p][d] > op_skill:
-                        feasible_patients[p] = 0
-                        break
-                    if visit_start_times[p][d] < op_start_times[d] + commuting_times[op_municipality-1][pat_municipalities[p]-1]:
-                        feasible_patients[p] = 0
-                        break
-                    if visit_end_times[p][d] > op_end_times[d] - commuting_times[op_municipality-1][pat_municipalities[p]-1]:
-                        feasible_patients[p] = 0
-                        break
+        feasible_patients = feasible_patients_array(
+            visit_requests,
+            visit_start_times,
+            visit_end_times,
+            visit_skills,
+            [op_municipality],
+            pat_municipalities,
+            commuting_times,
+            [op_availability],
+            [op_start_times],
+            [op_end_times],
+            [op_skill]
+        )[0].tolist()
         
         if verbose:
             print(f"Number of feasible patients: {sum(feasible_patients)}")
@@ -902,43 +935,53 @@ def operator_feasible_patients(
         if verbose:
             print("-- All operators feasible patients --")
 
-        n_operators = m.get_num_operators()
+        feasible_patients = feasible_patients_array(
+            m.get_visit_param(c.VISIT_REQUEST),
+            m.get_visit_param(c.VISIT_START_TIME),
+            m.get_visit_param(c.VISIT_END_TIME),
+            m.get_visit_param(c.VISIT_SKILL),
+            m.get_operator_param(c.OP_MUNICIPALITY),
+            m.get_patient_param(c.PAT_MUNICIPALITY),
+            m.get_commuting_times(),
+            m.get_operator_daily_param(c.OP_AVAILABILITY),
+            m.get_operator_daily_param(c.OP_START_TIME),
+            m.get_operator_daily_param(c.OP_END_TIME),
+            m.get_operator_param(c.OP_SKILL)
+        ).tolist()
+
+        if verbose:
+            for o, op_feasible_patients in enumerate(feasible_patients):
+                print(f"Operator {o}: {op_feasible_patients}")
+        
+        return feasible_patients
 
-        visit_requests = m.get_visit_param(c.VISIT_REQUEST)        
-        visit_start_times = m.get_visit_param(c.VISIT_START_TIME)
-        visit_end_times = m.get_visit_param(c.VISIT_END_TIME)
-        visit_skills = m.get_visit_param(c.VISIT_SKILL)
 
-        op_municipalities = m.get_operator_param(c.OP_MUNICIPALITY)
-        pat_municipalities = m.get_patient_param(c.PAT_MUNICIPALITY)
-        commuting_times = m.get_commuting_times()
+# feasible patients after the data of one operator (its row) or of the visits of one patient (its column) changed:
+# only that row or column is computed again
+def update_feasible_patients(feasible_patients, operator=None, patient=None, verbose=False):
+    feasible_patients = np.array(feasible_patients, dtype=int)
+
+    operators = slice(None) if operator is None else slice(operator, operator + 1)
+    patients = slice(None) if patient is None else slice(patient, patient + 1)
+
+    feasible_patients[operators, patients] = feasible_patients_array(
+        m.get_visit_param(c.VISIT_REQUEST)[patients],
+        m.get_visit_param(c.VISIT_START_TIME)[patients],
+        m.get_visit_param(c.VISIT_END_TIME)[patients],
+        m.get_visit_param(c.VISIT_SKILL)[patients],
+        m.get_operator_param(c.OP_MUNICIPALITY)[operators],
+        m.get_patient_param(c.PAT_MUNICIPALITY)[patients],
+        m.get_commuting_times(),
+        m.get_operator_daily_param(c.OP_AVAILABILITY)[operators],
+        m.get_operator_daily_param(c.OP_START_TIME)[operators],
+        m.get_operator_daily_param(c.OP_END_TIME)[operators],
+        m.get_operator_param(c.OP_SKILL)[operators]
+    )
 
-        op_availabilities = operator_availability(verbose=False)
-        op_start_times, op_end_times = operator_times(verbose=False)
-        op_skills = m.get_operator_param(c.OP_SKILL)
-
-        feasible_patients = []
-        for o in range(n_operators):
-            op_feasible_patients = operator_feasible_patients(
-                o,
-                visit_requests,
-                visit_start_times,
-                visit_end_times,
-                visit_skills,
-                op_municipalities[o],
-                pat_municipalities,
-                commuting_times,
-                op_availabilities[o],
-                op_start_times[o],
-                op_end_times[o],
-                op_skills[o]
-            )
+    if verbose:
+        print(f"Updated feasible patients of operator {operator}, patient {patient}")
 
-            if verbose:
-                print(f"Operator {o}: {op_feasible_patients}")
-            feasible_patients.append(op_feasible_patients)
-        
-        return feasible_patients
+    return feasible_patients.tolist()
         
 # --------------- END OPERATORS --------------- #
 
@@ -1454,34 +1497,30 @@ def municipality_time_from_others(municipality=None, commuting_times=None, verbo
 
 # --------------- END MUNICIPALITIES --------------- #
 
-def operator_availability_matrix(day=None):
-    time_units = u.get_time_units()
-    n_days = m.get_num_days()    
-    n_operators = m.get_num_operators()
-
-    availability_matrix = []    
-    for d in range(n_days):
-        daily_availability_array = [0] * time_units
-        for op_id in range(n_operators):
-            op_times = operator_times(op_id)
-            st_time = op_times[0][d]
-            end_time = op_times[1][d]
-
-            if st_time != c.DEF_OP_START_TIME:
-                st_time += c.TIME_UNIT
-            else:
-                st_time = c.DEF_PAT_START_TIME
-            
-            if end_time != c.DEF_OP_END_TIME:
-                end_time -= c.TIME_UNIT
-            else:
-                end_time = c.DEF_PAT_END_TIME
-                        
-            for t in range(st_time, end_time, c.TIME_UNIT):
-                t_index = (t - c.DEF_PAT_START_TIME) // c.TIME_UNIT
-                daily_availability_array[t_index] += 1
+# number of operators working in every time unit of the patients' day: (days x time units) array, built once
+# from the daily times of all the operators (an operator is counted from the unit after its start and until the
+# unit before its end, unless it works the whole day)
+def operator_availability_array(op_start_times=None, op_end_times=None):
+    if op_start_times is None or op_end_times is None:
+        op_start_times, op_end_times = operator_times()
+
+    start = np.array(op_start_times, dtype=int).reshape(len(op_start_times), m.get_num_days())
+    end = np.array(op_end_times, dtype=int).reshape(start.shape)
+
+    start = np.where(start != c.DEF_OP_START_TIME, start + c.TIME_UNIT, c.DEF_PAT_START_TIME)
+    end = np.where(end != c.DEF_OP_END_TIME, end - c.TIME_UNIT, c.DEF_PAT_END_TIME)
+
+    first = (start - c.DEF_PAT_START_TIME) // c.TIME_UNIT
+    last = first + np.maximum(-(-(end - start) // c.TIME_UNIT), 0)
 
-        availability_matrix.append(daily_availability_array)
+    units = np.arange(u.get_time_units())
+    working = (first[:, :, None] <= units) & (units < last[:, :, None])
+
+    return working.sum(axis=0)
+
+
+def operator_availability_matrix(day=None):
+    availability_matrix = operator_availability_array().tolist()
 
     if day is None:
         return availability_matrix
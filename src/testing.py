@@ -2,13 +2,17 @@ import src.constants as c
 import src.utilities as u
 import src.stats as s
 import src.manipulation as m
+import src.scenario as sc
 import src.processing as p
+import src.diagnostics as dg
+import src.workspace as ws
 
 import os
 import numpy as np
 import csv
 import random
 import math
+from concurrent.futures import ProcessPoolExecutor
 
 
 # --------------- HYPERPARAMETERS --------------- #
@@ -38,7 +42,7 @@ def generate_hyperparams(
     for i, hp in enumerate(c.HYPERPARAMS):
         hp_data[hp] = hp_values[i]
 
-    u.save_JSON(hp_data, c.HYPERPARAMS_JSON)
+    sc.write(hp_data, c.HYPERPARAMS_JSON)
 
     if verbose:
         print("Generated hyperparameters")
@@ -51,19 +55,21 @@ def generate_hyperparams(
 def generate_random_municipalities(
     n_municipalities=c.DEF_NUM_MUNICIPALITIES,
     min_time_dist=c.DEF_MIN_DIST,
-    max_time_dist=c.DEF_MAX_DIST
+    max_time_dist=c.DEF_MAX_DIST,
+    rng=None
 ):
+    rng = u.get_rng(rng)
     municipalities = [(0, 0)]
 
     for _ in range(n_municipalities - 1):
         while True:
             # generate a random angle in radians
-            angle = random.uniform(0, 2 * math.pi)
+            angle = rng.uniform(0, 2 * math.pi)
             # generate a random distance within the specified range
-            distance = random.uniform(min_time_dist, max_time_dist)
+            distance = rng.uniform(min_time_dist, max_time_dist)
             
             # randomly select a previous point index (excluding the last point)
-            prev_point_index = random.randint(0, len(municipalities) - 1)
+            prev_point_index = int(rng.choice(len(municipalities)))
             prev_x, prev_y = municipalities[prev_point_index]
             
             # calculate the new point's coordinates
@@ -90,7 +96,8 @@ def generate_municipalities(
     min_time_dist=c.DEF_MIN_DIST,
     max_time_dist=c.DEF_MAX_DIST,
     municipalities=None,
-    verbose=False
+    verbose=False,
+    rng=None
 ):
     if verbose:
         print(f"Generating {n_municipalities} municipalities")
@@ -98,7 +105,7 @@ def generate_municipalities(
     if municipalities is None:
         # generate one municipality at a time such that each time the closest one 
         # is at least min_time_dist away and at most max_time_dist away
-        municipalities = generate_random_municipalities(n_municipalities, min_time_dist, max_time_dist)
+        municipalities = generate_random_municipalities(n_municipalities, min_time_dist, max_time_dist, rng)
 
     # extract lats and lons from municipalities
     lats = [municipality[0] for municipality in municipalities]
@@ -108,12 +115,12 @@ def generate_municipalities(
     municipality_data[c.MUN_LATITUDE] = lats
     municipality_data[c.MUN_LONGITUDE] = lons
 
-    u.save_JSON(municipality_data, c.MUNICIPALITY_JSON)
+    sc.write(municipality_data, c.MUNICIPALITY_JSON)
 
     if verbose:
         print(f"Generated {n_municipalities} municipalities")
 
-    u.generate_commuting_matrix()
+    sc.write({c.COMM_TIME: u.compute_commuting_matrix(lats, lons)}, c.COMM_JSON)
 
     if verbose:
         print("Generated commuting matrix")
@@ -125,7 +132,8 @@ def generate_municipalities(
 
 # --------------- PATIENTS --------------- #
 
-def generate_uniform_municipalities(n_people, municipality_prob_distr):
+def generate_uniform_municipalities(n_people, municipality_prob_distr, rng=None):
+    rng = u.get_rng(rng)
     municipalities = []
     
     # multiply each probability by the number of people
@@ -143,7 +151,7 @@ def generate_uniform_municipalities(n_people, municipality_prob_distr):
         municipalities.extend([i] * p)
     
     # shuffle the list
-    random.shuffle(municipalities)
+    rng.shuffle(municipalities)
 
     return municipalities
 
@@ -160,8 +168,11 @@ def generate_patients(
     uniform=True,
     municipality_prob_distr=None,
     municipalities=None,
-    verbose=False
+    verbose=False,
+    rng=None
 ):
+    rng = u.get_rng(rng)
+
     if verbose:
         print(f"Generating {n_patients} patients")
 
@@ -176,17 +187,17 @@ def generate_patients(
         elif municipality_prob_distr is True:
             municipality_prob_distr = mun_prob_distr_from_comm_matrix()
         if uniform:
-            municipalities = generate_uniform_municipalities(n_patients, municipality_prob_distr)
+            municipalities = generate_uniform_municipalities(n_patients, municipality_prob_distr, rng)
         else:
             # generate municipality for each patient
-            municipalities = np.random.choice(np.arange(n_municipalities), n_patients, p=municipality_prob_distr).tolist()
+            municipalities = rng.choice(np.arange(n_municipalities), n_patients, p=municipality_prob_distr).tolist()
 
         # add 1 to each municipality index to match the ones in the commuting matrix
         municipalities = [municipality + 1 for municipality in municipalities]
 
     patient_data[c.PAT_MUNICIPALITY] = municipalities
 
-    u.save_JSON(patient_data, c.PATIENT_JSON)
+    sc.write(patient_data, c.PATIENT_JSON)
 
     if verbose:
         print(f"Generated {n_patients} patients")
@@ -196,7 +207,7 @@ def generate_patients(
 
 # --------------- OPERATORS --------------- #
 
-def generate_uniform_skills(n_operators, skill_prob_distr):
+def generate_uniform_skills(n_operators, skill_prob_distr, rng=None):
     # assume that there are only 2 levels of skill
     high_level = 1 / skill_prob_distr[1]
 
@@ -206,12 +217,12 @@ def generate_uniform_skills(n_operators, skill_prob_distr):
         skills.append(int(op % high_level == 0))
 
     # shuffle the list
-    random.shuffle(skills)
+    u.get_rng(rng).shuffle(skills)
 
     return skills
 
 
-def generate_uniform_times(n_operators, min_base_time, max_base_time, skills):
+def generate_uniform_times(n_operators, min_base_time, max_base_time, skills, rng=None):
     # divide both times by DEF_BASE_TIME_UNIT to get the number of time units
     min_base_hours = min_base_time // c.DEF_BASE_TIME_UNIT
     max_base_hours = max_base_time // c.DEF_BASE_TIME_UNIT
@@ -232,8 +243,9 @@ def generate_uniform_times(n_operators, min_base_time, max_base_time, skills):
         high_level_times.append(times.pop())
 
     # shuffle both lists
-    random.shuffle(times)
-    random.shuffle(high_level_times)
+    rng = u.get_rng(rng)
+    rng.shuffle(times)
+    rng.shuffle(high_level_times)
 
     # merge the two lists by inserting the high level times in the positions specified by high_level_indexes
     for i, time in zip(high_level_indexes, high_level_times):
@@ -242,20 +254,22 @@ def generate_uniform_times(n_operators, min_base_time, max_base_time, skills):
     return times
 
 
-def generate_random_times(n_operators, min_base_time, max_base_time):
+def generate_random_times(n_operators, min_base_time, max_base_time, rng=None):
     # divide both times by DEF_BASE_TIME_UNIT to get the number of time units
     min_base_hours = min_base_time // c.DEF_BASE_TIME_UNIT
     max_base_hours = max_base_time // c.DEF_BASE_TIME_UNIT
     time_units = max_base_hours - min_base_hours
 
     # generate a list of n_operators random numbers between 0 and time_units
-    times = np.random.randint(time_units, size=n_operators)
+    times = u.get_rng(rng).choice(time_units, size=n_operators)
     times = (times + min_base_hours) * c.DEF_BASE_TIME_UNIT
 
     return times    
 
 
-def generate_uniform_availabilities(n_operators, n_days, av_perc, skills):
+def generate_uniform_availabilities(n_operators, n_days, av_perc, skills, rng=None):
+    rng = u.get_rng(rng)
+
     # generate a n_days x n_operators matrix of ones
     availabilities = np.ones((n_days, n_operators))
 
@@ -263,7 +277,7 @@ def generate_uniform_availabilities(n_operators, n_days, av_perc, skills):
 
     # for each row, set unavailable_per_day random element to 0
     for row in availabilities:
-        indices = random.sample(range(n_operators), unavailable_per_day)
+        indices = rng.choice(n_operators, unavailable_per_day, replace=False)
         for index in indices:
             row[index] = 0
 
@@ -277,7 +291,9 @@ def generate_uniform_availabilities(n_operators, n_days, av_perc, skills):
     return availabilities
 
 
-def generate_uniform_perturbations(n_operators, n_days, time_pert, time_pert_distr):
+def generate_uniform_perturbations(n_operators, n_days, time_pert, time_pert_distr, rng=None):
+    rng = u.get_rng(rng)
+
     # generate a n_days x n_operators matrix of zeros
     perturbations = np.zeros((n_days, n_operators))
 
@@ -294,7 +310,7 @@ def generate_uniform_perturbations(n_operators, n_days, time_pert, time_pert_dis
             index += time_pert_numbers[j]
 
         # shuffle row
-        np.random.shuffle(row)
+        rng.shuffle(row)
 
     perturbations = perturbations.T
 
@@ -330,8 +346,11 @@ def generate_operators(
     end_time_pert_distr=c.DEF_END_TIME_PERT_DISTR,
     start_times=None,
     end_times=None,
-    verbose=False
+    verbose=False,
+    rng=None
 ):
+    rng = u.get_rng(rng)
+
     if verbose:
         print(f"Generating {n_operators} operators")
 
@@ -346,27 +365,27 @@ def generate_operators(
             municipality_prob_distr = mun_prob_distr_from_comm_matrix()
 
         if uniform_mun:
-            municipalities = generate_uniform_municipalities(n_operators, municipality_prob_distr)
+            municipalities = generate_uniform_municipalities(n_operators, municipality_prob_distr, rng)
         else:
             # generate municipality for each operator
-            municipalities = np.random.choice(np.arange(n_municipalities), n_operators, p=municipality_prob_distr).tolist()
+            municipalities = rng.choice(np.arange(n_municipalities), n_operators, p=municipality_prob_distr).tolist()
 
         municipalities = [municipality + 1 for municipality in municipalities]
 
     # skills
     if skills is None:
         if uniform_skill:
-            skills = generate_uniform_skills(n_operators, skill_prob_distr)
+            skills = generate_uniform_skills(n_operators, skill_prob_distr, rng)
         else:
             # skill: either 0 or 1 with probability skill_distr
-            skills = np.random.choice(np.arange(len(skill_prob_distr)), n_operators, p=skill_prob_distr).tolist()
+            skills = rng.choice(np.arange(len(skill_prob_distr)), n_operators, p=skill_prob_distr).tolist()
             
     # times
     if times is None:
         if uniform_time:
-            times = generate_uniform_times(n_operators, min_base_time, max_base_time, skills)
+            times = generate_uniform_times(n_operators, min_base_time, max_base_time, skills, rng)
         else:
-            times = generate_random_times(n_operators, min_base_time, max_base_time)
+            times = generate_random_times(n_operators, min_base_time, max_base_time, rng)
 
 
     # max_times
@@ -375,10 +394,10 @@ def generate_operators(
     # availabilities
     if availabilities is None:
         if uniform_av:
-            availabilities = generate_uniform_availabilities(n_operators, n_days, av_perc, skills)
+            availabilities = generate_uniform_availabilities(n_operators, n_days, av_perc, skills, rng)
         else:
             # availability: 1 with probability av_perc
-            availabilities = np.random.choice([0, 1], (n_operators, n_days), p=[1 - av_perc, av_perc])
+            availabilities = rng.choice([0, 1], (n_operators, n_days), p=[1 - av_perc, av_perc])
 
         # convert to int each element
         availabilities = [[int(av) for av in row] for row in availabilities]
@@ -387,11 +406,11 @@ def generate_operators(
     if start_times is None:
         start_times = [[c.DEF_OP_START_TIME] * n_days] * n_operators
         if uniform_st:
-            start_time_pert = generate_uniform_perturbations(n_operators, n_days, time_pert, start_time_pert_distr)
+            start_time_pert = generate_uniform_perturbations(n_operators, n_days, time_pert, start_time_pert_distr, rng)
             start_times = np.add(start_times, start_time_pert).tolist()
         else:
             # random sample from start_time_pert_distr
-            start_time_pert = np.random.choice(np.arange(len(start_time_pert_distr)), n_operators, p=start_time_pert_distr).tolist()
+            start_time_pert = rng.choice(np.arange(len(start_time_pert_distr)), n_operators, p=start_time_pert_distr).tolist()
             start_times = np.add(start_times, start_time_pert).tolist()
 
         # convert to int
@@ -401,11 +420,11 @@ def generate_operators(
     if end_times is None:
         end_times = [[c.DEF_OP_END_TIME] * n_days] * n_operators
         if uniform_et:
-            end_time_pert = generate_uniform_perturbations(n_operators, n_days, time_pert, end_time_pert_distr)
+            end_time_pert = generate_uniform_perturbations(n_operators, n_days, time_pert, end_time_pert_distr, rng)
             end_times = np.subtract(end_times, end_time_pert).tolist()
         else:
             # random sample from end_time_pert_distr
-            end_time_pert = np.random.choice(np.arange(len(end_time_pert_distr)), n_operators, p=end_time_pert_distr).tolist()
+            end_time_pert = rng.choice(np.arange(len(end_time_pert_distr)), n_operators, p=end_time_pert_distr).tolist()
             end_times = np.subtract(end_times, end_time_pert).tolist()
 
         # convert to int
@@ -420,7 +439,7 @@ def generate_operators(
     for i, op_data in enumerate(c.ALL_OP_PARAMS):
         operator_data[op_data] = operator_values[i]
 
-    u.save_JSON(operator_data, c.OPERATOR_JSON)
+    sc.write(operator_data, c.OPERATOR_JSON)
 
     if verbose:
         print(f"Generated {n_operators} operators")
@@ -429,7 +448,7 @@ def generate_operators(
 
 # --------------- VISITS --------------- #
 
-def generate_uniform_care_plan_hours(n_patients, care_plan_hours_distr):
+def generate_uniform_care_plan_hours(n_patients, care_plan_hours_distr, rng=None):
     care_plan_hours_numbers = [int(cphd * n_patients) for cphd in care_plan_hours_distr]
 
     if sum(care_plan_hours_numbers) < n_patients:
@@ -440,116 +459,174 @@ def generate_uniform_care_plan_hours(n_patients, care_plan_hours_distr):
     for i, cphn in enumerate(care_plan_hours_numbers):
         care_plan_hours.extend([i + 1] * cphn)
 
-    random.shuffle(care_plan_hours)
+    u.get_rng(rng).shuffle(care_plan_hours)
 
     return care_plan_hours
 
 
-def generate_care_plan_info(care_plan_hours, n_days, verbose=False):
+# start times a care plan can be given: every visit must end within the patients' day
+def care_plan_start_times(visit_durations):
+    return np.arange(c.DEF_PAT_START_TIME, c.DEF_PAT_END_TIME - max(visit_durations) + 1, c.TIME_UNIT)
+
+
+# start time units (of the patients' day) at which every visit of a care plan fits: free is a (days x time
+# units) boolean array of the units where one more visit fits, and a start is valid if all the units covered
+# by the visit of each day are free
+def valid_start_slots(free, days, visit_durations):
+    valid = np.ones(len(care_plan_start_times(visit_durations)), dtype=bool)
+
+    # busy units before each unit: the busy units of a window are a difference of two of them
+    busy = np.concatenate((np.zeros((free.shape[0], 1), dtype=int), np.cumsum(~free, axis=1)), axis=1)
+
+    for d, duration in zip(days, visit_durations):
+        length = duration // c.TIME_UNIT
+        valid &= busy[d, length:length + len(valid)] == busy[d, :len(valid)]
+
+    return valid
+
+
+# what the operators can reach: skill and availability of every operator, and for every operator, patient and day
+# the earliest start and the latest end of a visit reaching the patient from home and getting back in time
+def operator_reach(pat_municipalities=None):
+    if pat_municipalities is None:
+        pat_municipalities = m.get_patient_param(c.PAT_MUNICIPALITY)
+
+    # commuting time from the home of each operator to each patient (municipalities are 1-based)
+    commute = np.array(m.get_commuting_times())[np.array(m.get_operator_param(c.OP_MUNICIPALITY))[:, None] - 1, np.array(pat_municipalities)[None, :] - 1]
+
+    return {
+        'skill': np.array(m.get_operator_param(c.OP_SKILL)),
+        'available': np.array(m.get_operator_daily_param(c.OP_AVAILABILITY)) > 0,
+        'ready': np.array(m.get_operator_daily_param(c.OP_START_TIME))[:, None, :] + commute[:, :, None],
+        'deadline': np.array(m.get_operator_daily_param(c.OP_END_TIME))[:, None, :] - commute[:, :, None]
+    }
+
+
+# start times at which some operator with the skill, available on all the days of the care plan, can execute
+# all its visits to patient
+def reachable_start_slots(reach, patient, skill, days, visit_durations):
+    times = care_plan_start_times(visit_durations)
+    operators = np.flatnonzero((reach['skill'] >= skill) & reach['available'][:, days].all(axis=1))
+
+    earliest = reach['ready'][operators, patient][:, days].max(axis=1)
+    latest = (reach['deadline'][operators, patient][:, days] - np.array(visit_durations)).min(axis=1)
+
+    return ((earliest[:, None] <= times) & (times <= latest[:, None])).any(axis=0)
+
+
+# whether some operator can execute all the visits of patient (the feasibility of stats.feasible_patients_array)
+def patient_reachable(reach, patient, requests, skills, start_times, end_times):
+    days = np.flatnonzero(np.array(requests) > 0)
+
+    able = (reach['available'][:, days]
+            & (reach['skill'][:, None] >= np.array(skills)[days])
+            & (reach['ready'][:, patient, days] <= np.array(start_times)[days])
+            & (np.array(end_times)[days] <= reach['deadline'][:, patient, days]))
+
+    return bool(able.all(axis=1).any())
+
+
+# days of a care plan covered by an operator able to serve the patient, when the days drawn at random are not:
+# the operators are tried in random order, drawing the days among the ones they work (in random order as the
+# durations), first with the visit durations drawn and then splitting the same hours into fewer visits
+def repair_care_plan_days(reach, free, patient, skill, cph, visit_durations, rng=None):
+    rng = u.get_rng(rng)
+    options = [visit_durations] + sorted([o for o in c.CARE_PLAN_VISIT_DURATIONS[cph] if len(o) < len(visit_durations)], key=len, reverse=True)
+
+    for durations in options:
+        operators = np.flatnonzero((reach['skill'] >= skill) & (reach['available'].sum(axis=1) >= len(durations)))
+
+        for o in rng.permutation(operators):
+            days = sorted(rng.choice(np.flatnonzero(reach['available'][o]), len(durations), replace=False).tolist())
+            shuffled = rng.permutation(durations).tolist()
+            valid = valid_start_slots(free, days, shuffled) & reachable_start_slots(reach, patient, skill, days, shuffled)
+            if valid.any():
+                return shuffled, days, valid
+
+    return visit_durations, None, None
+
+
+def generate_care_plan_info(care_plan_hours, n_days, premium=None, availability=None, reach=None, verbose=False, rng=None):
+    rng = u.get_rng(rng)
     care_plan_visit_durations = []
     care_plan_days = []
     care_plan_times = []
+    repairs = 0
+
+    # operators available in every time unit and what they can reach, computed once for the instance
+    if availability is None:
+        availability = s.operator_availability_array()
+
+    if reach is None:
+        reach = operator_reach()
+
+    if premium is None:
+        premium = [0] * len(care_plan_hours)
 
     time_units = u.get_time_units()
-    visit_matrix = np.zeros((n_days, time_units))
-
-    for cph in care_plan_hours:
-        if cph == 1:
-            visit_durations = [60]
-        elif cph == 2:
-            visit_durations = [60, 60]
-        elif cph == 3:
-            # randomize between 3 visits of 60 minutes or 2 of 90
-            if np.random.choice([0, 1]):
-                visit_durations = [60, 60, 60]
-            else:
-                visit_durations = [90, 90]
-        elif cph == 4:
-            choice = np.random.choice([0, 1, 2])
-            if choice == 0:
-                visit_durations = [60, 60, 60, 60]
-            elif choice == 1:
-                visit_durations = [90, 90, 60]
-            else:
-                visit_durations = [120, 120]
-        elif cph == 5:
-            choice = np.random.choice([0, 1, 2, 3])
-            if choice == 0:
-                visit_durations = [60, 60, 60, 60, 60]
-            elif choice == 1:
-                visit_durations = [90, 90, 60, 60]
-            elif choice == 2:
-                visit_durations = [120, 90, 90]
-            else:
-                visit_durations = [150, 150]
+    visit_matrix = np.zeros((n_days, time_units), dtype=int)
+
+    for patient, cph in enumerate(care_plan_hours):
+        # randomize between the ways to split the hours into visits
+        options = c.CARE_PLAN_VISIT_DURATIONS[cph]
+        visit_durations = options[rng.choice(np.arange(len(options)))] if len(options) > 1 else options[0]
 
         if verbose:
             print(f"Care plan hours: {cph}, visit durations: {visit_durations}")
 
-        # generate as many random days (all different) as there are visits
-        days = np.random.choice(np.arange(n_days), len(visit_durations), replace=False).tolist()
+        # generate as many random days (all different) as there are visits, the durations in random order over them
+        days = sorted(rng.choice(np.arange(n_days), len(visit_durations), replace=False).tolist())
+        visit_durations = rng.permutation(visit_durations).tolist()
 
         if verbose:
             print(f"Days: {days}")
 
-        care_plan_visit_durations.append(visit_durations)
-        care_plan_days.append(days)
+        # a visit fits in a time unit if fewer visits than available operators overlap there, and a start time is
+        # valid if some operator able to serve the patient reaches all its visits: the start times valid on all
+        # the days of the care plan are found at once, and one of them is drawn
+        free = visit_matrix < availability
+        valid = valid_start_slots(free, days, visit_durations) & reachable_start_slots(reach, patient, premium[patient], days, visit_durations)
 
-        tries = 0
-        ok = False
-
-        # while loop to be interrupted either if tries >= MAX_TRIES or if ok == True
-        while tries < c.MAX_TRIES and not ok:
-            # propose a time for the visits
-            time = int(np.random.choice(np.arange(c.DEF_PAT_START_TIME, c.DEF_PAT_END_TIME - max(visit_durations) + 1, c.TIME_UNIT)))
-            ok = True
+        # only this patient is repaired, with days that an operator able to serve it works
+        if not valid.any():
+            visit_durations, days, valid = repair_care_plan_days(reach, free, patient, premium[patient], cph, visit_durations, rng)
+            repairs += 1
 
             if verbose:
-                print(f"Proposed time: {time}")
-            
-            # get its index in the visit matrix array
-            t_index = (time - c.DEF_PAT_START_TIME) // c.TIME_UNIT
+                print(f"Repaired visit durations: {visit_durations}, days: {days}")
 
-            for i in range(len(days)):
-                # retrieve how many operators are available at that time
-                op_av_array = s.operator_availability_matrix(days[i])
+            if days is None:
+                print(visit_matrix)
+                raise ValueError(f"Could not find a suitable time for the care plan of patient {patient}")
 
-                if verbose:
-                    print(f"Check for day {days[i]} and visit duration {visit_durations[i]}")
-                
-                # for each of the time units that the visit lasts, check if there are enough operators available
-                for j in range(t_index, t_index + (visit_durations[i] // c.TIME_UNIT)):
-                    if verbose:
-                        print(f"Index j: {j}")
-                        print(f"Number of overlapping visits in that time unit: {visit_matrix[days[i]][j]}")
-                        print(f"Number of available operators in that time unit: {op_av_array[j]}")
-                    if visit_matrix[days[i]][j] == op_av_array[j]:
-                        ok = False
-            
-            if ok == False:
-                tries += 1
+        if verbose:
+            print(f"Valid start times: {(c.DEF_PAT_START_TIME + c.TIME_UNIT * np.flatnonzero(valid)).tolist()}")
+
+        care_plan_visit_durations.append(visit_durations)
+        care_plan_days.append(days)
+
+        t_index = int(rng.choice(np.flatnonzero(valid)))
+        time = c.DEF_PAT_START_TIME + t_index * c.TIME_UNIT
+
+        for d, duration in zip(days, visit_durations):
+            visit_matrix[d, t_index:t_index + duration // c.TIME_UNIT] += 1
 
-        if tries == c.MAX_TRIES:
-            print(visit_matrix)
-            raise ValueError("Could not find a suitable time for the care plan")
-        else:
-            for i in range(len(days)):
-                for j in range(t_index, t_index + (visit_durations[i] // c.TIME_UNIT)):
-                    visit_matrix[days[i]][j] += 1
-        
         care_plan_times.append(time)
+
+    if verbose:
+        print(f"Repaired care plans: {repairs}")
     
-    return list(zip(care_plan_visit_durations, care_plan_days, care_plan_times))
+    return list(zip(care_plan_visit_durations, care_plan_days, care_plan_times)), repairs
 
 
-def generate_uniform_premium(n_patients, premium_perc):
+def generate_uniform_premium(n_patients, premium_perc, rng=None):
     premium_numbers = [n_patients - int(premium_perc * n_patients), int(premium_perc * n_patients)]
     premium = []
 
     for i, pn in enumerate(premium_numbers):
         premium.extend([i] * pn)
 
-    random.shuffle(premium)
+    u.get_rng(rng).shuffle(premium)
 
     return premium
 
@@ -561,8 +638,11 @@ def generate_care_plans(
     uniform_premium=True,
     premium_perc=c.DEF_PREMIUM_PERC,
     premium=None,
-    verbose=True
+    reach=None,
+    verbose=True,
+    rng=None
 ):
+    rng = u.get_rng(rng)
     n_patients = m.get_num_patients()
     if verbose:
         print(f"Generating {n_patients} care plans")
@@ -572,44 +652,53 @@ def generate_care_plans(
 
     if care_plan_hours is None:
         if uniform_cph:
-            care_plan_hours = generate_uniform_care_plan_hours(n_patients, care_plan_hours_distr)
+            care_plan_hours = generate_uniform_care_plan_hours(n_patients, care_plan_hours_distr, rng)
         else:
-            care_plan_hours = np.random.choice(np.arange(len(care_plan_hours_distr)), n_patients, p=care_plan_hours_distr).tolist()
-
-    care_plan_info = generate_care_plan_info(care_plan_hours, n_days)
+            care_plan_hours = rng.choice(np.arange(len(care_plan_hours_distr)), n_patients, p=care_plan_hours_distr).tolist()
 
     # each patient is either a premium patient or not
     if premium is None:
         if uniform_premium:
-            premium = generate_uniform_premium(n_patients, premium_perc)
+            premium = generate_uniform_premium(n_patients, premium_perc, rng)
         else:
-            premium = np.random.choice([0, 1], n_patients, p=[1 - premium_perc, premium_perc]).tolist()
+            premium = rng.choice([0, 1], n_patients, p=[1 - premium_perc, premium_perc]).tolist()
+
+    # the times of the visits of premium patients must be reachable by operators with skill
+    care_plan_info, repairs = generate_care_plan_info(care_plan_hours, n_days, premium=premium, reach=reach, rng=rng)
 
     care_plans = list(zip(care_plan_info, premium))
 
     if verbose:
         print(f"Generated {n_patients} care plans")
 
-    return care_plans
+    return care_plans, repairs
 
 
-def random_increase_skills(n_patients, n_days, requests, skills, n_increases, verbose=False):
+# random visits to increase the skill of: with reach (and the visit times), only the ones leaving the patient
+# an operator able to execute all its visits
+def random_increase_skills(n_patients, n_days, requests, skills, n_increases, reach=None, start_times=None, end_times=None, verbose=False, rng=None):
     if verbose:
         print(f"Increasing {n_increases} visit skills")
 
     to_be_increased = []
+    increased_skills = [list(patient_skills) for patient_skills in skills]
+    candidates = [(p, d) for p in range(n_patients) for d in range(n_days) if requests[p][d] == 1 and skills[p][d] == 0]
+
+    # candidates in random order
+    for i in u.get_rng(rng).permutation(len(candidates)):
+        if len(to_be_increased) == n_increases:
+            break
+
+        patient, day = candidates[i]
+        increased_skills[patient][day] = 1
 
-    for i in range(n_increases):
-        increased = False
-
-        while not increased:
-            # pick a random patient
-            patient = np.random.choice(np.arange(n_patients))
-            # pick a random day
-            day = np.random.choice(np.arange(n_days))
-            if requests[patient][day] == 1 and skills[patient][day] == 0:
-                to_be_increased.append((patient, day))
-                increased = True
+        if reach is None or patient_reachable(reach, patient, requests[patient], increased_skills[patient], start_times[patient], end_times[patient]):
+            to_be_increased.append((patient, day))
+        else:
+            increased_skills[patient][day] = 0
+
+    if verbose and len(to_be_increased) < n_increases:
+        print(f"Only {len(to_be_increased)} visit skills can be increased")
     
     return to_be_increased
 
@@ -622,7 +711,8 @@ def generate_visits_from_care_plans(
     premium_perc=c.DEF_PREMIUM_PERC,
     premium=None,
     n_increases=c.DEF_N_INCREASES,
-    verbose=False
+    verbose=False,
+    rng=None
 ):
     if verbose:
         print(f"Generating visits from care plans")
@@ -630,7 +720,19 @@ def generate_visits_from_care_plans(
     n_patients = m.get_num_patients()
     n_days = m.get_num_days()
 
-    care_plans = generate_care_plans(uniform_cph, care_plan_hours_distr, care_plan_hours, uniform_premium, premium_perc, premium, verbose)
+    reach = operator_reach()
+
+    care_plans, repairs = generate_care_plans(
+        uniform_cph,
+        care_plan_hours_distr,
+        care_plan_hours,
+        uniform_premium,
+        premium_perc,
+        premium,
+        reach=reach,
+        verbose=verbose,
+        rng=rng
+    )
 
     requests = []
     skills = []
@@ -649,9 +751,10 @@ def generate_visits_from_care_plans(
         patient_skills = [r * premium for r in patient_requests]
         patient_start_times = [r * care_plan_times for r in patient_requests]
         
+        # durations in the order of the care plan days
         patient_end_times = []
+        duration_index = 0
         for i, r in enumerate(patient_requests):
-            duration_index = 0
             if r:
                 patient_end_times.append(patient_start_times[i] + care_plan_visit_durations[duration_index])
                 duration_index += 1
@@ -663,7 +766,7 @@ def generate_visits_from_care_plans(
         start_times.append(patient_start_times)
         end_times.append(patient_end_times)
 
-    to_be_increased = random_increase_skills(n_patients, n_days, requests, skills, n_increases, verbose)
+    to_be_increased = random_increase_skills(n_patients, n_days, requests, skills, n_increases, reach, start_times, end_times, verbose, rng)
 
     for patient, day in to_be_increased:
         skills[patient][day] = 1
@@ -675,10 +778,12 @@ def generate_visits_from_care_plans(
     for i, v in enumerate(c.VISIT_PARAMS):
         visit_data[v] = visit_values[i]
 
-    u.save_JSON(visit_data, c.VISIT_JSON)
+    sc.write(visit_data, c.VISIT_JSON)
 
     if verbose:
-        print(f"Generated visits")
+        print(f"Generated visits, {repairs} care plans repaired")
+
+    return repairs
 
 # --------------- END VISITS --------------- #
 
@@ -686,23 +791,20 @@ def generate_visits_from_care_plans(
 
 def check_feasibility(n_patients, verbose=False):
     feasible_patients = s.operator_feasible_patients()
-    feasible = True
+    no_operator = np.flatnonzero(np.array(feasible_patients, dtype=int).reshape(-1, n_patients).sum(axis=0) == 0)
 
-    for p in range(n_patients):
-        if sum([fp[p] for fp in feasible_patients]) == 0:
-            if verbose:
-                print(f"Patient {p} has no feasible operator")
-            feasible = False
-            break
+    if verbose and len(no_operator) > 0:
+        print(f"Patient {no_operator[0]} has no feasible operator")
     
-    return feasible, feasible_patients
+    return len(no_operator) == 0, feasible_patients
 
 
-def generate_previous_assignments(n_patients, n_operators, feasible_patients, ass_perc=c.DEF_ASS_PERC, verbose=False):
+def generate_previous_assignments(n_patients, n_operators, feasible_patients, ass_perc=c.DEF_ASS_PERC, verbose=False, rng=None):
+    rng = u.get_rng(rng)
     n_previous_assignments = int(ass_perc * n_patients)
 
     # choose ass_perc random indexes in range(n_patients)
-    ass_indexes = random.sample(range(n_patients), n_previous_assignments)
+    ass_indexes = rng.choice(n_patients, n_previous_assignments, replace=False).tolist()
 
     previous_assignments = []
     visit_skills = m.get_visit_param(c.VISIT_SKILL)
@@ -716,7 +818,7 @@ def generate_previous_assignments(n_patients, n_operators, feasible_patients, as
             
             chosen = False
             while not chosen:
-                random_index = random.choice(indexes)
+                random_index = indexes[rng.choice(len(indexes))]
                 max_skill = max(visit_skills[p])
                 if max_skill == op_skills[random_index] or max_skill < min([op_skills[i] for i in indexes]):
                     chosen = True
@@ -738,14 +840,17 @@ def write_assignments(feasible_patients, previous_assignments):
     ass_data[c.FEASIBLE_PATIENTS] = feasible_patients
     ass_data[c.PREV_ASS] = previous_assignments
 
-    u.save_JSON(ass_data, c.ASS_JSON)
+    sc.write(ass_data, c.ASS_JSON)
 
 # --------------- END PREVIOUS ASSIGNMENT --------------- #
 
 
-# --------------- TEST --------------- #
+# --------------- SCENARIO --------------- #
 
-def run_test(
+# instance generated in memory, drawing from rng (an np.random.Generator, the global numpy generator if None):
+# every stage reads the previous ones from the scenario returned, which starts from the files on disk only for
+# the stages not generated - nothing is written to disk unless the scenario is saved (save or save_compact)
+def generate_scenario(
     n_patients,
     n_operators,
     n_days=c.DEF_NUM_DAYS,
@@ -811,100 +916,256 @@ def run_test(
     # PREVIOIUS ASSIGNMENT
     gen_assignments=True,
     ass_perc=c.DEF_ASS_PERC,
+    max_unexecutable=c.DEF_MAX_UNEXECUTABLE,
+    rng=None,
     verbose=False
 ):
     if verbose:
-        print("Running test")
-
-    if gen_hyperparams:
-        generate_hyperparams(
-            Cw,
-            Cm,
-            Co,
-            Cx,
-            bigM,
-            sigma0,
-            sigma1,
-            omega,
-            n_days,
-            n_municipalities,
-            verbose
-        )
-
-    if gen_municipalities:
-        generate_municipalities(
-            n_municipalities,
-            min_time_dist,
-            max_time_dist,
-            municipalities,
-            verbose
-        )
+        print("Generating scenario")
+
+    generated = (gen_hyperparams, gen_municipalities, gen_patients, gen_operators, gen_visits, gen_assignments)
+    scenario = sc.memory_scenario(from_disk=not all(generated))
+
+    with sc.using(scenario):
+        if gen_hyperparams:
+            generate_hyperparams(
+                Cw,
+                Cm,
+                Co,
+                Cx,
+                bigM,
+                sigma0,
+                sigma1,
+                omega,
+                n_days,
+                n_municipalities,
+                verbose
+            )
 
-    if gen_patients:
-        generate_patients(
-            n_patients,
-            pat_uniform_mun,
-            pat_municipality_prob_distr,
-            pat_municipalities,
-            verbose
-        )
+        if gen_municipalities:
+            generate_municipalities(
+                n_municipalities,
+                min_time_dist,
+                max_time_dist,
+                municipalities,
+                verbose,
+                rng
+            )
 
-    if gen_operators:
-        generate_operators(
-            n_operators,
-            op_uniform_mun,
-            op_municipality_prob_distr,
-            op_municipalities,
-            op_uniform_skill,
-            op_skill_prob_distr,
-            op_skills,
-            op_uniform_time,
-            op_min_base_time,
-            op_max_base_time,
-            op_times,
-            op_max_time,
-            op_uniform_av,
-            op_av_perc,
-            op_availabilities,
-            op_uniform_st,
-            op_uniform_et,
-            op_time_pert,
-            op_start_time_pert_distr,
-            op_end_time_pert_distr,
-            op_start_times,
-            op_end_times,
-            verbose
-        )
+        if gen_patients:
+            generate_patients(
+                n_patients,
+                pat_uniform_mun,
+                pat_municipality_prob_distr,
+                pat_municipalities,
+                verbose,
+                rng
+            )
 
-    feasible = False
-    while not feasible:
-        if gen_visits:
-            generate_visits_from_care_plans(
-                uniform_cph,
-                care_plan_hours_distr,
-                care_plan_hours,
-                uniform_premium,
-                premium_perc,
-                premium,
-                n_increases,
-                verbose
+        if gen_operators:
+            generate_operators(
+                n_operators,
+                op_uniform_mun,
+                op_municipality_prob_distr,
+                op_municipalities,
+                op_uniform_skill,
+                op_skill_prob_distr,
+                op_skills,
+                op_uniform_time,
+                op_min_base_time,
+                op_max_base_time,
+                op_times,
+                op_max_time,
+                op_uniform_av,
+                op_av_perc,
+                op_availabilities,
+                op_uniform_st,
+                op_uniform_et,
+                op_time_pert,
+                op_start_time_pert_distr,
+                op_end_time_pert_distr,
+                op_start_times,
+                op_end_times,
+                verbose,
+                rng
             )
 
-        feasible, feasible_patients = check_feasibility(n_patients, verbose)
+        # generated visits have a feasible operator by construction: they are generated again only when too many
+        # of them cannot be executed
+        executable = False
+        while not executable:
+            if gen_visits:
+                generate_visits_from_care_plans(
+                    uniform_cph,
+                    care_plan_hours_distr,
+                    care_plan_hours,
+                    uniform_premium,
+                    premium_perc,
+                    premium,
+                    n_increases,
+                    verbose,
+                    rng
+                )
+
+            feasible, feasible_patients = check_feasibility(n_patients, verbose)
+
+            if not feasible:
+                raise Exception(f'Instance with patients with no feasible operator not valid')
+
+            # visits that cannot be executed only waste solver time
+            executable = not gen_visits or max_unexecutable is None or dg.diagnose(feasible_patients=feasible_patients, verbose=verbose)['unexecutable'] <= max_unexecutable
 
-        if not feasible:
             if verbose:
-                print("Infeasible instance, generating new visits")
-        else:
-            if verbose:
-                print("Feasible instance")
+                print("Feasible instance" if executable else "Too many visits that cannot be executed, generating new visits")
                 
-    if gen_assignments:
-        previous_assignments = generate_previous_assignments(n_patients, n_operators, feasible_patients, ass_perc, verbose)
+        if gen_assignments:
+            previous_assignments = generate_previous_assignments(n_patients, n_operators, feasible_patients, ass_perc, verbose, rng)
+
+            write_assignments(feasible_patients, previous_assignments)
 
-        write_assignments(feasible_patients, previous_assignments)
+    return scenario
 
-    obj, opt_gap, exec_time = p.run(verbose)
+# --------------- END SCENARIO --------------- #
+
+
+# --------------- TEST --------------- #
+
+def run_test(
+    n_patients,
+    n_operators,
+    n_days=c.DEF_NUM_DAYS,
+    n_municipalities=c.DEF_NUM_MUNICIPALITIES,
+    # HYPERPARAMS
+    gen_hyperparams=True,
+    Cw=c.DEF_C_WAGE,
+    Cm=c.DEF_C_MOVEMENT,
+    Co=c.DEF_C_OVERSKILL,
+    Cx=c.DEF_C_EXECUTION,
+    bigM=c.DEF_BIG_M,
+    sigma0=c.DEF_SIGMA0,
+    sigma1=c.DEF_SIGMA1,
+    omega=c.DEF_OMEGA,
+    # MUNICIPALITIES
+    gen_municipalities=True,
+    min_time_dist=c.DEF_MIN_DIST,
+    max_time_dist=c.DEF_MAX_DIST,
+    municipalities=None,
+    # PATIENTS
+    gen_patients=True, 
+    pat_uniform_mun=True,
+    pat_municipality_prob_distr=None,
+    pat_municipalities=None,
+    # OPERATORS
+    gen_operators=True,
+    # municipalities
+    op_uniform_mun=True,
+    op_municipality_prob_distr=None,
+    op_municipalities=None,
+    # skills
+    op_uniform_skill=True,
+    op_skill_prob_distr=c.DEF_SKILL_DISTR,
+    op_skills=None,
+    # time
+    op_uniform_time=True,
+    op_min_base_time=c.DEF_MIN_BASE_TIME,
+    op_max_base_time=c.DEF_MAX_BASE_TIME,
+    op_times=None,
+    # max time
+    op_max_time=c.DEF_MAX_TIME,
+    # availability
+    op_uniform_av=True,
+    op_av_perc=c.DEF_AV_PERC,
+    op_availabilities=None,
+    # start time and end time
+    op_uniform_st=True,
+    op_uniform_et=True,
+    op_time_pert=c.DEF_TIME_PERT,
+    op_start_time_pert_distr=c.DEF_START_TIME_PERT_DISTR,
+    op_end_time_pert_distr=c.DEF_END_TIME_PERT_DISTR,
+    op_start_times=None,
+    op_end_times=None,
+    # VISITS
+    gen_visits=True,
+    uniform_cph=True,
+    care_plan_hours_distr=c.DEF_CARE_PLAN_DISTR,
+    care_plan_hours=None,
+    uniform_premium=True,
+    premium_perc=c.DEF_PREMIUM_PERC,
+    premium=None,
+    n_increases=c.DEF_N_INCREASES,
+    # PREVIOIUS ASSIGNMENT
+    gen_assignments=True,
+    ass_perc=c.DEF_ASS_PERC,
+    verbose=False,
+    solver=c.DEF_SOLVER,
+    formulation=c.DEF_FORMULATION,
+    max_unexecutable=c.DEF_MAX_UNEXECUTABLE
+):
+    if verbose:
+        print("Running test")
+
+    scenario = generate_scenario(
+        n_patients=n_patients,
+        n_operators=n_operators,
+        n_days=n_days,
+        n_municipalities=n_municipalities,
+        gen_hyperparams=gen_hyperparams,
+        Cw=Cw,
+        Cm=Cm,
+        Co=Co,
+        Cx=Cx,
+        bigM=bigM,
+        sigma0=sigma0,
+        sigma1=sigma1,
+        omega=omega,
+        gen_municipalities=gen_municipalities,
+        min_time_dist=min_time_dist,
+        max_time_dist=max_time_dist,
+        municipalities=municipalities,
+        gen_patients=gen_patients,
+        pat_uniform_mun=pat_uniform_mun,
+        pat_municipality_prob_distr=pat_municipality_prob_distr,
+        pat_municipalities=pat_municipalities,
+        gen_operators=gen_operators,
+        op_uniform_mun=op_uniform_mun,
+        op_municipality_prob_distr=op_municipality_prob_distr,
+        op_municipalities=op_municipalities,
+        op_uniform_skill=op_uniform_skill,
+        op_skill_prob_distr=op_skill_prob_distr,
+        op_skills=op_skills,
+        op_uniform_time=op_uniform_time,
+        op_min_base_time=op_min_base_time,
+        op_max_base_time=op_max_base_time,
+        op_times=op_times,
+        op_max_time=op_max_time,
+        op_uniform_av=op_uniform_av,
+        op_av_perc=op_av_perc,
+        op_availabilities=op_availabilities,
+        op_uniform_st=op_uniform_st,
+        op_uniform_et=op_uniform_et,
+        op_time_pert=op_time_pert,
+        op_start_time_pert_distr=op_start_time_pert_distr,
+        op_end_time_pert_distr=op_end_time_pert_distr,
+        op_start_times=op_start_times,
+        op_end_times=op_end_times,
+        gen_visits=gen_visits,
+        uniform_cph=uniform_cph,
+        care_plan_hours_distr=care_plan_hours_distr,
+        care_plan_hours=care_plan_hours,
+        uniform_premium=uniform_premium,
+        premium_perc=premium_perc,
+        premium=premium,
+        n_increases=n_increases,
+        gen_assignments=gen_assignments,
+        ass_perc=ass_perc,
+        max_unexecutable=max_unexecutable,
+        verbose=verbose
+    )
+
+    # the solvers read the instance from the files
+    scenario.save()
+
+    obj, opt_gap, exec_time = p.run(verbose, solver=solver, formulation=formulation)
 
     return obj, opt_gap, exec_time
 
@@ -1176,7 +1437,10 @@ def execute_test(
     # report
     archive_folder=c.DEF_ARCHIVE_FOLDER,
     file_name=c.OP_STATS_CSV,
-    verbose=False
+    verbose=False,
+    solver=c.DEF_SOLVER,
+    formulation=c.DEF_FORMULATION,
+    max_unexecutable=c.DEF_MAX_UNEXECUTABLE
 ):
     if verbose:
         print("Executing test")
@@ -1249,14 +1513,17 @@ def execute_test(
             # PREVIOIUS ASSIGNMENT
             gen_assignments,
             ass_perc,
-            verbose
+            verbose,
+            solver=solver,
+            formulation=formulation,
+            max_unexecutable=max_unexecutable
         )
 
     # archive all JSONs in archive_folder
     for j in c.INPUT_JSON_PATHS:
         u.archive_file(j, archive_folder)
     
-    u.archive_file(c.OUTPUT_JSON, archive_folder)
+    u.archive_file(c.OUTPUT_NPZ, archive_folder)
     u.archive_file(c.SETUP_FILE, archive_folder)
 
     mean_row, total_row = report_stats(archive_folder=archive_folder, file_name=file_name, verbose=verbose)
@@ -1268,6 +1535,21 @@ def execute_test(
     return mean_row, total_row, obj, opt_gap, exec_time
 
 
+# execute_test in a workspace of its own (see workspace.py), as done by the processes of execute_batch_tests:
+# the processes are forked with the same random state, so every test reseeds its generators
+def execute_test_in_workspace(name, args, kwargs, threads=None, keep=False):
+    random.seed()
+    np.random.seed()
+
+    path = ws.create(name, threads)
+    try:
+        with ws.inside(path):
+            return execute_test(*args, **kwargs)
+    finally:
+        if not keep:
+            ws.remove(path)
+
+
 def execute_batch_tests(
     n_tests,
     n_patients,
@@ -1340,7 +1622,13 @@ def execute_batch_tests(
     file_name=c.OP_STATS_CSV,
     # summary
     summary_file_name=c.SUMMARY_CSV,
-    verbose=False
+    verbose=False,
+    solver=c.DEF_SOLVER,
+    formulation=c.DEF_FORMULATION,
+    max_unexecutable=c.DEF_MAX_UNEXECUTABLE,
+    # tests run at once, each in its own workspace, sharing cores (all of them if None)
+    max_workers=1,
+    cores=None
 ):
     archive_folder_path = c.ARCHIVE_FOLDER + archive_folder
     total_obj = []
@@ -1353,83 +1641,102 @@ def execute_batch_tests(
     if verbose:
         print(f"Executing tests for {archive_folder}")
 
-    for test in range(n_tests):
-        if verbose:
-            print(f"Executing test {test+1} of {n_tests}")
+    args = (
+        n_patients,
+        n_operators,
+        n_days,
+        n_municipalities,
+        # HYPERPARAMS
+        gen_hyperparams,
+        Cw,
+        Cm,
+        Co,
+        Cx,
+        bigM,
+        sigma0,
+        sigma1,
+        omega,
+        # MUNICIPALITIES
+        gen_municipalities,
+        min_time_dist,
+        max_time_dist,
+        municipalities,
+        # PATIENTS
+        gen_patients, 
+        pat_uniform_mun,
+        pat_municipality_prob_distr,
+        pat_municipalities,
+        # OPERATORS
+        gen_operators,
+        # municipalities
+        op_uniform_mun,
+        op_municipality_prob_distr,
+        op_municipalities,
+        # skills
+        op_uniform_skill,
+        op_skill_prob_distr,
+        op_skills,
+        # time
+        op_uniform_time,
+        op_min_base_time,
+        op_max_base_time,
+        op_times,
+        # max time
+        op_max_time,
+        # availability
+        op_uniform_av,
+        op_av_perc,
+        op_availabilities,
+        # start time and end time
+        op_uniform_st,
+        op_uniform_et,
+        op_time_pert,
+        op_start_time_pert_distr,
+        op_end_time_pert_distr,
+        op_start_times,
+        op_end_times,
+        # VISITS
+        gen_visits,
+        uniform_cph,
+        care_plan_hours_distr,
+        care_plan_hours,
+        uniform_premium,
+        premium_perc,
+        premium,
+        n_increases,
+        # PREVIOIUS ASSIGNMENT
+        gen_assignments,
+        ass_perc
+    )
+
+    def test_kwargs(test):
+        return {
+            'archive_folder': archive_folder + f"{test}/",
+            'file_name': file_name,
+            'verbose': verbose,
+            'solver': solver,
+            'formulation': formulation,
+            'max_unexecutable': max_unexecutable
+        }
+
+    if max_workers > 1:
+        if cores is None:
+            cores = os.cpu_count()
+        threads = max(1, cores // max_workers)
+
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(execute_test_in_workspace, archive_folder + f"{test}", args, test_kwargs(test), threads)
+                       for test in range(n_tests)]
+            results = [future.result() for future in futures]
 
-        test_archive_folder = archive_folder + f"{test}/"
+    for test in range(n_tests):
+        if max_workers > 1:
+            mean_row, total_row, obj, opt_gap, exec_time = results[test]
+        else:
+            if verbose:
+                print(f"Executing test {test+1} of {n_tests}")
 
-        mean_row, total_row, obj, opt_gap, exec_time = execute_test(
-            n_patients,
-            n_operators,
-            n_days,
-            n_municipalities,
-            # HYPERPARAMS
-            gen_hyperparams,
-            Cw,
-            Cm,
-            Co,
-            Cx,
-            bigM,
-            sigma0,
-            sigma1,
-            omega,
-            # MUNICIPALITIES
-            gen_municipalities,
-            min_time_dist,
-            max_time_dist,
-            municipalities,
-            # PATIENTS
-            gen_patients, 
-            pat_uniform_mun,
-            pat_municipality_prob_distr,
-            pat_municipalities,
-            # OPERATORS
-            gen_operators,
-            # municipalities
-            op_uniform_mun,
-            op_municipality_prob_distr,
-            op_municipalities,
-            # skills
-            op_uniform_skill,
-            op_skill_prob_distr,
-            op_skills,
-            # time
-            op_uniform_time,
-            op_min_base_time,
-            op_max_base_time,
-            op_times,
-            # max time
-            op_max_time,
-            # availability
-            op_uniform_av,
-            op_av_perc,
-            op_availabilities,
-            # start time and end time
-            op_uniform_st,
-            op_uniform_et,
-            op_time_pert,
-            op_start_time_pert_distr,
-            op_end_time_pert_distr,
-            op_start_times,
-            op_end_times,
-            # VISITS
-            gen_visits,
-            uniform_cph,
-            care_plan_hours_distr,
-            care_plan_hours,
-            uniform_premium,
-            premium_perc,
-            premium,
-            n_increases,
-            # PREVIOIUS ASSIGNMENT
-            gen_assignments,
-            ass_perc,
-            # report
-            test_archive_folder,
-            file_name,
-            verbose
-        )
+            mean_row, total_row, obj, opt_gap, exec_time = execute_test(*args, **test_kwargs(test))
 
         if mean_row is False:
             total_no_solutions += 1
@@ -12,11 +12,22 @@ def get_time_units():
     return (c.DEF_PAT_END_TIME - c.DEF_PAT_START_TIME) // c.TIME_UNIT
 
 
+# number of times each JSON has been saved by this process
+JSON_WRITES = {}
+
+
 # save a JSON to a location
 def save_JSON(data, file_name):
     # save it in a .json file
     with open(file_name, 'w') as f:
         json.dump(data, f, indent=4)
+
+    path = os.path.abspath(file_name)
+    JSON_WRITES[path] = JSON_WRITES.get(path, 0) + 1
+
+
+def json_writes(file_name):
+    return JSON_WRITES.get(os.path.abspath(file_name), 0)
     
 
 # retrieve a JSON from a location - if it does not exist, create it
@@ -61,12 +72,8 @@ def merge_JSON_files(json_paths):
     return merged_json
 
 
-# generate commuting matrix
-def generate_commuting_matrix():
-    municipality_data = retrieve_JSON(c.MUNICIPALITY_JSON)
-    lats = municipality_data[c.MUN_LATITUDE]
-    lons = municipality_data[c.MUN_LONGITUDE]
-
+# compute commuting matrix from municipality coordinates
+def compute_commuting_matrix(lats, lons):
     # generate matrix with euclidean distances
     dm = distance_matrix(np.array([lats, lons]).T, np.array([lats, lons]).T)
 
@@ -76,8 +83,26 @@ def generate_commuting_matrix():
     # add intra-municipality time to diagonal
     np.fill_diagonal(dm, dm.diagonal() + c.INTRA_MUN_TIME)
 
-    json_to_save = {"commutingTime": dm.tolist()}
-    save_JSON(json_to_save, c.COMM_JSON)
+    return dm.tolist()
+
+
+# generate commuting matrix
+def generate_commuting_matrix():
+    # through the scenario in use, if any (imported here: src.scenario imports this module)
+    import src.scenario as sc
+
+    municipality_data = sc.load_scenario().data(c.MUNICIPALITY_JSON)
+    lats = municipality_data[c.MUN_LATITUDE]
+    lons = municipality_data[c.MUN_LONGITUDE]
+
+    json_to_save = {c.COMM_TIME: compute_commuting_matrix(lats, lons)}
+    sc.write(json_to_save, c.COMM_JSON)
+
+
+# random generator of the instance generation: an np.random.Generator, or the global numpy one (seeded by
+# np.random.seed) if None - the module functions have the same interface
+def get_rng(rng=None):
+    return np.random if rng is None else rng
 
 
 # useful for visit generation
@@ -0,0 +1,99 @@
+import os
+import re
+import shutil
+import contextlib
+
+import src.constants as c
+import src.scenario as sc
+import src.solution as sl
+
+
+# every path in constants.py is relative to the working directory: a workspace is a folder with its own data
+# and model folders (inputs, .dat files, solver output and log), linking the shared archive, cache and sources,
+# so a process working inside it runs a test without touching the files of the others
+
+def workspace_path(name, workspace_folder=c.WORKSPACE_FOLDER):
+    return os.path.join(os.path.abspath(workspace_folder), re.sub(r'[^\w.-]+', '-', name).strip('-'))
+
+
+# CPLEX uses all the cores unless told otherwise: the .ops file sets it for the project run, the execute SETTINGS
+# block of the .mod files run alone (without the .ops file)
+def set_threads(ops_file, threads):
+    with open(ops_file, 'r') as file:
+        settings = file.read()
+
+    settings = re.sub(r'\s*<setting name="threads" value="[^"]*"/>', '', settings)
+    settings = settings.replace('<category name="cplex">', f'<category name="cplex">\n    <setting name="threads" value="{threads}"/>', 1)
+
+    with open(ops_file, 'w') as file:
+        file.write(settings)
+
+
+def set_mod_threads(mod_file, threads):
+    with open(mod_file, 'r') as file:
+        model = file.read()
+
+    model = re.sub(r'\n\s*cplex\.threads = [^;]*;', '', model)
+    model = model.replace('execute SETTINGS {', f'execute SETTINGS {{\n\tcplex.threads = {threads};', 1)
+
+    with open(mod_file, 'w') as file:
+        file.write(model)
+
+
+# thread budget of the working directory (set by create), None if unlimited
+def get_threads(ops_file=c.OPS_FILE):
+    if not os.path.exists(ops_file):
+        return None
+
+    with open(ops_file, 'r') as file:
+        match = re.search(r'<setting name="threads" value="([^"]*)"/>', file.read())
+
+    return int(float(match.group(1))) if match is not None else None
+
+
+def create(name, threads=None, base=None, workspace_folder=c.WORKSPACE_FOLDER):
+    base = os.path.abspath(base if base is not None else os.getcwd())
+    path = workspace_path(name, workspace_folder)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+
+    for folder in [c.DATA_FOLDER, c.MODEL_FOLDER]:
+        if os.path.exists(os.path.join(base, folder)):
+            shutil.copytree(os.path.join(base, folder), os.path.join(path, folder), symlinks=True)
+        else:
+            os.makedirs(os.path.join(path, folder))
+
+    for folder in [c.ARCHIVE_FOLDER, c.CACHE_FOLDER, c.SRC_FOLDER]:
+        if not os.path.exists(os.path.join(base, folder)):
+            os.makedirs(os.path.join(base, folder))
+        os.symlink(os.path.join(base, folder), os.path.join(path, folder.rstrip('/')))
+
+    if threads is not None:
+        if os.path.exists(os.path.join(path, c.OPS_FILE)):
+            set_threads(os.path.join(path, c.OPS_FILE), threads)
+        for mod_file in [c.COMPACT_MOD_FILE, c.ARCS_MOD_FILE]:
+            if os.path.exists(os.path.join(path, mod_file)):
+                set_mod_threads(os.path.join(path, mod_file), threads)
+
+    return path
+
+
+def remove(path):
+    if os.path.exists(path):
+        shutil.rmtree(path)
+
+
+# works inside path: the scenarios and solutions read so far belong to the previous folder
+@contextlib.contextmanager
+def inside(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    sc.clear_cache()
+    sl.clear_cache()
+    try:
+        yield path
+    finally:
+        os.chdir(previous)
+        sc.clear_cache()
+        sl.clear_cache()
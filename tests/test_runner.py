@@ -0,0 +1,35 @@
+import time
+
+import src.runner as rn
+
+
+def test_deadline_stops_command(tmp_path):
+    result = rn.run(['sleep', '3'], str(tmp_path / 'output.txt'), deadline=1)
+
+    assert result['stopped'] == 'deadline'
+    assert result['exec_time'] < 3
+
+
+def test_output_appended(tmp_path):
+    output_file = tmp_path / 'output.txt'
+    output_file.write_text('previous\n')
+    result = rn.run(['sh', '-c', 'echo done'], str(output_file))
+
+    assert result['returncode'] == 0
+    assert result['stopped'] is None
+    assert output_file.read_text() == 'previous\ndone\n'
+
+
+# a bound still running when the command ends is not waited for
+def test_lower_bound_not_waited(tmp_path):
+    start_time = time.time()
+    result = rn.run(['sh', '-c', 'sleep 1'], str(tmp_path / 'output.txt'), lower_bound=lambda: time.sleep(30))
+
+    assert result['lower_bound'] is None
+    assert time.time() - start_time < 10
+
+
+def test_lower_bound_received(tmp_path):
+    result = rn.run(['sh', '-c', 'sleep 1'], str(tmp_path / 'output.txt'), lower_bound=lambda: 42.0)
+
+    assert result['lower_bound'] == 42.0
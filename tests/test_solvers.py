@@ -0,0 +1,151 @@
+import json
+
+import numpy as np
+import pytest
+
+import src.constants as c
+import src.scenario as sc
+import src.solver as so
+import src.heuristic as hr
+import src.decomposition as dc
+import src.column_generation as cg
+import src.bounds as bd
+import src.testing as t
+
+
+# archived instance whose (int-rounded) commuting times break the triangle inequality
+TRIANGLE_VIOLATING = 'sim-data/60-8-4-0-10/0/'
+
+
+def archived_scenario(folder):
+    files = {path: json.load(open(folder + path.split('/')[-1])) for path in c.INPUT_JSON_PATHS}
+    return sc.memory_scenario(files)
+
+
+# violated constraints of new_hcp.mod in a solver output, with the visits of every operator-day in start time order
+def violations(inst, output):
+    P, O, D = inst['P'], inst['O'], inst['D']
+    ct, pat_mun, op_mun = inst['commuting_time'], inst['pat_mun'], inst['op_mun']
+    start, end = inst['start'], inst['end']
+    assignment = np.array(output[c.ASSIGNMENT])
+    execution = np.array(output[c.VISIT_EXEC])
+
+    found = []
+    if not (assignment.sum(axis=1) == 1).all() or (assignment > inst['feasible'].T).any():
+        found.append('assignment')
+    if (execution > assignment.T[:, :, None] * inst['request'][None, :, :]).any():
+        found.append('execution')
+    if ((execution * (end - start)[None, :, :]).sum(axis=(1, 2)) > inst['op_max_time']).any():
+        found.append('max workload')
+
+    for o in range(O):
+        for d in range(D):
+            chain = sorted(np.flatnonzero(execution[o, :, d]), key=lambda p: start[p, d])
+            if len(chain) == 0:
+                continue
+
+            # visitStartConstraint indexes the commuting time with patientMunicipality[o], as in the .mod
+            if inst['op_start'][o, d] + ct[op_mun[o], pat_mun[min(o, P - 1)]] > start[chain[0], d]:
+                found.append(f'home to {chain[0]} (operator {o}, day {d})')
+            for a, b in zip(chain, chain[1:]):
+                if end[a, d] + ct[pat_mun[a], pat_mun[b]] > start[b, d]:
+                    found.append(f'{a} to {b} (operator {o}, day {d})')
+            if end[chain[-1], d] + ct[pat_mun[chain[-1]], op_mun[o]] > inst['op_end'][o, d]:
+                found.append(f'{chain[-1]} to home (operator {o}, day {d})')
+
+    return found
+
+
+# objective of new_hcp.mod for the visits executed in a solver output, with the travel of the chains in start time order
+# (between different municipalities only, as in the .mod)
+def objective(inst, output):
+    ct, pat_mun, start, end = inst['commuting_time'], inst['pat_mun'], inst['start'], inst['end']
+    execution = np.array(output[c.VISIT_EXEC])
+
+    travel = 0
+    for o in range(inst['O']):
+        for d in range(inst['D']):
+            chain = sorted(np.flatnonzero(execution[o, :, d]), key=lambda p: start[p, d])
+            travel += sum(ct[pat_mun[a], pat_mun[b]] for a, b in zip(chain, chain[1:]) if pat_mun[a] != pat_mun[b])
+
+    workload = (execution * (end - start)[None, :, :]).sum(axis=(1, 2))
+    overtime = np.maximum(0, workload - inst['op_time'])
+    wage = inst[c.C_WAGE] * (inst[c.SIGMA0] + inst['op_skill'] * inst[c.SIGMA1])
+    overskill = (execution * (inst['skill'][None, :, :] < inst['op_skill'][:, None, None])).sum()
+
+    return (inst[c.C_MOVEMENT] * travel + (wage * (workload + inst[c.OMEGA] * overtime)).sum() +
+            inst[c.C_EXECUTION] * (inst['request'].sum() - execution.sum()) + inst[c.C_OVERSKILL] * overskill)
+
+
+def check(scenario, output):
+    inst = so.load_instance(scenario)
+    assert violations(inst, output) == []
+    assert output[c.OBJECTIVE] == pytest.approx(objective(inst, output), abs=0.01)
+    assert bd.lower_bound(scenario, time_limit=30) <= output[c.OBJECTIVE] + 1e-6
+
+
+@pytest.fixture(scope='module')
+def small_scenario():
+    return t.generate_scenario(12, 3, rng=np.random.default_rng(0))
+
+
+def test_highs(small_scenario):
+    check(small_scenario, so.solve(small_scenario, time_limit=30))
+
+
+# both formulations are exact: same optimum, with or without the triangle inequality
+def test_highs_compact(small_scenario):
+    compact = so.solve(small_scenario, time_limit=60, mip_gap=0, formulation=c.COMPACT_FORMULATION)
+    check(small_scenario, compact)
+    assert compact[c.OBJECTIVE] == pytest.approx(so.solve(small_scenario, time_limit=60, mip_gap=0)[c.OBJECTIVE])
+
+
+def test_heuristic(small_scenario):
+    check(small_scenario, hr.solve(small_scenario, time_limit=2, seed=0))
+
+
+def test_heuristic_no_feasible_operator(small_scenario):
+    inst = so.load_instance(small_scenario)
+    inst['feasible'] = inst['feasible'].copy()
+    inst['feasible'][:, 0] = 0
+    with pytest.raises(ValueError):
+        hr.prepare(inst)
+
+
+def test_decomposition(small_scenario):
+    check(small_scenario, dc.solve(small_scenario, time_limit=20, workers=1))
+
+
+def test_column_generation(small_scenario):
+    check(small_scenario, cg.solve(small_scenario, time_limit=20))
+
+
+# the master rows do not exclude the infeasible chains there: the routes must be checked
+def test_decomposition_triangle_violating():
+    scenario = archived_scenario(TRIANGLE_VIOLATING)
+    assert not so.triangle_inequality(so.load_instance(scenario)['commuting_time'])
+
+    check(scenario, dc.solve(scenario, time_limit=20, workers=1))
+
+
+def test_heuristic_triangle_violating():
+    scenario = archived_scenario(TRIANGLE_VIOLATING)
+    check(scenario, hr.solve(scenario, time_limit=5, seed=0))
+
+
+def test_column_generation_triangle_violating():
+    scenario = archived_scenario(TRIANGLE_VIOLATING)
+    check(scenario, cg.solve(scenario, time_limit=20))
+
+
+# both bounds below the proven optimum, lower_bound the best of them
+def test_bounds(small_scenario):
+    inst = so.load_instance(small_scenario)
+    matching = bd.matching_bound(inst)
+    relaxation = bd.lp_bound(inst)
+    optimum = so.solve(small_scenario, time_limit=60, mip_gap=0)
+
+    assert optimum[c.OPTIMALITY_GAP] <= 1e-6
+    assert matching <= optimum[c.OBJECTIVE] + 1e-6
+    assert relaxation <= optimum[c.OBJECTIVE] + 1e-6
+    assert bd.lower_bound(small_scenario) == pytest.approx(max(matching, relaxation))